@@ -0,0 +1,215 @@
+"""
+Benchmarks for complex tracking: EulerTour, EulerTourIndex and rete_nodes.Complex.
+
+Workloads (nodes are integers, edges are (node1,'a','b',node2) tuples):
+    tree        random recursive tree, then cut an edge and relink the detached subtree elsewhere
+    cyclic      random graph with 2n edges, then cut an edge and link a new random pair
+    polymer     chain growth by end-to-end links, then fragmentation by random cuts
+    lattice     square lattice formed by links in random order, then fragmentation by random cuts
+
+Backends:
+    incremental   create_new_tour_from_node and auglink for the initial structure
+    bulk          build_from_graph for the initial structure
+    add_only      EulerTourIndex in add-only (union-find) mode throughout
+    complex       tokens sent to a rete_nodes.Complex node
+
+Each run reports operations per second for the build and update phases,
+and peak traced memory if --memory is given (tracemalloc slows runs down).
+
+    python benchmarks/benchmark_euler_tour.py --sizes 1000 10000 100000
+    python benchmarks/benchmark_euler_tour.py --sizes 1000000 --workloads tree polymer --backends bulk add_only
+    python benchmarks/benchmark_euler_tour.py --json new.json --compare old.json
+"""
+from wc_rules.euler_tour import EulerTourIndex
+from wc_rules.rete_nodes import Complex
+from wc_rules.rete_token import AddToken, RemoveToken
+from time import perf_counter
+import argparse
+import json
+import random
+import tracemalloc
+
+WORKLOADS = ('tree','cyclic','polymer','lattice')
+BACKENDS = ('incremental','bulk','add_only','complex')
+
+def edge(u,v):
+    return (u,'a','b',v)
+
+###### Workloads ######
+# each returns (nodes, initial edges, list of ('link'|'cut',edge) updates)
+
+def tree_workload(n,rnd):
+    parent = [None] + [rnd.randrange(i) for i in range(1,n)]
+    initial = [edge(parent[i],i) for i in range(1,n)]
+    updates = []
+    for k in range(n):
+        # parent[i] < i always, so relinking keeps a tree
+        i = rnd.randrange(1,n)
+        updates.append(('cut',edge(parent[i],i)))
+        parent[i] = rnd.randrange(i)
+        updates.append(('link',edge(parent[i],i)))
+    return list(range(n)),initial,updates
+
+def cyclic_workload(n,rnd):
+    edges = set()
+    while len(edges) < 2*n:
+        u,v = rnd.sample(range(n),2)
+        edges.add(edge(min(u,v),max(u,v)))
+    initial = sorted(edges)
+    current = list(initial)
+    updates = []
+    for k in range(n):
+        i = rnd.randrange(len(current))
+        current[i],current[-1] = current[-1],current[i]
+        e = current.pop()
+        edges.remove(e)
+        updates.append(('cut',e))
+        while True:
+            u,v = rnd.sample(range(n),2)
+            e = edge(min(u,v),max(u,v))
+            if e not in edges:
+                break
+        edges.add(e)
+        current.append(e)
+        updates.append(('link',e))
+    return list(range(n)),initial,updates
+
+def polymer_workload(n,rnd):
+    bonds = [edge(i,i+1) for i in range(n-1)]
+    updates = [('link',e) for e in bonds]
+    rnd.shuffle(bonds)
+    updates.extend(('cut',e) for e in bonds)
+    return list(range(n)),[],updates
+
+def lattice_workload(n,rnd):
+    side = max(2,int(round(n**0.5)))
+    bonds = []
+    for i in range(side):
+        for j in range(side):
+            k = i*side + j
+            if j < side-1:
+                bonds.append(edge(k,k+1))
+            if i < side-1:
+                bonds.append(edge(k,k+side))
+    rnd.shuffle(bonds)
+    updates = [('link',e) for e in bonds]
+    rnd.shuffle(bonds)
+    updates.extend(('cut',e) for e in bonds)
+    return list(range(side*side)),[],updates
+
+WORKLOAD_BUILDERS = dict(tree=tree_workload,cyclic=cyclic_workload,polymer=polymer_workload,lattice=lattice_workload)
+
+###### Backends ######
+# each returns (build, update, count) functions closed over a fresh structure
+
+def index_backend(name):
+    ind = EulerTourIndex()
+    if name=='add_only':
+        ind.set_add_only()
+    def build(nodes,edges):
+        if name=='bulk':
+            ind.build_from_graph(nodes,edges)
+            return
+        for node in nodes:
+            ind.create_new_tour_from_node(node)
+        for e in edges:
+            ind.auglink(e)
+    def update(updates):
+        for op,e in updates:
+            if op=='link':
+                ind.auglink(e)
+            else:
+                ind.augcut(e)
+    return build,update,ind.count_complexes
+
+def complex_backend():
+    node = Complex()
+    def build(nodes,edges):
+        for x in nodes:
+            node.receive_token(AddToken({'node':x}),None)
+        update([('link',e) for e in edges])
+    def update(updates):
+        keys = ['node1','attr1','attr2','node2']
+        for op,e in updates:
+            _class = AddToken if op=='link' else RemoveToken
+            node.receive_token(_class(dict(zip(keys,e))),None)
+    return build,update,node.count_complexes
+
+def make_backend(name):
+    if name=='complex':
+        return complex_backend()
+    return index_backend(name)
+
+###### Running ######
+def run(workload,n,backend,seed=0,memory=False):
+    rnd = random.Random(seed)
+    nodes,initial,updates = WORKLOAD_BUILDERS[workload](n,rnd)
+    build,update,count = make_backend(backend)
+    if memory:
+        tracemalloc.start()
+    start = perf_counter()
+    build(nodes,initial)
+    middle = perf_counter()
+    update(updates)
+    end = perf_counter()
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    build_ops = len(nodes) + len(initial)
+    return dict(
+        workload=workload,n=len(nodes),backend=backend,
+        build_ops=build_ops,build_seconds=middle-start,
+        update_ops=len(updates),update_seconds=end-middle,
+        build_ops_per_second=build_ops/max(middle-start,1e-9),
+        update_ops_per_second=len(updates)/max(end-middle,1e-9),
+        peak_memory=peak,complexes=count(),
+        )
+
+def key(result):
+    return '{workload}/{n}/{backend}'.format(**result)
+
+def format_result(result,baseline=None):
+    strs = ['{:<8} {:>8} {:<12}'.format(result['workload'],result['n'],result['backend'])]
+    strs.append('build {:>12,.0f} ops/s'.format(result['build_ops_per_second']))
+    strs.append('update {:>12,.0f} ops/s'.format(result['update_ops_per_second']))
+    if result['peak_memory'] is not None:
+        strs.append('peak {:>8.1f} MB'.format(result['peak_memory']/2**20))
+    if baseline is not None:
+        strs.append('update x{:.2f} vs baseline'.format(result['update_ops_per_second']/baseline['update_ops_per_second']))
+    return '  '.join(strs)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks for Euler tours and complex tracking.')
+    parser.add_argument('--sizes',type=int,nargs='+',default=[1000,10000])
+    parser.add_argument('--workloads',nargs='+',choices=WORKLOADS,default=list(WORKLOADS))
+    parser.add_argument('--backends',nargs='+',choices=BACKENDS,default=list(BACKENDS))
+    parser.add_argument('--seed',type=int,default=0)
+    parser.add_argument('--memory',action='store_true',help='trace peak memory')
+    parser.add_argument('--json',help='write results to this file')
+    parser.add_argument('--compare',help='compare with results written earlier with --json')
+    args = parser.parse_args()
+
+    baseline = dict()
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = {key(x):x for x in json.load(file)}
+
+    results = []
+    for workload in args.workloads:
+        for n in args.sizes:
+            counts = set()
+            for backend in args.backends:
+                result = run(workload,n,backend,args.seed,args.memory)
+                results.append(result)
+                counts.add(result['complexes'])
+                print(format_result(result,baseline.get(key(result))),flush=True)
+            # every backend must end with the same complexes
+            assert len(counts)==1, 'Backends disagree on the number of complexes!'
+
+    if args.json:
+        with open(args.json,'w') as file:
+            json.dump(results,file,indent=1)
+
+if __name__ == '__main__':
+    main()
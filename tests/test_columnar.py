@@ -0,0 +1,180 @@
+from wc_rules.indexer import Slicer, BitSlicer, NumericIndexer, KeyUniverse, MISSING
+from wc_rules.columnar import MaskSlicer, NumericColumnarIndexer, BooleanColumnarIndexer
+from wc_rules import utils
+import numpy as np
+import json
+import pickle
+import unittest
+
+class TestColumnar(unittest.TestCase):
+
+    def test_key_universe(self):
+        U = KeyUniverse(['a','b'])
+        self.assertTrue(len(U)==2 and 'a' in U and 'c' not in U)
+        self.assertTrue(U.index('c')==2 and U.index('a')==0)
+        self.assertTrue(U.keys_at([2,1])==['c','b'])
+
+    def test_mask_slicer(self):
+        U = KeyUniverse(['a','b','c','d'])
+        x1 = MaskSlicer(U).add_keys(['a','b','c'])
+        x2 = MaskSlicer(U).add_keys(['b','c','d'])
+        self.assertTrue(isinstance(x1,Slicer))
+        self.assertTrue(x1['a'] and not x1['d'] and not x1['e'])
+        self.assertTrue(sorted(x1 & x2)==['b','c'])
+        self.assertTrue(sorted(x1 | x2)==['a','b','c','d'])
+
+        # positive & negative, as for Slicer
+        x = x1 & ~x2
+        self.assertTrue(not x.default and sorted(x)==['a'])
+        x = x1 | ~x2
+        self.assertTrue(x.default and sorted(x)==['d'])
+        x = ~x1 & ~x2
+        self.assertTrue(x.default and sorted(x)==['a','b','c','d'])
+        self.assertTrue(x['e'])
+
+        # with dict-based slicers, on either side
+        s = Slicer().add_keys(['a','e'])
+        for x in [x1 & s, s & x1]:
+            self.assertTrue(isinstance(x,MaskSlicer) and sorted(x)==['a'])
+        x = ~s | x2
+        self.assertTrue(x.default and sorted(x)==['a','e'])
+        # which leaves keys outside the universe out of it
+        self.assertEqual(len(U),4)
+
+        x1.update({'a':False,'d':True})
+        self.assertTrue(sorted(x1)==['b','c','d'])
+
+        # dict behavior, as for a Slicer with the same keys
+        x = MaskSlicer(U).add_keys(['a','c'])
+        self.assertEqual(x,Slicer().add_keys(['a','c']))
+        self.assertEqual(Slicer().add_keys(['a','c']),x)
+        self.assertNotEqual(x,Slicer().add_keys(['a']))
+        self.assertEqual(x,MaskSlicer(U).add_keys(['c','a']))
+        self.assertEqual(repr(x),repr(Slicer().add_keys(['a','c'])))
+        self.assertEqual(sorted(x.items()),[('a',True),('c',True)])
+        self.assertEqual(list((~x).values()),[False,False])
+        self.assertTrue(x and not MaskSlicer(U))
+        y = x.copy()
+        y.add_keys(['b'])
+        self.assertTrue(isinstance(y,MaskSlicer) and sorted(x)==['a','c'])
+
+        # json and pickle
+        self.assertEqual(json.loads(json.dumps(x)),dict(a=True,c=True))
+        y = pickle.loads(pickle.dumps(x))
+        self.assertTrue(isinstance(y,MaskSlicer) and sorted(y)==['a','c'])
+
+    def test_columnar_indexer(self):
+        I = NumericColumnarIndexer().update(dict(a=1,b=2,c=3))
+        self.assertTrue(len(I)==3 and 'a' in I and 'd' not in I)
+        self.assertTrue(I['b']==2 and I.to_dict()==dict(a=1,b=2,c=3))
+        self.assertTrue(sorted(I.last_updated)==['a','b','c'])
+        I.flush()
+
+        I.update(dict(a=1,b=5))
+        self.assertTrue(sorted(I.last_updated)==['b'])
+        I.remove(['c','d'])
+        self.assertTrue(len(I)==2 and 'c' not in I)
+        self.assertTrue(sorted(I.last_updated)==['b','c'])
+        with self.assertRaises(KeyError):
+            I['c']
+        with self.assertRaises(utils.IndexerError):
+            I.update({'x':'y'})
+
+        B = BooleanColumnarIndexer().update(dict(a=True,b=False))
+        self.assertTrue(sorted(B==True)==['a'])
+        with self.assertRaises(utils.IndexerError):
+            B.update({'x':1})
+
+    def test_columnar_comparisons(self):
+        U = KeyUniverse()
+        I1 = NumericColumnarIndexer(universe=U).update(dict(a=1,b=2,c=3,d=4))
+        I2 = NumericColumnarIndexer(universe=U).update(dict(a=1,b=1,c=2,d=5,e=0))
+
+        self.assertTrue(sorted(I1==3)==['c'])
+        self.assertTrue(sorted(I1==[1,2])==['a','b'])
+        x = I1!=[1,2]
+        self.assertTrue(x.default and x['c'] and x['e'] and not x['a'])
+        self.assertTrue(sorted(I1 > 2)==['c','d'])
+        self.assertTrue(sorted(I1 <= 2)==['a','b'])
+        self.assertTrue(sorted(I1.slice(lambda x: x%2==0))==['b','d'])
+        self.assertTrue(sorted(I1==I2)==['a'])
+        self.assertTrue(sorted(I1 < I2)==['d'])
+        self.assertTrue(sorted(I1 >= I2)==['a','b','c'])
+
+        # with a dict-based indexer
+        I3 = NumericIndexer().update(dict(a=1,b=1,c=2,d=5))
+        self.assertTrue(sorted(I1 > I3)==['b','c'])
+
+        # subsetting both kinds of indexers
+        J = I2[(I1 > 1) & (I2 < 5)]
+        self.assertTrue(isinstance(J,NumericColumnarIndexer) and J.to_dict()==dict(b=1,c=2))
+        J = I3[I1 > 2]
+        self.assertTrue(dict(J)==dict(c=2,d=5))
+        J = I1[Slicer().add_keys(['a','x'])]
+        self.assertTrue(J.to_dict()==dict(a=1))
+        J = I1.subset(['a','b','x'])
+        self.assertTrue(J.to_dict()==dict(a=1,b=2) and len(J)==2)
+
+    def test_mask_and_bit_slicers(self):
+        U = KeyUniverse(range(20))
+        x1 = MaskSlicer(U).add_keys([1,5,9,17])
+        x2 = BitSlicer(U).add_keys([5,17,18])
+        self.assertTrue(sorted(x1 & x2)==[5,17])
+        self.assertTrue(sorted(x2 & x1)==[5,17])
+        b = (~x1).to_bitslicer()
+        self.assertTrue(isinstance(b,BitSlicer) and b.default and sorted(b)==[1,5,9,17])
+        m = MaskSlicer.from_bitslicer(x2)
+        self.assertTrue(sorted(m)==[5,17,18] and len(m.mask)==20)
+
+    def test_columnar_subset_copy_on_write(self):
+        I = NumericColumnarIndexer().update(dict(a=1,b=2,c=3))
+        J = I[I > 1]
+        self.assertTrue(J.array.base is I.array or J.array is I.array)
+        J.update(dict(b=5))
+        self.assertTrue(I['b']==2 and J['b']==5)
+        I.update(dict(c=7))
+        self.assertTrue(I['c']==7 and J['c']==3)
+
+    def test_mixed_backend_comparisons(self):
+        I = NumericIndexer().update(dict(a=1,b=5,c=3))
+        C = NumericColumnarIndexer().update(dict(a=2,b=4,c=3,d=0))
+        for x,expected in [
+            (I < C,['a']),(C > I,['a']),
+            (I == C,['c']),(C == I,['c']),
+            (I >= C,['b','c']),(C <= I,['b','c']),
+            (I != C,['c']),
+            ]:
+            self.assertEqual(sorted(x),expected)
+        self.assertTrue((I != C).default and (C != I).default)
+
+    def test_columnar_change_feed(self):
+        I = NumericColumnarIndexer().update(dict(a=1))
+        cursor = I.changes.subscribe()
+        I.update(dict(a=2,b=3))
+        I.remove(['a'])
+        changes = [x[1:] for x in cursor.read()]
+        self.assertTrue(changes==[('a',1,2),('b',MISSING,3),('a',2,MISSING)])
+
+    def test_columnar_bulk_update_and_aggregates(self):
+        I = NumericColumnarIndexer().update_from_arrays(['a','b','c'],np.array([1,2,2]))
+        self.assertTrue(I.to_dict()==dict(a=1,b=2,c=2))
+        self.assertTrue(I.sum()==5 and I.value_counts()=={1:1,2:2})
+        I.flush()
+        I.update_from_arrays(['a','b','d'],[1,3,4])
+        self.assertTrue(sorted(I.last_updated)==['b','d'] and len(I)==4)
+        I.remove_many(['a','x'])
+        self.assertTrue(len(I)==3 and I.mean()==3)
+        with self.assertRaises(utils.IndexerError):
+            I.update_from_arrays(['e'],['x'])
+        with self.assertRaises(utils.IndexerError):
+            BooleanColumnarIndexer().update_from_arrays(['e'],[1])
+
+        # numpy keys are stored as Python values
+        J = NumericColumnarIndexer().update_from_arrays(np.array(['a','b']),np.array([1,2]))
+        self.assertTrue(all(type(key) is str for key in J.universe))
+        J.remove_many(np.array(['a']))
+        self.assertTrue(J.to_dict()==dict(b=2) and all(type(key) is str for key in J.last_updated))
+
+        # a repeated key takes its last value
+        K = NumericColumnarIndexer().update_from_arrays(['d','e','d'],[5,1,6])
+        self.assertTrue(len(K)==2 and K.to_dict()==dict(d=6,e=1) and K.sum()==7)
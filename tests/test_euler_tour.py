@@ -1,5 +1,6 @@
 from blist import blist
 from wc_rules.euler_tour import EulerTour,EulerTourIndex
+from wc_rules.euler_tour import treap_build, treap_merge, treap_split, treap_index, treap_root, treap_iter, TreapNode
 from wc_rules.chem import Molecule, Site, Bond
 import unittest
 
@@ -9,6 +10,41 @@ class X(Site):pass
 
 class TestEuler(unittest.TestCase):
 
+    def test_treap(self):
+        handles = [TreapNode(x) for x in range(100)]
+        root = treap_build(handles)
+        self.assertEqual([x.value for x in treap_iter(root)],list(range(100)))
+        self.assertEqual(root.size,100)
+        for i,h in enumerate(handles):
+            self.assertEqual(treap_index(h),i)
+            self.assertTrue(treap_root(h) is root)
+
+        left,right = treap_split(root,40)
+        self.assertEqual([x.value for x in treap_iter(left)],list(range(40)))
+        self.assertEqual([x.value for x in treap_iter(right)],list(range(40,100)))
+        self.assertTrue(treap_root(handles[10]) is left)
+        self.assertTrue(treap_root(handles[60]) is right)
+        self.assertEqual(treap_index(handles[60]),20)
+
+        root = treap_merge(right,left)
+        self.assertEqual([x.value for x in treap_iter(root)],list(range(40,100))+list(range(40)))
+        self.assertEqual(treap_index(handles[0]),60)
+
+    def test_long_tour(self):
+        # path 0-1-2-...-n, rerooted at every node
+        n = 200
+        tour = list(range(n)) + list(reversed(range(n-1)))
+        x = EulerTour(None,tour)
+        for i in range(n):
+            x.reroot(i)
+            self.assertEqual(x[0],i)
+            self.assertEqual(x[-1],i)
+            self.assertEqual(len(x),2*n-1)
+            self.assertEqual(x.get_nodes(),set(range(n)))
+        self.assertEqual(x.first_occurrence(n-1),0)
+        self.assertEqual(x.last_occurrence(n-1),2*n-2)
+        self.assertEqual(x.first_occurrence(0),x.last_occurrence(0))
+
     def test_reroot(self):
         x = EulerTour(None,blist([1,2,3,4,5,4,3,2,1]))
         self.assertEqual(x._tour,[1,2,3,4,5,4,3,2,1])
@@ -166,3 +202,250 @@ class TestEuler(unittest.TestCase):
             ind.augcut(e)
         ind.delete_existing_tour_from_node(bnd)
         self.assertEqual(len(ind),2)
+
+    def test_repeated_link(self):
+        # link, link, cut, cut: the edge is cut by the last cut only
+        for add_only in [False,True]:
+            ind = EulerTourIndex().set_add_only(add_only)
+            for i in range(3):
+                ind.create_new_tour_from_node(i)
+            edge = (0,'a','b',1)
+            ind.auglink((1,'a','b',2))
+            ind.auglink(edge)
+            ind.auglink(edge)
+            self.assertEqual(ind.count_complexes(),1)
+            ind.augcut(edge)
+            self.assertEqual(ind.count_complexes(),1)
+            self.assertTrue(ind.is_connected([0,2]))
+            self.assertEqual(ind.get_mapped_tour(0).count_spares(),0)
+            ind.augcut(edge)
+            self.assertEqual(ind.count_complexes(),2)
+            self.assertFalse(ind.is_connected([0,1]))
+
+        # likewise for edges repeated in a bulk load
+        ind = EulerTourIndex().build_from_graph([0,1],[edge,edge])
+        ind.augcut(edge)
+        self.assertEqual(ind.count_complexes(),1)
+        ind.augcut(edge)
+        self.assertEqual(ind.count_complexes(),2)
+
+    def test_tour_ids(self):
+        # a path 0-1-2-3-4-5
+        ind = EulerTourIndex()
+        for i in range(6):
+            ind.create_new_tour_from_node(i)
+        self.assertEqual(sorted(t.id for t in ind),list(range(6)))
+        edges = [(i,'a','b',i+1) for i in range(5)]
+        for e in edges:
+            ind.auglink(e)
+        self.assertEqual(len(ind),1)
+
+        # a final cut reuses the id of a tour removed by a link
+        ind.augcut(edges[2])
+        self.assertEqual(len(ind),2)
+        self.assertTrue(all(t.id in range(6) for t in ind))
+        self.assertEqual(ind._next_id,6)
+
+        # close the path into a ring
+        ind.auglink(edges[2])
+        ind.auglink((0,'a','b',5))
+        tour = ind.get_mapped_tour(0)
+        tour_id = tour.id
+
+        # cuts with a replacement keep the tour and its id, and reuse the split-off tour
+        split_off = None
+        for i in [1,2,3,1]:
+            ind.augcut(edges[i])
+            self.assertEqual(len(ind),1)
+            self.assertTrue(all(ind.get_mapped_tour(x) is tour for x in range(6)))
+            self.assertEqual(tour.id,tour_id)
+            self.assertEqual(ind._next_id,6)
+            if split_off is None:
+                split_off = ind._empty_tours[-1]
+            self.assertTrue(ind._empty_tours[-1] is split_off)
+            ind.auglink(edges[i])
+
+    def test_levels(self):
+        # n x n grid, cut in a fixed pseudo-random order
+        n = 8
+        ind = EulerTourIndex()
+        for i in range(n*n):
+            ind.create_new_tour_from_node(i)
+        edges = []
+        for i in range(n):
+            for j in range(n):
+                k = i*n + j
+                if j < n-1:
+                    edges.append((k,'a','b',k+1))
+                if i < n-1:
+                    edges.append((k,'a','b',k+n))
+        for e in edges:
+            ind.auglink(e)
+        self.assertEqual(len(ind),1)
+        self.assertEqual(len(list(ind)[0]._spares),len(edges)-n*n+1)
+
+        # removing a row of vertical edges splits the grid in two
+        order = sorted(edges,key=lambda e: (e[0]*7919) % 101)
+        row = set(e for e in edges if e[3]==e[0]+n and e[0]//n==n//2)
+        for e in order:
+            if e not in row:
+                continue
+            ind.augcut(e)
+            self.assertEqual(len(ind),1 if len(row)>1 else 2)
+            row.remove(e)
+        self.assertEqual(len(ind),2)
+        self.assertTrue(max(ind._levels.values()) > 0)
+        for tour in ind:
+            nodes = tour.get_nodes()
+            self.assertEqual(len(tour._edges),len(nodes)-1)
+            for e in tour._edges | tour._spares:
+                self.assertTrue(e[0] in nodes and e[3] in nodes)
+        self.assertEqual(sum(len(t._edges)+len(t._spares) for t in ind),len(edges)-n)
+
+        # levels only go up to log2(number of nodes)
+        for e in order:
+            if e in ind._levels:
+                ind.augcut(e)
+        self.assertEqual(len(ind),n*n)
+        self.assertTrue(len(ind._forests) <= 7)
+
+    def test_build_from_graph(self):
+        # two grids and a few singletons, built in bulk and edge by edge
+        n = 6
+        nodes = list(range(2*n*n + 3))
+        edges = []
+        for offset in [0,n*n]:
+            for i in range(n):
+                for j in range(n):
+                    k = offset + i*n + j
+                    if j < n-1:
+                        edges.append((k,'a','b',k+1))
+                    if i < n-1:
+                        edges.append((k,'a','b',k+n))
+        ind1 = EulerTourIndex().build_from_graph(nodes,edges)
+        ind2 = EulerTourIndex()
+        for node in nodes:
+            ind2.create_new_tour_from_node(node)
+        for e in edges:
+            ind2.auglink(e)
+        for ind in [ind1,ind2]:
+            self.assertEqual(len(ind),5)
+            self.assertEqual(sorted(len(t) for t in ind),[1,1,1,2*n*n-1,2*n*n-1])
+            self.assertEqual(sorted(len(t._spares) for t in ind),[0,0,0,(n-1)**2,(n-1)**2])
+        for tour in ind1:
+            x = list(tour)
+            self.assertEqual(x[0],x[-1])
+            self.assertEqual(len(tour._edges),len(tour.get_nodes())-1)
+
+        # bulk-built tours support the usual updates
+        for e in edges[:2*(n-1)*n]:
+            ind1.augcut(e)
+        self.assertEqual(len(ind1),n*n + 4)
+
+    def test_complex_stats(self):
+        # A-X-bnd-X-A with an extra A-X-bnd-X-A ring closure
+        ind = EulerTourIndex()
+        a1,a2,x1,x2,x3,x4 = A('a1'), A('a2'), X('x1'), X('x2'), X('x3'), X('x4')
+        bnd1,bnd2 = Bond('bnd1'),Bond('bnd2')
+        for n in [a1,a2,x1,x2,x3,x4,bnd1,bnd2]:
+            ind.create_new_tour_from_node(n)
+        edges = [(x1,'molecule','sites',a1),(x2,'molecule','sites',a2),(x3,'molecule','sites',a1),(x4,'molecule','sites',a2),
+            (x1,'bond','sites',bnd1),(x2,'bond','sites',bnd1),(x3,'bond','sites',bnd2),(x4,'bond','sites',bnd2)]
+        for e in edges:
+            ind.auglink(e)
+        stats = ind.get_complex_stats()
+        self.assertEqual(list(stats.values()),[{'nodes':8,'spares':1,'composition':{'A':2,'X':4,'Bond':2}}])
+
+        # breaking the ring
+        ind.augcut(edges[-1])
+        self.assertEqual(list(ind.get_complex_stats().values())[0]['spares'],0)
+
+        # splitting off bnd2-x3
+        ind.augcut(edges[2])
+        stats = sorted(ind.get_complex_stats().values(),key=lambda x: x['nodes'])
+        self.assertEqual(stats[0],{'nodes':2,'spares':0,'composition':{'X':1,'Bond':1}})
+        self.assertEqual(stats[1],{'nodes':6,'spares':0,'composition':{'A':2,'X':3,'Bond':1}})
+
+    def test_species(self):
+        # two A-X-bnd-X-A complexes and an A-X complex
+        ind = EulerTourIndex()
+        bonded = []
+        for i in range(2):
+            a1,a2,x1,x2,bnd = A(),A(),X(),X(),Bond()
+            for n in [a1,a2,x1,x2,bnd]:
+                ind.create_new_tour_from_node(n)
+            for e in [(x1,'molecule','sites',a1),(x2,'molecule','sites',a2),(x1,'bond','sites',bnd),(x2,'bond','sites',bnd)]:
+                ind.auglink(e)
+            bonded.append((x1,bnd))
+        a,x = A(),X()
+        for n in [a,x]:
+            ind.create_new_tour_from_node(n)
+        ind.auglink((x,'molecule','sites',a))
+        self.assertEqual(sorted(ind.get_species_counts().values()),[1,2])
+
+        # unbinding one of them: 2 x A-X, 1 x A-X-bnd, 1 x A-X-bnd-X-A
+        x1,bnd = bonded[0]
+        ind.augcut((x1,'bond','sites',bnd))
+        counts = ind.get_species_counts()
+        self.assertEqual(sorted(counts.values()),[1,1,2])
+        self.assertEqual(sum(counts.values()),len(ind))
+
+    def test_add_only(self):
+        # a path 0-1-...-n assembled in add-only mode, then cut in the middle
+        n = 50
+        ind = EulerTourIndex().set_add_only()
+        for i in range(n):
+            ind.create_new_tour_from_node(i)
+        edges = [(i,'a','b',i+1) for i in range(n-1)]
+        for e in edges[:n//2] + edges[n//2+1:]:
+            ind.auglink(e)
+        self.assertEqual(len(ind),0)
+        self.assertEqual(ind.count_complexes(),2)
+        ind.auglink(edges[n//2])
+        self.assertEqual(ind.count_complexes(),1)
+        self.assertTrue(ind.is_connected([0,n-1]))
+
+        # looking up tours (is_connected above) or cutting builds the pending tours
+        ind.augcut(edges[10])
+        self.assertEqual(len(ind),2)
+        self.assertEqual(ind.count_complexes(),2)
+        self.assertEqual(sorted(len(t) for t in ind),[2*11-1,2*(n-11)-1])
+
+        # a pending node linked to a bigger tour is built and linked into it
+        big = ind.get_mapped_tour(n-1)
+        ind.create_new_tour_from_node(n)
+        ind.auglink((n-1,'a','b',n))
+        self.assertEqual(ind.count_complexes(),2)
+        self.assertEqual(len(ind._pending),0)
+        self.assertTrue(ind.get_mapped_tour(n) is big)
+
+        # a tour linked to a bigger pending component is made pending
+        small = ind.get_mapped_tour(0)
+        for i in range(n+1,n+21):
+            ind.create_new_tour_from_node(i)
+        for i in range(n+2,n+21):
+            ind.auglink((i-1,'a','b',i))
+        ind.auglink((0,'a','b',n+1))
+        self.assertEqual(ind.count_complexes(),2)
+        self.assertTrue(small not in ind)
+        ind.set_add_only(False)
+        self.assertEqual(sorted(len(t) for t in ind),[2*(11+20)-1,2*(n-10)-1])
+
+    def test_add_only_growth(self):
+        # one complex grows by single links in add-only mode
+        # nodes join the big tour one at a time and the tour is never rebuilt
+        n = 200
+        ind = EulerTourIndex()
+        ind.create_new_tour_from_node(0)
+        ind.create_new_tour_from_node(1)
+        ind.auglink((0,'a','b',1))
+        tour = ind.get_mapped_tour(0)
+        ind.set_add_only()
+        for i in range(2,n):
+            ind.create_new_tour_from_node(i)
+            ind.auglink((i-1,'a','b',i))
+            ind.auglink((i-2,'a','b',i))
+            self.assertEqual(len(ind._pending),0)
+        self.assertEqual(list(ind),[tour])
+        self.assertEqual(tour.count_nodes(),n)
+        self.assertEqual(tour.count_spares(),n-2)
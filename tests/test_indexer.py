@@ -5,11 +5,17 @@
 :License: MIT
 """
 
-from wc_rules.indexer import Indexer, Slicer
-from wc_rules.indexer import BooleanIndexer, NumericIndexer, StringIndexer, HashableDict
+from wc_rules.indexer import Indexer, Slicer, BitSlicer, KeyUniverse, SlicerExpression, IndexerView, MISSING
+from wc_rules.indexer import BooleanIndexer, NumericIndexer, StringIndexer, HashableDict, literal_prefix
 from wc_rules.chem import Molecule
 from wc_rules import utils
 import itertools
+import collections
+import json
+import numpy as np
+import pickle
+import random
+import re
 
 import unittest
 
@@ -299,3 +305,356 @@ class TestIndexer(unittest.TestCase):
         self.assertTrue(j[a]==1 and j[b]==2)
         j = i[i==dict(y=2)]
         self.assertTrue(j[a]==1 and b not in j)
+
+    def test_indexer_range(self):
+        I = NumericIndexer().update(dict(a=1,b=2,c=2,d=3.5,e=5))
+        self.assertTrue(sorted(I.value_cache.keys())==[1,2,3.5,5])
+        self.assertTrue(sorted(I < 3.5)==['a','b','c'])
+        self.assertTrue(sorted(I <= 3.5)==['a','b','c','d'])
+        self.assertTrue(sorted(I > 2)==['d','e'])
+        self.assertTrue(sorted(I >= 2)==['b','c','d','e'])
+        self.assertTrue(len(I > 5)==0)
+        self.assertTrue(sorted(I.between(2,3.5))==['b','c','d'])
+        self.assertTrue(sorted(I.between(2,3.5,inclusive=(False,True)))==['d'])
+        self.assertTrue(sorted(I.top(2))==['d','e'])
+        self.assertTrue(sorted(I.bottom(1))==['a'])
+        self.assertTrue(len(I.top(10))==5)
+        self.assertTrue(len(I == 7)==0)
+
+        I.update(dict(e=0))
+        self.assertTrue(sorted(I.bottom(1))==['e'])
+        self.assertTrue(sorted(I[I > 1])==['b','c','d'])
+        self.assertTrue(isinstance(I[I > 1].value_cache,type(I.value_cache)))
+
+    def test_bitslicer(self):
+        U = KeyUniverse(['a','b','c','d'])
+        x1 = BitSlicer(U).add_keys(['a','b','c'])
+        x2 = BitSlicer(U).add_keys(['b','c','d'])
+        self.assertTrue(x1.bits==0b0111 and len(x1)==3)
+        self.assertTrue(x1['a'] and not x1['d'] and not x1['e'])
+        self.assertTrue(sorted(x1 & x2)==['b','c'])
+        self.assertTrue(sorted(x1 | x2)==['a','b','c','d'])
+
+        # positive & negative, as for Slicer
+        x = x1 & ~x2
+        self.assertTrue(not x.default and sorted(x)==['a'])
+        x = x1 | ~x2
+        self.assertTrue(x.default and sorted(x)==['d'])
+        x = ~x1 | ~x2
+        self.assertTrue(x.default and sorted(x)==['b','c'])
+        self.assertTrue(x['a'] and x['e'] and not x['b'])
+
+        # with dict-based slicers, on either side
+        s = Slicer().add_keys(['a','e'])
+        for x in [x1 & s, s & x1]:
+            self.assertTrue(isinstance(x,BitSlicer) and sorted(x)==['a'])
+        x1.delete_keys(['a'])
+        self.assertTrue(sorted(x1)==['b','c'] and not x1['a'])
+
+        # combining with keys outside the universe does not add them to it
+        self.assertEqual(len(U),4)
+        x = x2 | s
+        self.assertTrue(not x.default and sorted(x)==['a','b','c','d','e'])
+        x = ~s & ~x2
+        self.assertTrue(x.default and sorted(x)==['a','b','c','d','e'])
+        self.assertEqual(len(U),4)
+
+        # dict behavior, as for a Slicer with the same keys
+        self.assertEqual(x1,Slicer().add_keys(['b','c']))
+        self.assertEqual(Slicer().add_keys(['b','c']),x1)
+        self.assertNotEqual(x1,x2)
+        self.assertEqual(repr(x1),repr(Slicer().add_keys(['b','c'])))
+        self.assertEqual(sorted(x1.items()),[('b',True),('c',True)])
+        self.assertEqual(list(x1.values()),[True,True])
+        self.assertTrue(x1 and not BitSlicer(U))
+        y = x1.copy()
+        y.add_keys(['a'])
+        self.assertTrue(isinstance(y,BitSlicer) and sorted(x1)==['b','c'])
+
+        # json and pickle
+        self.assertEqual(json.loads(json.dumps(x1)),dict(b=True,c=True))
+        self.assertEqual(json.dumps(BitSlicer(U)),'{}')
+        y = pickle.loads(pickle.dumps(~x1))
+        self.assertTrue(isinstance(y,BitSlicer) and y.default and sorted(y)==['b','c'] and y['a'])
+
+    def test_indexer_with_universe(self):
+        U = KeyUniverse()
+        I1 = NumericIndexer(universe=U).update(dict(a=1,b=2,c=3,d=4))
+        I2 = StringIndexer(universe=U).update(dict(a='p',b='q',c='r',d='s'))
+        x = (I1 > 1) & ~(I2 == 'r')
+        self.assertTrue(isinstance(x.evaluate(),BitSlicer) and sorted(x)==['b','d'])
+        I3 = I2[x]
+        self.assertTrue(dict(I3)==dict(b='q',d='s') and I3.universe is U)
+        self.assertTrue(sorted(I1 == I1[x])==['b','d'])
+
+    def test_lazy_slicers(self):
+        I1 = NumericIndexer().update({i:i%10 for i in range(100)})
+        I2 = StringIndexer().update({i:'x' if i%2 else 'y' for i in range(100)})
+
+        x = I1 == 3
+        self.assertTrue(isinstance(x,SlicerExpression) and x._result is None)
+        self.assertTrue(x.estimate()==10 and not x.default)
+        self.assertTrue(x[3] and not x[4] and x._result is not None)
+
+        expected = {i for i in range(100) if (i%10 > 4 and i%2) or i%10==0}
+        x = ((I1 > 4) & ~(I2 == 'y')) | (I1 == 0)
+        self.assertTrue(set(x.keys())==expected)
+        self.assertTrue(all(x.test(i)==(i in expected) for i in range(100)))
+        self.assertTrue(set(I2[x])==expected)
+
+        # conjunctions compute only the smallest operand
+        x = (I1 >= 0) & (I1 == 7) & ~(I2 == 'x')
+        self.assertTrue(len(x)==0)
+        self.assertTrue(x.operands[0]._result is None and x.operands[1]._result is not None)
+
+        # negative results
+        x = ~(I1 < 9) | (I2 == 'x')
+        self.assertTrue(x.default)
+        self.assertTrue({i for i in range(100) if x[i]}=={i for i in range(100) if i%10==9 or i%2})
+
+        # with concrete slicers, on either side
+        s = Slicer().add_keys([1,2,3])
+        self.assertTrue(sorted(s & (I2 == 'x'))==[1,3])
+        self.assertTrue(sorted((I2 == 'x') & s)==[1,3])
+        self.assertTrue(sorted(I1.equal(2).keys())==list(range(2,100,10)))
+
+        # dict behavior, as for the concrete slicer
+        x = I2 == 'y'
+        self.assertEqual(x,I2.equal('y'))
+        self.assertEqual(I2.equal('y'),x)
+        self.assertNotEqual(x,I2.equal('x'))
+        self.assertEqual(repr(x),repr(I2.equal('y')))
+        self.assertEqual(len(list(x.items())),50)
+        self.assertTrue(all(list(x.values())) and x and not (I1 == 100))
+
+        # unused comparisons keep the state of the indexer they were made in
+        J = NumericIndexer().update(dict(a=1,b=6,c=7))
+        x = J > 5
+        y = (J > 5) & ~(J == 7)
+        J.update(dict(a=10,b=2))
+        self.assertEqual(sorted(x),['b','c'])
+        self.assertEqual(sorted(y),['b'])
+        self.assertEqual(sorted(J > 5),['a','c'])
+        self.assertEqual(dict(J[x]),dict(b=2,c=7))
+
+        # json and pickle give the concrete slicer
+        K = NumericIndexer().update(dict(a=1,b=2))
+        for x in [K == 1, K > 1, K == K, ~(K == 1), (K > 1) | (K == 1)]:
+            self.assertEqual(json.loads(json.dumps(x)),x.as_dict())
+            y = pickle.loads(pickle.dumps(x))
+            self.assertTrue(type(y) is Slicer and y.default==x.default and y==x)
+        x = K == 1
+        y = pickle.loads(pickle.dumps(x))
+        K.update(dict(b=1))
+        self.assertTrue(sorted(y)==['a'] and sorted(x)==['a'])
+        self.assertEqual(json.dumps(K == 5),'{}')
+
+    def test_indexer_views(self):
+        I = NumericIndexer().update(dict(a=1,b=2,c=3,d=4))
+        J = I[I > 1]
+        K = J[Slicer().add_keys(['b','c','x'])]
+        self.assertTrue(isinstance(K,NumericIndexer) and isinstance(K,IndexerView))
+        self.assertTrue(K._parent is I and not dict.__contains__(K,'b'))
+        self.assertTrue(sorted(K)==['b','c'] and K['b']==2 and 'a' not in K and len(K)==2)
+        self.assertTrue(dict(K.items())==dict(b=2,c=3))
+        with self.assertRaises(KeyError):
+            K['a']
+
+        # comparisons are answered by the parent, restricted to the view
+        self.assertTrue(sorted(K == 3)==['c'] and sorted(K >= 2)==['b','c'] and sorted(J < 3)==['b'])
+        x = K != 3
+        self.assertTrue(x.default and x['b'] and not x['c'] and sorted(I[x])==['a','b','d'])
+        L = K[K > 2]
+        self.assertTrue(isinstance(L,NumericIndexer) and dict(L)==dict(c=3))
+        self.assertTrue(K._parent is I and L._parent is I)
+
+        # other uses of the caches and changes materialize the view
+        self.assertTrue(sorted(K.slice([3]))==['c'])
+        self.assertTrue(K._parent is None and sorted(K.value_cache.keys())==[2,3])
+        J.update(dict(b=10))
+        self.assertTrue(I['b']==2 and J['b']==10 and K['b']==2)
+
+        # changes to the parent are not seen by views
+        L = I.subset(['a','b'])
+        I.update(dict(a=5))
+        I.remove(['b'])
+        self.assertTrue(dict(L)==dict(a=1,b=2) and dict(I)==dict(a=5,c=3,d=4))
+        self.assertTrue(sorted(L.last_updated)==['a','b','c','d'])
+
+        # dict methods that change a view materialize it first
+        for change in [lambda V: V.pop('a'),lambda V: V.__delitem__('a'),lambda V: V.setdefault('a',7)]:
+            V = I.subset(['a','c'])
+            self.assertEqual(V.copy(),dict(a=5,c=3))
+            change(V)
+            self.assertTrue(V._parent is None and 'c' in V)
+        self.assertEqual(I.subset(['a','c']).pop('a'),5)
+        V = I.subset(['a','c'])
+        V['x'] = 7
+        self.assertTrue('x' in V and V['x']==7 and 'x' not in I)
+        self.assertEqual(json.loads(json.dumps(V)),dict(a=5,c=3,x=7))
+
+        # json and pickle, before the view is materialized
+        V = I.subset(['a','c'])
+        self.assertEqual(json.loads(json.dumps(V)),dict(a=5,c=3))
+        self.assertTrue(V._parent is I)
+        W = pickle.loads(pickle.dumps(V))
+        self.assertTrue(type(W) is type(V) and dict(W)==dict(a=5,c=3) and sorted(W > 4)==['a'])
+        self.assertTrue(V._parent is None and dict(V)==dict(a=5,c=3))
+
+    def test_field_indexes(self):
+        State = collections.namedtuple('State',['species','compartment','cell'])
+        keys = [State(s,c,i) for s in ['A','B','C'] for c in ['c','e'] for i in range(2)]
+        I = NumericIndexer(fields=['compartment']).update({key:n for n,key in enumerate(keys)})
+        self.assertTrue(sorted(I.field_cache['compartment'].keys())==['c','e'])
+
+        x = I == dict(compartment='c')
+        self.assertTrue(x.estimate()==6)
+        self.assertTrue(sorted(x.keys())==sorted(k for k in keys if k.compartment=='c'))
+        x = I == dict(compartment='e',species='B')
+        self.assertTrue(sorted(x.keys())==[State('B','e',0),State('B','e',1)])
+
+        # unindexed fields and positions still work, by scanning
+        x = I == {2:1,'species':'A'}
+        self.assertTrue(sorted(x.keys())==[State('A','c',1),State('A','e',1)])
+
+        # maintained on update and remove
+        I.add_field_index('cell')
+        I.remove([State('A','c',0)])
+        I.update({State('D','c',5):10})
+        self.assertTrue(len(I.field_cache['compartment']['c'])==6)
+        self.assertTrue(sorted((I == dict(cell=5)).keys())==[State('D','c',5)])
+
+        # views keep the indexed fields
+        J = I[I > 3]
+        self.assertTrue(sorted((J == dict(compartment='c')).keys())==sorted(k for k in J if k.compartment=='c'))
+        self.assertTrue(sorted(J.field_cache.keys())==['cell','compartment'])
+
+    def test_change_feed(self):
+        I = NumericIndexer().update(dict(a=1))
+        self.assertTrue(I.changes.generation==1 and len(I.changes)==0)
+
+        c1 = I.changes.subscribe()
+        I.update(dict(a=2,b=3))
+        c2 = I.changes.subscribe()
+        I.remove(['a'])
+        I.update(dict(b=4,c=5))
+        self.assertTrue(c1.pending()==5 and c2.pending()==3)
+
+        changes = c1.read()
+        self.assertTrue([x[0] for x in changes]==[1,2,3,4,5])
+        self.assertTrue(changes[0][1:]==('a',1,2) and changes[2][1:]==('a',2,MISSING))
+        self.assertTrue(c1.read()==[] and len(I.changes)==3)
+
+        changes = c2.read(coalesce=True)
+        self.assertTrue([x[1:] for x in changes]==[('a',2,MISSING),('b',3,4),('c',MISSING,5)])
+        self.assertTrue(len(I.changes)==0)
+
+        # adding and removing a key between reads cancels out
+        I.update(dict(d=1))
+        I.remove(['d'])
+        I.update(dict(b=5))
+        self.assertTrue([x[1:] for x in c1.read(coalesce=True)]==[('b',4,5)])
+        c1.close()
+        c2.close()
+        I.update(dict(b=6))
+        self.assertTrue(len(I.changes)==0 and I.changes.generation==10)
+
+        # pickled copies keep their values and generation, but not the cursors
+        c3 = I.changes.subscribe()
+        I.update(dict(e=7))
+        J = pickle.loads(pickle.dumps(I))
+        self.assertTrue(dict(J)==dict(b=6,c=5,e=7) and J.changes.generation==11 and len(J.changes)==0)
+        self.assertTrue(list(J==6)==['b'] and list(J==7)==['e'])
+        J.update(dict(e=8))
+        self.assertTrue(c3.pending()==1 and len(I.changes)==1)
+        cursor = J.changes.subscribe()
+        J.update(dict(e=9))
+        self.assertTrue([x[1:] for x in cursor.read()]==[('e',8,9)])
+
+    def test_bulk_update_and_aggregates(self):
+        State = collections.namedtuple('State',['species','compartment'])
+        keys = [State(s,c) for s in ['A','B','C'] for c in ['c','e']]
+        I = NumericIndexer(fields=['compartment']).update_from_arrays(keys,[1,2,3,4,1,1])
+        self.assertTrue(len(I)==6 and I[State('B','c')]==3)
+        self.assertTrue(I.value_counts()=={1:3,2:1,3:1,4:1})
+        self.assertTrue(I.sum()==12 and I.mean()==2)
+        self.assertTrue(I.groupby('compartment')=={'c':5,'e':7})
+        self.assertTrue(I.groupby('species',aggregate='max')=={'A':2,'B':4,'C':1})
+        with self.assertRaises(utils.IndexerError):
+            I.groupby('species',aggregate='median')
+
+        I.flush()
+        cursor = I.changes.subscribe()
+        I.update_from_arrays([State('A','c'),State('A','e'),State('D','c')],[1,5,2])
+        self.assertTrue(sorted(I.last_updated)==[State('A','e'),State('D','c')])
+        self.assertTrue([x[1:] for x in cursor.read()]==[(State('A','e'),2,5),(State('D','c'),MISSING,2)])
+        self.assertTrue(I.value_counts()=={1:3,2:1,3:1,4:1,5:1} and 2 in I.value_cache)
+        with self.assertRaises(utils.IndexerError):
+            I.update_from_arrays([State('E','c')],[1,2])
+
+        I.remove_many([State('A','c'),State('X','x')])
+        self.assertTrue(State('A','c') not in I and len(I.field_cache['compartment']['c'])==3)
+        self.assertTrue(BooleanIndexer().update(dict(a=True,b=True,c=False)).sum()==2)
+
+        # numpy keys are stored as Python values
+        J = NumericIndexer().update_from_arrays(np.array(['a','b']),np.array([1,2]))
+        J.update_from_arrays(np.arange(2),np.array([3,4]))
+        self.assertTrue(all(type(key) in (int,str) for key in J))
+        self.assertEqual(dict(J),{'a':1,'b':2,0:3,1:4})
+        J.remove_many(np.array(['a']))
+        self.assertEqual(sorted(J.last_updated,key=str),[0,1,'a','b'])
+        self.assertTrue(all(type(key) in (int,str) for key in J.last_updated))
+
+        # a repeated key takes its last value
+        K = NumericIndexer().update_from_arrays(['d','d'],[5,6])
+        self.assertTrue(len(K==5)==0 and list(K==6)==['d'] and K.value_counts()=={6:1})
+
+    def test_string_indexer_queries(self):
+        names = ['kinase_A','kinase_B','kinase_B_p','phosphatase','kinetics','ribosome']
+        I = StringIndexer().update({i:name for i,name in enumerate(names)})
+        self.assertTrue(list(I.value_cache.keys())==sorted(names))
+        self.assertTrue(sorted(I.startswith('kinase_'))==[0,1,2])
+        self.assertTrue(sorted(I.startswith('kin'))==[0,1,2,4])
+        self.assertTrue(len(I.startswith('z'))==0)
+        self.assertTrue(sorted(I.match(r'kinase_B(_p)?$'))==[1,2])
+        self.assertTrue(sorted(I.match(r'kinase_\w$'))==[0,1])
+        self.assertTrue(sorted(I.match(r'(kinase|phosphatase)'))==[0,1,2,3])
+        self.assertTrue(sorted(I.between('kinase_B','phosphatase'))==[1,2,3,4])
+        self.assertTrue(sorted((I < 'kinetics').keys())==[0,1,2])
+        self.assertTrue(sorted(I[(I >= 'p') & (I != 'ribosome')])==[3])
+
+    def test_literal_prefix(self):
+        self.assertTrue(literal_prefix(re.compile('^kinase_B(_p)?'))=='kinase_B')
+        self.assertTrue(literal_prefix(re.compile('kinases?'))=='kinase')
+        self.assertTrue(literal_prefix(re.compile('kinase+'))=='kinase')
+        self.assertTrue(literal_prefix(re.compile('a|b'))=='')
+        self.assertTrue(literal_prefix(re.compile('abc',re.IGNORECASE))=='')
+
+    def test_ordered_queries(self):
+        I = NumericIndexer().update(dict(a=5,b=1,c=3,d=5,e=2))
+        self.assertTrue([v for k,v in I.sorted_items()]==[1,2,3,5,5])
+        self.assertTrue(I.nsmallest(2)==[('b',1),('e',2)])
+        self.assertTrue(sorted(I.nlargest(3))==[('a',5),('c',3),('d',5)])
+        self.assertTrue(len(I.nlargest(10))==5 and I.nlargest(0)==[])
+        self.assertTrue(sorted(I.top(2))==['a','d'])
+
+        S = StringIndexer().update(dict(a='y',b='x'))
+        self.assertTrue(list(S.sorted_items(reverse=True))==[('a','y'),('b','x')])
+
+    def test_top_k_tracker(self):
+        rnd = random.Random(0)
+        I = NumericIndexer().update({i:rnd.randrange(50) for i in range(30)})
+        trackers = [I.track_top(5),I.track_top(3,largest=False)]
+        for step in range(300):
+            key = rnd.randrange(40)
+            if key in I and rnd.random() < 0.2:
+                I.remove([key])
+            else:
+                I.update({key:rnd.randrange(50)})
+            for tracker in trackers:
+                values = sorted(I.values(),reverse=tracker.largest)[:tracker.k]
+                items = tracker.items()
+                self.assertTrue([v for k,v in items]==values)
+                self.assertTrue(all(I[k]==v for k,v in items))
+        trackers[0].close()
+        self.assertTrue(len(I.changes.cursors)==1)
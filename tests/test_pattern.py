@@ -92,6 +92,10 @@ class TestPattern(unittest.TestCase):
             source_pattern = tup[1][1][0]
             source_var = tup[1][1][1]
 
+        # complex queries only appear with complex expressions
+        p.add_expression('same_complex(y1,y2)')
+        self.assertEqual(p.generate_queries()['complex'],[('same_complex',('y1','y2'))])
+
     def test_expressions(self):
         x1 = X('x1')
         p1 = pattern.Pattern('p1')  \
@@ -0,0 +1,79 @@
+from wc_rules.chem import Molecule, Site
+from wc_rules.pattern import Pattern
+from wc_rules.matcher import Matcher
+from wc_rules.attributes import *
+from wc_rules.rete_token import *
+from wc_rules.rete_replay import TokenRecorder, TokenReplayer
+from wc_rules.utils import ReplayError
+import os
+import shutil
+import tempfile
+import unittest
+
+class A(Molecule):pass
+class X(Site):
+    ph = BooleanAttribute()
+
+def build_matcher():
+    m = Matcher()
+    m.add_pattern(Pattern('pAx').add_node(A(id='a').add_sites(X(id='x'))))
+    m.add_pattern(Pattern('pX').add_node(X(id='x',ph=True)))
+    return m
+
+class TestRecordReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def record(self):
+        m = build_matcher()
+        recorder = TokenRecorder()
+        m.set_recorder(recorder)
+
+        a = A()
+        x_list = [X(ph=True) for i in range(3)]
+        m.send_tokens([token_add_node(x) for x in [a] + x_list])
+        for x in x_list:
+            x.molecule = a
+            m.send_tokens([token_add_edge(a,'sites','molecule',x)])
+        x_list[1].ph = False
+        m.send_tokens([token_edit_attrs(x_list[1],['ph'])])
+        x_list[0].molecule = None
+        m.send_tokens([token_remove_edge(a,'sites','molecule',x_list[0])])
+        m.set_recorder(None)
+        return m,recorder
+
+    def test_record(self):
+        m,recorder = self.record()
+        self.assertEqual(len(recorder),9)
+        self.assertEqual(len(recorder.entities),4)
+        self.assertEqual(m.count('pAx'),2)
+        self.assertEqual(m.count('pX'),2)
+
+    def test_replay(self):
+        m,recorder = self.record()
+        filename = os.path.join(self.tmp_dir,'run.tokens.gz')
+        recorder.save(filename,m)
+
+        replayer = TokenReplayer.load(filename)
+        self.assertEqual(len(replayer),9)
+        result = replayer.run(build_matcher(),trace_memory=True)
+        self.assertEqual(result['n_tokens'],9)
+        self.assertEqual(result['counts'],{'pAx':2,'pX':2})
+        self.assertEqual(result['counts'],result['expected_counts'])
+        self.assertTrue(result['tokens_per_second'] > 0)
+        self.assertTrue(result['peak_memory'] > 0)
+
+        result = TokenReplayer.from_recorder(recorder).run(build_matcher())
+        self.assertEqual(result['counts'],{'pAx':2,'pX':2})
+        self.assertEqual(result['peak_memory'],None)
+
+    def test_replay_missing_class(self):
+        m,recorder = self.record()
+        stream = recorder.to_dict()
+        stream['classes'] = [('wc_rules.chem','NoSuchClass')]
+        with self.assertRaises(ReplayError):
+            TokenReplayer(stream).build_entities()
@@ -0,0 +1,118 @@
+from wc_rules.chem import Molecule, Site
+from wc_rules.pattern import Pattern
+from wc_rules.matcher import Matcher
+from wc_rules.rete_token import *
+from wc_rules.rete_trace import TokenTracer, read_trace, token_key_hash, HEADER, PASSED
+from wc_rules.rete_trace_analysis import TraceAnalysis
+from wc_rules.utils import TraceError
+import os
+import shutil
+import tempfile
+import unittest
+
+class A(Molecule):pass
+class X(Site):pass
+
+class TestReteTrace(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def run_matcher(self,tracer):
+        m = Matcher()
+        m.add_pattern(Pattern('pAx').add_node(A(id='a').add_sites(X(id='x'))))
+        m.set_tracer(tracer)
+        # nodes added after the tracer is set are also traced
+        m.add_pattern(Pattern('pA').add_node(A(id='a')))
+
+        a = A()
+        x_list = [X() for i in range(3)]
+        m.send_tokens([token_add_node(x) for x in [a] + x_list])
+        for x in x_list:
+            x.molecule = a
+            m.send_tokens([token_add_edge(a,'sites','molecule',x)])
+        x_list[0].molecule = None
+        m.send_tokens([token_remove_edge(a,'sites','molecule',x_list[0])])
+        m.set_tracer(None)
+        return m
+
+    def test_tracer_in_memory(self):
+        tracer = TokenTracer(capacity=1000)
+        m = self.run_matcher(tracer)
+        records = list(tracer.records())
+        self.assertEqual(len(records),tracer.count)
+
+        root_index = tracer.node_index['root']
+        root_records = [x for x in records if x[0]==root_index]
+        self.assertEqual(len(root_records),8)
+        self.assertTrue(all(x[2]==PASSED for x in root_records))
+
+        analysis = TraceAnalysis.from_tracer(tracer)
+        terminal = m.get_pattern('pAx').id
+        paths = analysis.hot_paths()
+        self.assertEqual(sorted(paths),['pA','pAx'])
+        self.assertEqual(paths['pAx'][0],'root')
+        self.assertEqual(paths['pAx'][-1],terminal)
+
+        # 3 matches of pAx were added, 1 was removed
+        self.assertAlmostEqual(analysis.cancellation_rates()[terminal],1/3)
+        self.assertEqual(analysis.fan_out()['root'],1.0)
+        self.assertTrue(terminal in analysis.annotations())
+        text = m.rete_net.draw_as_gml(annotations=analysis.annotations())
+        self.assertTrue('fanout=' in text)
+
+    def test_tracer_ring_buffer(self):
+        tracer = TokenTracer(capacity=4)
+        self.run_matcher(tracer)
+        self.assertTrue(tracer.count > 4)
+        self.assertEqual(len(tracer),4)
+        self.assertEqual(len(list(tracer.records())),4)
+
+    def test_tracer_file(self):
+        filename = os.path.join(self.tmp_dir,'run.trace')
+        tracer = TokenTracer(capacity=1000,filename=filename)
+        self.run_matcher(tracer)
+        tracer.close()
+
+        records,description = read_trace(filename)
+        self.assertEqual(len(records),tracer.count)
+        self.assertEqual(sorted(description['patterns']),['pA','pAx'])
+
+        analysis = TraceAnalysis.from_file(filename)
+        self.assertEqual(analysis.n_records,tracer.count)
+
+        with open(filename,'wb') as file:
+            file.write(b'0'*64)
+        with self.assertRaises(TraceError):
+            read_trace(filename)
+
+        # shorter than the header
+        with open(filename,'wb') as file:
+            file.write(b'WCRT')
+        with self.assertRaises(TraceError):
+            read_trace(filename)
+
+        # header claims more records than the file holds
+        tracer = TokenTracer(capacity=1000,filename=filename)
+        self.run_matcher(tracer)
+        tracer.close()
+        with open(filename,'rb') as file:
+            data = file.read()
+        with open(filename,'wb') as file:
+            file.write(data[:HEADER.size+10])
+        with self.assertRaises(TraceError):
+            read_trace(filename)
+
+    def test_token_key_hash_is_stable(self):
+        a = A(id='a')
+        x = X(id='x')
+        add = token_add_edge(a,'sites','molecule',x)
+        remove = token_remove_edge(a,'sites','molecule',x)
+        self.assertEqual(token_key_hash(add),token_key_hash(remove))
+
+        # the hash does not depend on the process, so it is the same in every run
+        token = AddToken(dict(node1='a',attr1='sites',attr2='molecule',node2='x'))
+        self.assertEqual(token_key_hash(token),955045286222669085)
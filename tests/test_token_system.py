@@ -55,6 +55,12 @@ class TestTokenSystem(unittest.TestCase):
         self.assertEqual(len(f2),1)
         f3 = R.filter({'a':x1})
         self.assertEqual(len(f3),0)
+        f4 = R.filter({})
+        self.assertEqual(f4,set([t1,t2]))
+
+        self.assertEqual(set(R.iter_filter({'a':a1})),set([t1,t2]))
+        self.assertEqual(set(R.iter_filter({'a':a1,'x':x2})),set([t2]))
+        self.assertEqual(set(R.iter_filter({'a':x1})),set())
 
     def test_token_passing_01(self):
         # Tests pattern with a single node
@@ -536,3 +542,206 @@ class TestTokenSystem(unittest.TestCase):
         c2 = m.count('pAx')
         self.assertEqual(c1,n1 + n2 + n3 + n4)
         self.assertEqual(c2,n1 + 2*n2 + 3*n3 + 2*n4)
+
+    def test_get_matches(self):
+        pAx = Pattern('pAx').add_node(A(id='a').add_sites(X(id='x')))
+        pA = Pattern('pA').add_node(A(id='a'))
+        m = Matcher()
+        for p in [pAx,pA]:
+            m.add_pattern(p)
+
+        a1,a2 = A(),A()
+        x1_list = [X() for i in range(3)]
+        x2_list = [X() for i in range(2)]
+        m.send_tokens([token_add_node(x) for x in [a1,a2] + x1_list + x2_list])
+        for a,xlist in [[a1,x1_list],[a2,x2_list]]:
+            for x in xlist:
+                x.molecule = a
+                m.send_tokens([token_add_edge(a,'sites','molecule',x)])
+
+        self.assertEqual(len(m.get_matches('pAx')),5)
+        self.assertEqual(len(m.get_matches('pAx',a=a1)),3)
+        self.assertEqual(len(m.get_matches('pAx',a=a2)),2)
+        self.assertEqual(m.get_matches('pAx',x=x1_list[0]),[{'a':a1,'x':x1_list[0]}])
+        self.assertEqual(m.get_matches('pAx',a=a2,x=x1_list[0]),[])
+        self.assertEqual(set(d['x'] for d in m.iter_matches('pAx',a=a2)),set(x2_list))
+        self.assertEqual(m.get_matches('pA',a=a1),[{'a':a1}])
+        self.assertEqual(len(m.get_matches('pA')),2)
+        with self.assertRaises(FindError):
+            m.get_matches('pAx',y=a1)
+
+    def test_aggregate(self):
+        pAx = Pattern('pAx').add_node(A(id='a').add_sites(X(id='x')))
+        m = Matcher()
+        m.add_pattern(pAx)
+
+        a1,a2 = A(),A()
+        x1_list = [X(v=i) for i in range(3)]
+        x2_list = [X(v=10+i) for i in range(2)]
+        m.send_tokens([token_add_node(x) for x in [a1,a2] + x1_list + x2_list])
+
+        def bind(a,x):
+            x.molecule = a
+            m.send_tokens([token_add_edge(a,'sites','molecule',x)])
+        def unbind(a,x):
+            x.molecule = None
+            m.send_tokens([token_remove_edge(a,'sites','molecule',x)])
+
+        for x in x1_list[:2]:
+            bind(a1,x)
+        # aggregates created after matches exist are initialized from the pattern
+        self.assertEqual(m.aggregate('pAx'),2)
+        self.assertEqual(m.aggregate('pAx','count',groupby='a'),{a1:2})
+        self.assertEqual(m.aggregate('pAx','sum','a','x','v'),{a1:1})
+
+        # and then updated incrementally
+        bind(a1,x1_list[2])
+        for x in x2_list:
+            bind(a2,x)
+        self.assertEqual(m.aggregate('pAx'),5)
+        self.assertEqual(m.aggregate('pAx','count',groupby='a'),{a1:3,a2:2})
+        self.assertEqual(m.aggregate('pAx','sum','a','x','v'),{a1:3,a2:21})
+        self.assertEqual(m.aggregate('pAx','max','a','x','v'),{a1:2,a2:11})
+        self.assertEqual(m.aggregate('pAx','min',None,'x','v'),0)
+
+        unbind(a1,x1_list[0])
+        unbind(a2,x2_list[1])
+        self.assertEqual(m.aggregate('pAx'),3)
+        self.assertEqual(m.aggregate('pAx','count',groupby='a'),{a1:2,a2:1})
+        self.assertEqual(m.aggregate('pAx','sum','a','x','v'),{a1:3,a2:10})
+        self.assertEqual(m.aggregate('pAx','max','a','x','v'),{a1:2,a2:10})
+        self.assertEqual(m.aggregate('pAx','min',None,'x','v'),1)
+
+        with self.assertRaises(BuildError):
+            m.aggregate('pAx','median','a','x','v')
+        with self.assertRaises(BuildError):
+            m.aggregate('pAx','sum','a')
+        with self.assertRaises(FindError):
+            m.aggregate('pAx','count',groupby='y')
+
+    def test_instrumentation(self):
+        pAx = Pattern('pAx').add_node(A(id='a').add_sites(X(id='x')))
+        m = Matcher()
+        m.add_pattern(pAx)
+        self.assertTrue(all(x is None for x in m.stats().values()))
+
+        m.set_instrumentation(True)
+        # nodes added after instrumentation is turned on are also instrumented
+        pA = Pattern('pA').add_node(A(id='a'))
+        m.add_pattern(pA)
+
+        a = A()
+        x_list = [X() for i in range(3)]
+        m.send_tokens([token_add_node(x) for x in [a] + x_list])
+        for x in x_list:
+            x.molecule = a
+            m.send_tokens([token_add_edge(a,'sites','molecule',x)])
+
+        stats = m.stats()
+        self.assertTrue(all(x is not None for x in stats.values()))
+        root = stats['root']
+        self.assertEqual(root['tokens_in'],{'add':7})
+        self.assertEqual(root['tokens_passed'],{'add':7})
+        self.assertTrue(root['time'] > 0)
+
+        terminal = stats[m.get_pattern('pAx').id]
+        self.assertEqual(terminal['patterns'],['pAx'])
+        self.assertEqual(terminal['register_size'],3)
+        self.assertTrue(terminal['register_bytes'] > 0)
+        self.assertEqual(stats[m.get_pattern('pA').id]['patterns'],['pA'])
+
+        for node_stats in stats.values():
+            n_in = sum(node_stats['tokens_in'].values())
+            n_failed = sum(node_stats['tokens_failed'].values())
+            self.assertTrue(n_failed <= n_in)
+
+        m.set_instrumentation(False)
+        self.assertTrue(all(x is None for x in m.stats().values()))
+
+    def test_load(self):
+        # A-X-bnd-X-A, A-X2 and a free X, loaded in bulk
+        pAx = Pattern('pAx').add_node(A(id='a').add_sites(X(id='x')))
+        m = Matcher()
+        m.add_pattern(pAx)
+
+        a1,a2,a3 = A(),A(),A()
+        x1,x2,x3,x4,x5 = X(),X(),X(),X(),X()
+        a1.add_sites(x1)
+        a2.add_sites(x2)
+        a3.add_sites(x3,x4)
+        bnd = Bond()
+        bnd.add_sites(x1,x2)
+        m.load([a1,a2,a3,x1,x2,x3,x4,x5,bnd])
+
+        self.assertEqual(m.count_complexes(),3)
+        self.assertEqual(m.count('pAx'),4)
+        sizes = sorted(x['nodes'] for x in m.complex_stats().values())
+        self.assertEqual(sizes,[1,3,5])
+
+        # loaded complexes are updated by tokens as usual
+        x4.unset_molecule()
+        m.send_tokens([token_remove_edge(a3,'sites','molecule',x4)])
+        self.assertEqual(m.count_complexes(),4)
+        self.assertEqual(m.count('pAx'),3)
+        compositions = [x['composition'] for x in m.complex_stats().values()]
+        self.assertEqual(compositions.count({'X':1}),2)
+
+        # relations to nodes that are not loaded are left out
+        m = Matcher()
+        m.add_pattern(Pattern('pAx').add_node(A(id='a').add_sites(X(id='x'))))
+        m.load([a1,x1,x2])
+        self.assertEqual(m.count_complexes(),2)
+        self.assertEqual(m.count('pAx'),1)
+
+    def test_load_reversed_edge(self):
+        pAx = Pattern('pAx').add_node(A(id='a').add_sites(X(id='x')))
+        m = Matcher()
+        m.add_pattern(pAx)
+
+        a1,x1 = A(),X()
+        a1.add_sites(x1)
+        # edge given in the opposite order to edge tokens
+        m.load([a1,x1],edges=[(a1,'sites','molecule',x1)])
+        self.assertEqual(m.count_complexes(),1)
+        self.assertEqual(m.count('pAx'),1)
+
+        x1.unset_molecule()
+        m.send_tokens([token_remove_edge(a1,'sites','molecule',x1)])
+        self.assertEqual(m.count_complexes(),2)
+        self.assertEqual(m.count('pAx'),0)
+
+    def test_same_complex(self):
+        pS = Pattern('pS').add_node(A(id='a1')).add_node(A(id='a2')).add_expression('same_complex(a1,a2)')
+        pD = Pattern('pD').add_node(A(id='a1')).add_node(A(id='a2')).add_expression('!same_complex(a1,a2)')
+        m = Matcher()
+        for p in [pS,pD]:
+            m.add_pattern(p)
+
+        # two A-X molecules
+        a1,a2,x1,x2 = A(),A(),X(),X()
+        m.send_tokens([token_add_node(x) for x in [a1,a2,x1,x2]])
+        for a,x in [[a1,x1],[a2,x2]]:
+            x.molecule = a
+            m.send_tokens([token_add_edge(a,'sites','molecule',x)])
+        self.assertEqual(m.count('pS'),0)
+        self.assertEqual(m.count('pD'),2)
+
+        # bind them
+        bnd = Bond()
+        m.send_tokens([token_add_node(bnd)])
+        bnd.add_sites(x1,x2)
+        m.send_tokens([token_add_edge(bnd,'sites','bond',x1),token_add_edge(bnd,'sites','bond',x2)])
+        self.assertEqual(m.count('pS'),2)
+        self.assertEqual(m.count('pD'),0)
+        match = m.get_matches('pS',a1=a1)[0]
+        self.assertEqual(match['a2'],a2)
+        self.assertEqual(match,{'a1':a1,'a2':a2})
+
+        # unbind
+        x1.unset_bond()
+        m.send_tokens([token_remove_edge(bnd,'sites','bond',x1)])
+        self.assertEqual(m.count('pS'),0)
+        self.assertEqual(m.count('pD'),2)
+
+        with self.assertRaises(BuildError):
+            m.add_pattern(Pattern('pE').add_node(A(id='a1')).add_expression('same_complex(a1,b)'))
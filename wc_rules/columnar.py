@@ -0,0 +1,387 @@
+from .indexer import Slicer, ProxySlicer, BitSlicer, Indexer, has_foreign_keys, KeyUniverse, ChangeFeed, matches_fields, MISSING
+from . import utils
+import numpy as np
+import inspect
+import operator
+
+class MaskSlicer(ProxySlicer):
+    '''
+    A Slicer whose keys are stored as a boolean mask over the positions of a KeyUniverse.
+
+    Behaves like a Slicer (positive or negative, `[key]`, `in`, `len`, iteration, `&`, `|`, `~`),
+    and prints and compares like a Slicer with the same keys (see ProxySlicer).
+    With another MaskSlicer over the same universe, `&`, `|` and `~` are vectorized array operations.
+    BitSlicers over the same universe are unpacked into masks, and to_bitslicer() packs a mask back.
+    Any other slicer is first converted to a mask over this slicer's universe, and as for BitSlicer,
+    only add_keys adds keys to the universe.
+    Keys appended to the universe after the mask was made are simply not in the mask.
+    '''
+    def __init__(self,universe,mask=None,default=False):
+        super().__init__(default)
+        self.universe = universe
+        self.mask = mask if mask is not None else np.zeros(len(universe),dtype=bool)
+
+    def aligned(self,n):
+        # mask truncated or padded to the first n positions
+        if len(self.mask) >= n:
+            return self.mask[:n]
+        mask = np.zeros(n,dtype=bool)
+        mask[:len(self.mask)] = self.mask
+        return mask
+
+    def truth(self,n):
+        # positions mapped to True
+        return self.aligned(n) ^ self.default
+
+    def positions(self):
+        return np.flatnonzero(self.mask)
+
+    def __len__(self):
+        return int(np.count_nonzero(self.mask))
+
+    def __iter__(self):
+        return iter(self.universe.keys_at(self.positions()))
+
+    def keys(self):
+        return list(self)
+
+    def __contains__(self,key):
+        pos = self.universe.get(key)
+        return pos is not None and pos < len(self.mask) and bool(self.mask[pos])
+
+    def __getitem__(self,key):
+        return (key in self) != self.default
+
+    def copy(self):
+        return MaskSlicer(self.universe,self.mask.copy(),self.default)
+
+    def __reduce__(self):
+        return (MaskSlicer,(self.universe,self.mask,self.default))
+
+    def add_keys(self,keys):
+        positions = [self.universe.index(key) for key in keys]
+        self.mask = self.aligned(len(self.universe)).copy()
+        self.mask[positions] = True
+        return self
+
+    def delete_keys(self,keys):
+        positions = [self.universe.get(key) for key in keys]
+        positions = [pos for pos in positions if pos is not None and pos < len(self.mask)]
+        self.mask = self.mask.copy()
+        self.mask[positions] = False
+        return self
+
+    def coerce(self,other):
+        if isinstance(other,MaskSlicer) and other.universe is self.universe:
+            return other
+        if isinstance(other,BitSlicer) and other.universe is self.universe:
+            return MaskSlicer.from_bitslicer(other)
+        # keys that are not in the universe are left out
+        positions = [self.universe.get(key) for key in other.keys()]
+        mask = np.zeros(len(self.universe),dtype=bool)
+        mask[[pos for pos in positions if pos is not None]] = True
+        return MaskSlicer(self.universe,mask,other.default)
+
+    @classmethod
+    def from_bitslicer(cls,slicer):
+        n = len(slicer.universe)
+        data = np.frombuffer(slicer.bits.to_bytes((n+7)//8,'little'),dtype=np.uint8)
+        mask = np.unpackbits(data,bitorder='little')[:n].astype(bool)
+        return cls(slicer.universe,mask,slicer.default)
+
+    def to_bitslicer(self):
+        bits = int.from_bytes(np.packbits(self.mask,bitorder='little').tobytes(),'little')
+        return BitSlicer(self.universe,bits,self.default)
+
+    def combine(self,other,op,default):
+        if op(self.default,not other.default) != default and has_foreign_keys(self.universe,other):
+            # keys of other outside the universe are in the result
+            return op(Slicer(default=self.default).add_keys(self.keys()),other)
+        other = self.coerce(other)
+        n = len(self.universe)
+        truth = op(self.truth(n),other.truth(n))
+        return MaskSlicer(self.universe,truth ^ default,default)
+
+    def union(self,other):
+        if self.default != other.default:
+            raise utils.SlicerError('Cannot merge positive and negative slicers.')
+        if has_foreign_keys(self.universe,other):
+            return Slicer(default=self.default).add_keys(self.keys()).union(other)
+        n = len(self.universe)
+        return MaskSlicer(self.universe,self.aligned(n) | self.coerce(other).aligned(n),self.default)
+
+    def intersection(self,other):
+        if self.default != other.default:
+            raise utils.SlicerError('Cannot intersect positive and negative slicers.')
+        n = len(self.universe)
+        return MaskSlicer(self.universe,self.aligned(n) & self.coerce(other).aligned(n),self.default)
+
+    def __and__(self,other):
+        return self.combine(other,operator.and_,self.default and other.default)
+
+    def __or__(self,other):
+        return self.combine(other,operator.or_,self.default or other.default)
+
+    # Slicer & MaskSlicer also dispatches here, since MaskSlicer is a subclass
+    __rand__ = __and__
+    __ror__ = __or__
+
+    def __invert__(self):
+        return MaskSlicer(self.universe,self.mask.copy(),not self.default)
+
+class ColumnarIndexer(object):
+    '''
+    An indexer that stores values in a typed NumPy array instead of a dict.
+
+    Keys are mapped to positions by a KeyUniverse, and values live at those positions
+    in `array`, with `present` marking which positions hold a key.
+    Indexers created with the same universe, I1 = NumericColumnarIndexer(universe=U), are aligned,
+    so comparisons between them are vectorized.
+
+    Supports the same queries as Indexer, but returns MaskSlicers:
+    I[key], I[slice], key in I, I.update(dict), I.remove(keys), I.last_updated, I.flush(), I.changes
+    I == value, I == list_of_values, I == dict (partial keys), I == indexer, and likewise !=
+    I < value, I > value, I <= value, I >= value, and likewise with an indexer
+    I.slice(), I.slice(list_of_values), I.slice(function)
+    I.update_from_arrays(keys,values), I.remove_many(keys), I.sum(), I.mean(), I.value_counts()
+    Comparisons with indexers over other universes (or dict-based Indexers) go key by key.
+    Subsets share the value array with their parent, copy-on-write.
+    '''
+    primitive_type = None
+    dtype = None
+    # numpy dtype kinds accepted by update_from_arrays
+    kinds = ''
+
+    def __init__(self,universe=None):
+        self.universe = universe if universe is not None else KeyUniverse()
+        self.array = np.zeros(0,dtype=self.dtype)
+        self.present = np.zeros(0,dtype=bool)
+        self.n_keys = 0
+        self.last_updated = Slicer(default=False)
+        self.changes = ChangeFeed()
+        # array is shared with a subset or parent, and copied before writing
+        self.shared = False
+
+    # Internal methods
+    def reserve(self,n):
+        # grows the arrays to at least n positions
+        if n > len(self.present):
+            size = max(n,2*len(self.present),16)
+            array = np.zeros(size,dtype=self.dtype)
+            array[:len(self.array)] = self.array
+            present = np.zeros(size,dtype=bool)
+            present[:len(self.present)] = self.present
+            self.array,self.present = array,present
+            self.shared = False
+        return self
+
+    def own(self):
+        if self.shared:
+            self.array = self.array.copy()
+            self.shared = False
+        return self
+
+    def columns(self):
+        # (values,present) over the whole universe
+        n = len(self.universe)
+        self.reserve(n)
+        return self.array[:n],self.present[:n]
+
+    def position(self,key):
+        pos = self.universe.get(key)
+        if pos is not None and pos < len(self.present) and self.present[pos]:
+            return pos
+        return None
+
+    def value_is_compatible(self,value):
+        if self.primitive_type is not None:
+            if not isinstance(value,self.primitive_type):
+                raise utils.IndexerError('Value is not compatible with indexer type')
+        return True
+
+    def update_last_updated(self,keylist):
+        self.last_updated.add_keys(keylist)
+        return self
+
+    def selection(self,keylist,n):
+        # first n positions, selected by a list or slicer
+        if isinstance(keylist,Slicer):
+            return MaskSlicer(self.universe).coerce(keylist).truth(n)
+        keys = set(keylist) & self.universe.positions.keys()
+        return MaskSlicer(self.universe).add_keys(keys).truth(n)
+
+    # dict-like behavior
+    def __len__(self):
+        return self.n_keys
+
+    def __contains__(self,key):
+        return self.position(key) is not None
+
+    def __iter__(self):
+        return iter(self.universe.keys_at(np.flatnonzero(self.present)))
+
+    def keys(self):
+        return list(self)
+
+    def items(self):
+        positions = np.flatnonzero(self.present)
+        return list(zip(self.universe.keys_at(positions),self.array[positions].tolist()))
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __getitem__(self,key):
+        if isinstance(key,Slicer):
+            return self.subset(key)
+        pos = self.position(key)
+        if pos is None:
+            raise KeyError(key)
+        return self.array[pos].item()
+
+    # Methods available externally
+    def update(self,dict_obj):
+        return self.update_from_arrays(list(dict_obj.keys()),list(dict_obj.values()))
+
+    def remove(self,keylist):
+        return self.remove_many(keylist)
+
+    def update_from_arrays(self,keys,values):
+        # keys and values are sequences or arrays of the same length
+        # numpy keys are converted to Python values, as stored by update
+        if hasattr(keys,'tolist'):
+            keys = keys.tolist()
+        values = np.asarray(values)
+        if len(keys) != len(values):
+            raise utils.IndexerError('Keys and values must have the same length.')
+        if len(keys)==0:
+            return self
+        if values.dtype.kind not in self.kinds:
+            raise utils.IndexerError('Value is not compatible with indexer type')
+        positions = np.fromiter((self.universe.index(key) for key in keys),dtype=np.intp,count=len(keys))
+        # a key given more than once takes its last value
+        unique,last = np.unique(positions[::-1],return_index=True)
+        if len(unique) < len(positions):
+            keep = np.sort(len(positions) - 1 - last)
+            positions,values = positions[keep],values[keep]
+        self.reserve(len(self.universe))
+        existing = self.present[positions]
+        changed = ~existing | (self.array[positions] != values)
+        if not changed.any():
+            return self
+        self.own()
+        positions,values,existing = positions[changed],values[changed],existing[changed]
+        keys = self.universe.keys_at(positions)
+        if len(self.changes.cursors) > 0:
+            olds = [x if e else MISSING for x,e in zip(self.array[positions].tolist(),existing)]
+            for change in zip(keys,olds,values.tolist()):
+                self.changes.append(*change)
+        else:
+            self.changes.skip(len(keys))
+        self.n_keys += len(positions) - int(np.count_nonzero(existing))
+        self.array[positions] = values
+        self.present[positions] = True
+        return self.update_last_updated(keys)
+
+    def remove_many(self,keylist):
+        if hasattr(keylist,'tolist'):
+            keylist = keylist.tolist()
+        keys = [key for key in keylist if key in self]
+        if len(keys)==0:
+            return self
+        positions = [self.universe.get(key) for key in keys]
+        if len(self.changes.cursors) > 0:
+            for key,old in zip(keys,self.array[positions].tolist()):
+                self.changes.append(key,old,MISSING)
+        else:
+            self.changes.skip(len(keys))
+        self.present[positions] = False
+        self.n_keys -= len(keys)
+        return self.update_last_updated(keys)
+
+    # Aggregations
+    def sum(self):
+        values,present = self.columns()
+        return values[present].sum().item()
+
+    def mean(self):
+        if self.n_keys==0:
+            raise utils.IndexerError('Cannot take the mean of an empty indexer.')
+        return self.sum()/self.n_keys
+
+    def value_counts(self):
+        values,present = self.columns()
+        unique,counts = np.unique(values[present],return_counts=True)
+        return dict(zip(unique.tolist(),counts.tolist()))
+
+    def flush(self):
+        self.last_updated = Slicer(default=False)
+        return self
+
+    def subset(self,keylist,propagate=True):
+        values,present = self.columns()
+        I = type(self)(universe=self.universe)
+        # subsets share the array until either side writes to it
+        I.array = values
+        I.shared = self.shared = True
+        I.present = present & self.selection(keylist,len(present))
+        I.n_keys = int(np.count_nonzero(I.present))
+        if propagate==True:
+            I.update_last_updated(self.last_updated.keys())
+        return I
+
+    def slice(self,value_list=None):
+        values,present = self.columns()
+        if value_list is None:
+            return MaskSlicer(self.universe,present.copy())
+        if inspect.isfunction(value_list):
+            f = value_list
+            value_list = [x for x in np.unique(values[present]).tolist() if f(x)]
+        return MaskSlicer(self.universe,present & np.isin(values,value_list))
+
+    def compare(self,other,op):
+        values,present = self.columns()
+        if isinstance(other,ColumnarIndexer) and other.universe is self.universe:
+            other_values,other_present = other.columns()
+            return MaskSlicer(self.universe,present & other_present & op(values,other_values))
+        if isinstance(other,(Indexer,ColumnarIndexer)):
+            keys = (key for key in self if key in other and op(self[key],other[key]))
+            return MaskSlicer(self.universe).add_keys(keys)
+        if isinstance(other,self.primitive_type):
+            return MaskSlicer(self.universe,present & op(values,other))
+        raise utils.IndexerError('To compare, use two Indexers, or an indexer and a compatible value.')
+
+    def __eq__(self,other):
+        if isinstance(other,list):
+            return self.slice(other)
+        if isinstance(other,dict) and not isinstance(other,Indexer):
+            keys = (key for key in self if matches_fields(key,other))
+            return MaskSlicer(self.universe).add_keys(keys)
+        return self.compare(other,operator.eq)
+
+    def __ne__(self,other):
+        return ~self.__eq__(other)
+
+    __hash__ = None
+
+    def __lt__(self,other):
+        return self.compare(other,operator.lt)
+
+    def __gt__(self,other):
+        return self.compare(other,operator.gt)
+
+    def __le__(self,other):
+        return self.compare(other,operator.le)
+
+    def __ge__(self,other):
+        return self.compare(other,operator.ge)
+
+class BooleanColumnarIndexer(ColumnarIndexer):
+    primitive_type = bool
+    dtype = np.bool_
+    kinds = 'b'
+
+class NumericColumnarIndexer(ColumnarIndexer):
+    # values are stored as float64, so ints come back as floats
+    primitive_type = (int,float,)
+    dtype = np.float64
+    kinds = 'biuf'
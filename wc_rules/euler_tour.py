@@ -1,53 +1,380 @@
-from blist import blist
 from .utils import generate_id, AddError
 from .indexer import SetLike, DictLike
+from .species import SpeciesTable
+from collections import Counter
 import random
 
+# Seed for treap priorities
+# To modify this seed, load euler_tour module, then execute euler_tour.priority_gen.seed(<new_seed>)
+priority_gen = random.Random()
+priority_gen.seed(0)
+
+###### Treap ######
+# An Euler tour is stored as the in-order sequence of a treap (randomized balanced BST).
+# Each element of the tour is a TreapNode, which doubles as an occurrence handle:
+# given a handle, its position and the root of its treap are found in O(log n) using parent pointers.
+# The root of each treap holds a reference to the EulerTour that owns it.
+# Handles also carry 'tree' and 'spare' marks, which are counted over subtrees
+# so that marked handles in a tour can be found in O(k log n).
+
+class TreapNode(object):
+    __slots__ = ('value','priority','left','right','parent','size','tour',
+        'tree_mark','spare_mark','tree_marked','spare_marked')
+
+    def __init__(self,value):
+        self.value = value
+        self.priority = priority_gen.random()
+        self.left = None
+        self.right = None
+        self.parent = None
+        self.size = 1
+        self.tour = None
+        self.tree_mark = 0
+        self.spare_mark = 0
+        self.tree_marked = 0
+        self.spare_marked = 0
+
+def treap_size(t):
+    return t.size if t is not None else 0
+
+def treap_update(t):
+    size,tree,spare = 1,t.tree_mark,t.spare_mark
+    for x in (t.left,t.right):
+        if x is not None:
+            size += x.size
+            tree += x.tree_marked
+            spare += x.spare_marked
+    t.size,t.tree_marked,t.spare_marked = size,tree,spare
+    return t
+
+def treap_refresh(h):
+    # recomputes subtree counts from h up to the root
+    while h is not None:
+        treap_update(h)
+        h = h.parent
+
+def _merge(a,b):
+    if a is None: return b
+    if b is None: return a
+    if a.priority > b.priority:
+        a.right = _merge(a.right,b)
+        a.right.parent = a
+        return treap_update(a)
+    b.left = _merge(a,b.left)
+    b.left.parent = b
+    return treap_update(b)
+
+def _split(t,k):
+    if t is None:
+        return None,None
+    if treap_size(t.left) >= k:
+        l,r = _split(t.left,k)
+        t.left = r
+        if r is not None: r.parent = t
+        if l is not None: l.parent = None
+        return l,treap_update(t)
+    l,r = _split(t.right,k - treap_size(t.left) - 1)
+    t.right = l
+    if l is not None: l.parent = t
+    if r is not None: r.parent = None
+    return treap_update(t),r
+
+def treap_merge(*treaps):
+    # concatenates treaps in order, returns the new root
+    root = None
+    for t in treaps:
+        root = _merge(root,t)
+    if root is not None:
+        root.parent = None
+    return root
+
+def treap_split(t,k):
+    # splits treap into the first k elements and the rest
+    l,r = _split(t,k)
+    for x in [l,r]:
+        if x is not None:
+            x.parent = None
+    return l,r
+
+def treap_root(h):
+    while h.parent is not None:
+        h = h.parent
+    return h
+
+def treap_index(h):
+    i = treap_size(h.left)
+    while h.parent is not None:
+        if h is h.parent.right:
+            i += treap_size(h.parent.left) + 1
+        h = h.parent
+    return i
+
+def treap_kth(t,k):
+    while t is not None:
+        n = treap_size(t.left)
+        if k < n:
+            t = t.left
+        elif k == n:
+            return t
+        else:
+            k,t = k - n - 1,t.right
+    raise IndexError('Tour index out of range.')
+
+def treap_next(h):
+    # in-order successor
+    if h.right is not None:
+        h = h.right
+        while h.left is not None:
+            h = h.left
+        return h
+    while h.parent is not None and h is h.parent.right:
+        h = h.parent
+    return h.parent
+
+def treap_iter(t):
+    stack = []
+    while stack or t is not None:
+        if t is not None:
+            stack.append(t)
+            t = t.left
+        else:
+            t = stack.pop()
+            yield t
+            t = t.right
+
+def treap_iter_marked(t,kind):
+    # yields handles carrying a mark of kind 'tree' or 'spare', skipping unmarked subtrees
+    mark,marked = kind + '_mark',kind + '_marked'
+    stack = [t]
+    while stack:
+        t = stack.pop()
+        if t is None or getattr(t,marked)==0:
+            continue
+        if getattr(t,mark):
+            yield t
+        stack.extend([t.right,t.left])
+
+def treap_build(handles):
+    # builds a treap from a sequence of TreapNodes in O(n) (Cartesian tree on priorities)
+    stack = []
+    for node in handles:
+        last = None
+        while stack and stack[-1].priority < node.priority:
+            last = stack.pop()
+        node.left = last
+        if last is not None: last.parent = node
+        if stack:
+            stack[-1].right = node
+            node.parent = stack[-1]
+        stack.append(node)
+    if not stack:
+        return None
+    root = stack[0]
+    root.parent = None
+    # compute sizes bottom-up
+    order = []
+    stack = [root]
+    while stack:
+        t = stack.pop()
+        order.append(t)
+        stack.extend(x for x in [t.left,t.right] if x is not None)
+    for t in reversed(order):
+        treap_update(t)
+    return root
+
+###### Occurrences ######
+class OccurrenceMap(object):
+    # Maps each node to the set of its occurrence handles in a forest of tours.
+    # One handle per node is active: it carries the node's marks.
+    # When the active handle is deleted, its marks move to another occurrence of the node.
+    def __init__(self):
+        self._handles = dict()
+        self._active = dict()
+
+    def __contains__(self,node):
+        return node in self._handles
+
+    def __len__(self):
+        return len(self._handles)
+
+    def __getitem__(self,node):
+        return self._handles[node]
+
+    def get(self,node,default=None):
+        return self._handles.get(node,default)
+
+    def items(self):
+        return self._handles.items()
+
+    def add(self,h):
+        node = h.value
+        if node not in self._handles:
+            self._handles[node] = set()
+            self._active[node] = h
+        self._handles[node].add(h)
+        return self
+
+    def remove(self,h):
+        node = h.value
+        handles = self._handles[node]
+        handles.remove(h)
+        if len(handles)==0:
+            del self._handles[node]
+            del self._active[node]
+        elif self._active[node] is h:
+            new = next(iter(handles))
+            self._active[node] = new
+            if h.tree_mark or h.spare_mark:
+                new.tree_mark,new.spare_mark = h.tree_mark,h.spare_mark
+                h.tree_mark,h.spare_mark = 0,0
+                treap_refresh(new)
+        return self
+
+    def active(self,node):
+        return self._active[node]
+
+    def pop(self,node):
+        self._active.pop(node)
+        return self._handles.pop(node)
+
+    def update(self,other):
+        for node,handles in other._handles.items():
+            assert node not in self._handles
+            self._handles[node] = handles
+            self._active[node] = other._active[node]
+        return self
+
+    def set_mark(self,node,kind,value):
+        h = self._active[node]
+        setattr(h,kind + '_mark',value)
+        treap_refresh(h)
+        return self
+
+###### Euler Tours ######
+# id of a tour that will get its id from an EulerTourIndex
+NO_ID = -1
+
+def node_class(node):
+    return node.__class__.__name__
+
 class EulerTour(object):
-    def __init__(self,id=None,iterable=None,edges=None,spares=None):
+    # The tour is a sequence of nodes, stored in a treap.
+    # _occurrences is an OccurrenceMap from each node to its TreapNodes (occurrence handles).
+    # Tours in an EulerTourIndex share the index's _occurrences.
+    def __init__(self,id=None,iterable=None,edges=None,spares=None,occurrences=None):
         self.id = id if id is not None else generate_id()
-        self._tour = blist(iterable) if iterable is not None else blist()
+        self._occurrences = occurrences if occurrences is not None else OccurrenceMap()
+        self._root = None
+        # number of nodes of each class, maintained by EulerTourIndex on link and cut
+        self._composition = Counter()
+        # species of the tour, set by EulerTourIndex.get_species_counts, None if stale
+        self._species = None
+        if iterable is not None:
+            iterable = list(iterable)
+            self.set_root(treap_build([self.new_occurrence(x) for x in iterable]))
+            self._composition.update(node_class(x) for x in set(iterable))
         self._edges = set(edges) if edges is not None else set()
         self._spares = set(spares) if spares is not None else set()
 
     # Magic methods
     def __contains__(self,node):
-        return node in self._tour
+        handles = self._occurrences.get(node)
+        if not handles:
+            return False
+        return treap_root(next(iter(handles))) is self._root
 
     def __len__(self):
-        return len(self._tour)
+        return treap_size(self._root)
+
+    def __iter__(self):
+        return (x.value for x in treap_iter(self._root))
 
     def __str__(self):
-        return ' '.join([x.id for x in self._tour]+['spares =',str(len(self._spares))])
+        return ' '.join([x.id for x in self]+['spares =',str(len(self._spares))])
 
     def __getitem__(self,key):
-        return self._tour[key]
+        if isinstance(key,slice):
+            return list(self)[key]
+        if key < 0:
+            key += len(self)
+        return treap_kth(self._root,key).value
+
+    @property
+    def _tour(self):
+        return list(self)
 
     # Access methods
     def get_nodes(self):
-        return set(self._tour)
+        return set(self)
+
+    # Aggregates, O(1) except composition, which is O(number of classes)
+    def count_nodes(self):
+        return (len(self)+1)//2
+
+    def count_spares(self):
+        return len(self._spares)
+
+    def get_composition(self):
+        return dict(self._composition)
+
+    def get_stats(self):
+        return dict(nodes=self.count_nodes(),spares=self.count_spares(),composition=self.get_composition())
+
+    def set_root(self,root):
+        self._root = root
+        if root is not None:
+            root.parent = None
+            root.tour = self
+        return self
+
+    # Occurrence handles
+    def new_occurrence(self,node):
+        h = TreapNode(node)
+        self._occurrences.add(h)
+        return h
+
+    def delete_occurrence(self,h):
+        self._occurrences.remove(h)
+        return self
+
+    def iter_marked(self,kind):
+        # yields nodes of this tour marked 'tree' or 'spare'
+        return (h.value for h in treap_iter_marked(self._root,kind))
+
+    def get_occurrences(self,node):
+        if node in self:
+            return self._occurrences[node]
+        return set()
 
     # Search methods
     def first_occurrence(self,node):
         if node in self:
-            return self._tour.index(node)
+            return min(treap_index(h) for h in self._occurrences[node])
         return None
+
     def last_occurrence(self,node):
         if node in self:
-            for i,x in reversed(list(enumerate(self._tour))):
-                if x==node:
-                    return i
+            return max(treap_index(h) for h in self._occurrences[node])
         return None
 
     def find_sequence(self,sequence):
-        for i in range(len(self)-len(sequence)+1):
-            if self._tour[i:i+len(sequence)]==sequence:
-                return i
-        return None
+        # checks each occurrence of sequence[0] and walks forward, O(d*k*log n)
+        # where d is the number of occurrences of sequence[0]
+        indices = []
+        for h in self.get_occurrences(sequence[0]):
+            x = h
+            for node in sequence[1:]:
+                x = treap_next(x)
+                if x is None or x.value != node:
+                    break
+            else:
+                indices.append(treap_index(h))
+        if len(indices)==0:
+            return None
+        return min(indices)
 
     # Basic modifications
     def reroot(self,node1,node2=None):
-        # tour is a blist
         i = None
         if node2 is None:
             i= self.first_occurrence(node1)
@@ -58,8 +385,14 @@ class EulerTour(object):
         return self
 
     def rotate(self,i):
-        tour = self._tour
-        self._tour = tour[i:] + tour[1:i] + [tour[i]]
+        # tour[i:] + tour[1:i] + [tour[i]]
+        if i==0:
+            return self
+        left,right = treap_split(self._root,i)
+        first,left = treap_split(left,1)
+        self.delete_occurrence(first)
+        last = self.new_occurrence(treap_kth(right,0).value)
+        self.set_root(treap_merge(right,left,last))
         return self
 
     def add_spares(self,spares):
@@ -83,24 +416,132 @@ class EulerTour(object):
         return self
 
 class EulerTourIndex(SetLike):
+    # Dynamic connectivity with levelled edges (Holm, de Lichtenberg & Thorup).
+    # Every edge has a level, which only increases. Tree edges of level >= i form forest F_i,
+    # so F_0 (the tours in this index) contains F_1, which contains F_2, etc.
+    # Forests F_i for i>=1 are kept as Euler tours over their own OccurrenceMap in _forests[i].
+    # Each node is marked in F_i if it has a tree (or spare) edge of level i,
+    # and _tree_adjacency[i]/_spare_adjacency[i] map the node to those edges.
+    # When a tree edge is cut, edges on the smaller side are pushed up a level while searching
+    # for a replacement, which bounds the work per edge by its number of levels.
     def __init__(self):
         super().__init__()
-        self._tourmap = dict()
-
-    def remap_nodes(self,nodes,new_tour=None):
-        for node in nodes:
-            if new_tour is not None:
-                self._tourmap[node] = new_tour
-            else:
-                self._tourmap.pop(node)
-        return self
+        self._occurrences = OccurrenceMap()
+        self._levels = dict()
+        # number of times each edge was linked, a repeated link only counts up
+        # and the edge is cut when the count goes back to zero
+        self._edge_counts = dict()
+        self._forests = [self._occurrences]
+        self._tree_adjacency = [dict()]
+        self._spare_adjacency = [dict()]
+        # species are computed lazily, for tours that changed since the last count
+        self._species = SpeciesTable()
+        self._stale = set()
+        self._free_ids = []
+        self._next_id = 0
+        # empty tours left over from links, reused by cuts and new forest tours
+        self._empty_tours = []
+        # add-only mode, see set_add_only
+        self._add_only = False
+        self._uf_parent = dict()
+        self._pending = dict()
 
     def get_mapped_tour(self,node):
-        return self._tourmap.get(node,None)
+        # O(log n): walk from any occurrence of node to the root of its treap
+        if node in self._uf_parent:
+            self.materialize(node)
+        handles = self._occurrences.get(node)
+        if not handles:
+            return None
+        return treap_root(next(iter(handles))).tour
+
+    def has_node(self,node):
+        return node in self._occurrences or node in self._uf_parent
+
+    def count_complexes(self):
+        return len(self) + len(self._pending)
 
     def get_list_of_complexes(self):
+        self.materialize_all()
         return [str(x) for x in self]
 
+    def get_complex_stats(self):
+        # {tour_id:{'nodes':n,'spares':n,'composition':{classname:n}}}
+        self.materialize_all()
+        return {x.id:x.get_stats() for x in self}
+
+    # Add-only mode
+    # While only links happen, new nodes and the components they join are tracked
+    # with union-find (path compression, union by size) instead of Euler tours.
+    # A pending component keeps a list of its nodes and edges, and is built into
+    # an Euler tour (build_from_graph) only when a tour is needed, e.g., on its first cut.
+    # When a pending component is linked to a tour, the smaller of the two changes over:
+    # a smaller pending component is built and linked into the tour,
+    # a smaller tour is turned back into a pending component (dematerialize).
+    def set_add_only(self,on=True):
+        if not on:
+            self.materialize_all()
+        self._add_only = on
+        return self
+
+    def find(self,node):
+        parent = self._uf_parent
+        root = node
+        while parent[root] is not root:
+            root = parent[root]
+        while parent[node] is not root:
+            parent[node],node = root,parent[node]
+        return root
+
+    def add_pending(self,nodes,edges):
+        root = nodes[0]
+        for node in nodes:
+            self._uf_parent[node] = root
+        self._pending[root] = (nodes,edges)
+        return root
+
+    def union(self,edge):
+        root1,root2 = self.find(edge[0]),self.find(edge[3])
+        if root1 is not root2:
+            if len(self._pending[root1][0]) < len(self._pending[root2][0]):
+                root1,root2 = root2,root1
+            nodes,edges = self._pending.pop(root2)
+            self._uf_parent[root2] = root1
+            self._pending[root1][0].extend(nodes)
+            self._pending[root1][1].extend(edges)
+        self._pending[root1][1].append(edge)
+        return self
+
+    def dematerialize(self,tour):
+        # turns a tour into a pending component, O(size of tour)
+        nodes = list(tour.get_nodes())
+        edges = list(tour._edges) + list(tour._spares)
+        self.remove_tour(tour)
+        for edge in edges:
+            level = self._levels.pop(edge)
+            for adjacency in [self._tree_adjacency[level],self._spare_adjacency[level]]:
+                for node in set([edge[0],edge[3]]):
+                    if edge in adjacency.get(node,()):
+                        adjacency[node].remove(edge)
+                        if len(adjacency[node])==0:
+                            del adjacency[node]
+        for node in nodes:
+            for forest in self._forests:
+                if node in forest:
+                    forest.pop(node)
+        return self.add_pending(nodes,edges)
+
+    def materialize(self,node):
+        nodes,edges = self._pending.pop(self.find(node))
+        for x in nodes:
+            del self._uf_parent[x]
+        return self.build_tours(nodes,edges)
+
+    def materialize_all(self):
+        while self._pending:
+            self.materialize(next(iter(self._pending)))
+        return self
+
     def is_connected(self,nodelist):
         tours = [self.get_mapped_tour(x) for x in nodelist]
         return None not in tours and tours[1:]==tours[:-1]
@@ -128,37 +569,204 @@ class EulerTourIndex(SetLike):
             second = x[0].id
         return [first,second]
 
+    # Tour ids
+    # tours in the index get small integer ids, which are reused after a tour is removed
+    def new_tour_id(self):
+        if self._free_ids:
+            return self._free_ids.pop()
+        self._next_id += 1
+        return self._next_id - 1
+
+    # Empty tours
+    # the split-off side of a cut needs a tour object, which a replacement edge links back right away,
+    # so emptied tours that nothing else refers to are kept and reused instead of allocating new ones
+    def empty_tour(self,id,occurrences):
+        if self._empty_tours:
+            tour = self._empty_tours.pop()
+            tour.id = id
+            tour._occurrences = occurrences
+            return tour
+        return EulerTour(id,occurrences=occurrences)
+
+    def recycle(self,tour):
+        assert tour._root is None
+        tour._edges.clear()
+        tour._spares.clear()
+        tour._composition.clear()
+        tour._species = None
+        self._empty_tours.append(tour)
+        return self
+
     # Simple add and remove
     def add_tour(self,tour):
         assert tour not in self
+        tour.id = self.new_tour_id()
         self.add(tour)
+        self._stale.add(tour)
         return self
 
     def remove_tour(self,tour):
         assert tour in self
+        self.invalidate(tour)
+        self._stale.discard(tour)
         self.remove(tour)
+        self._free_ids.append(tour.id)
         return self
 
+    # Species
+    def invalidate(self,tour):
+        # called whenever a tour's structure (or the attributes of its nodes) changes
+        if tour._species is not None:
+            self._species.remove(tour._species)
+            tour._species = None
+        self._stale.add(tour)
+        return self
+
+    def invalidate_node(self,node):
+        if node in self._uf_parent:
+            # pending components are classified when they are built
+            return self
+        return self.invalidate(self.get_mapped_tour(node))
+
+    def get_species(self,tour):
+        if tour._species is None:
+            tour._species = self._species.classify(tour.get_nodes(),tour._edges | tour._spares)
+            self._species.add(tour._species)
+            self._stale.discard(tour)
+        return tour._species
+
+    def get_species_counts(self):
+        # {species:number of complexes}, see species.SpeciesTable
+        self.materialize_all()
+        for tour in list(self._stale):
+            self.get_species(tour)
+        return self._species.get_counts()
+
     # Add/Remove and update
+    def adopt_occurrences(self,tour):
+        # moves the occurrence handles of a tour built elsewhere into the index
+        if tour._occurrences is not self._occurrences:
+            self._occurrences.update(tour._occurrences)
+            tour._occurrences = self._occurrences
+        return self
+
     def add_new_tour(self,tour):
         self.add_tour(tour)
-        self.remap_nodes(tour.get_nodes(),tour)
+        self.adopt_occurrences(tour)
         return self
 
     def delete_existing_tour(self,tour):
         self.remove_tour(tour)
-        self.remap_nodes(tour.get_nodes())
+        for node in tour.get_nodes():
+            self._occurrences.pop(node)
+            # a node without edges is at most a singleton in higher forests
+            for forest in self._forests[1:]:
+                if node in forest:
+                    forest.pop(node)
         return self
 
     # Creating new tours from singleton nodes
     def create_new_tour_from_node(self,node):
         if type(node) not in [int,float,str]:
             assert len(node.get_nonempty_related_attributes())==0
-        assert self.get_mapped_tour(node) is None
-        t = EulerTour(None,[node])
+        assert not self.has_node(node)
+        if self._add_only:
+            self.add_pending([node],[])
+            return self
+        t = EulerTour(NO_ID,[node],occurrences=self._occurrences)
         self.add_new_tour(t)
         return self
 
+    # Bulk loading
+    # Builds tours for a graph of new nodes in O((n+m) alpha(n)):
+    # union-find picks a spanning forest (other edges become spares),
+    # one DFS per component writes its Euler tour, which is built into a treap in O(n)
+    # repeated edges are counted as repeated links
+    def build_from_graph(self,nodes,edges):
+        unique = []
+        for edge in edges:
+            count = self._edge_counts.get(edge,0)
+            self._edge_counts[edge] = count + 1
+            if count==0:
+                unique.append(edge)
+        return self.build_tours(nodes,unique)
+
+    def build_tours(self,nodes,edges):
+        nodes = list(nodes)
+        edges = list(edges)
+        parent = dict()
+        size = dict()
+        for node in nodes:
+            assert not self.has_node(node)
+            parent[node] = node
+            size[node] = 1
+
+        def find(x):
+            root = x
+            while parent[root] is not root:
+                root = parent[root]
+            while parent[x] is not root:
+                parent[x],x = root,parent[x]
+            return root
+
+        children = {node:[] for node in nodes}
+        spares = []
+        for edge in edges:
+            u,v = find(edge[0]),find(edge[3])
+            if u is v:
+                spares.append(edge)
+                continue
+            if size[u] < size[v]:
+                u,v = v,u
+            parent[v] = u
+            size[u] += size[v]
+            children[edge[0]].append((edge[3],edge))
+            children[edge[3]].append((edge[0],edge))
+
+        tours = dict()
+        handles = dict()
+        visited = set()
+        for start in nodes:
+            if start in visited:
+                continue
+            tour = EulerTour(NO_ID,occurrences=self._occurrences)
+            sequence = [tour.new_occurrence(start)]
+            visited.add(start)
+            tour._composition[node_class(start)] += 1
+            stack = [(start,iter(children[start]))]
+            while stack:
+                for child,edge in stack[-1][1]:
+                    if child not in visited:
+                        visited.add(child)
+                        tour._composition[node_class(child)] += 1
+                        tour._edges.add(edge)
+                        sequence.append(tour.new_occurrence(child))
+                        stack.append((child,iter(children[child])))
+                        break
+                else:
+                    stack.pop()
+                    if stack:
+                        sequence.append(tour.new_occurrence(stack[-1][0]))
+            tours[find(start)] = tour
+            handles[tour] = sequence
+        for edge in spares:
+            tours[find(edge[0])]._spares.add(edge)
+
+        # level-0 adjacency and marks are set before the treaps compute their counts
+        for is_tree,edgelist in [(True,[e for t in tours.values() for e in t._edges]),(False,spares)]:
+            adjacency = self._tree_adjacency[0] if is_tree else self._spare_adjacency[0]
+            for edge in edgelist:
+                self._levels[edge] = 0
+                for node in set([edge[0],edge[3]]):
+                    if node not in adjacency:
+                        adjacency[node] = set()
+                        setattr(self._occurrences.active(node),'tree_mark' if is_tree else 'spare_mark',1)
+                    adjacency[node].add(edge)
+        for tour,sequence in handles.items():
+            tour.set_root(treap_build(sequence))
+            self.add_tour(tour)
+        return self
+
     def delete_existing_tour_from_node(self,node):
         if type(node) not in [int,float,str]:
             assert len(node.get_nonempty_related_attributes())==0
@@ -166,23 +774,37 @@ class EulerTourIndex(SetLike):
         self.delete_existing_tour(t)
         return self
 
-    # Basic link: t1,t2 --> t
+    # Basic link: t1,t2 --> t1
+    # O(log n) treap operations, in place: t1 takes the merged tour and t2 is left empty
     def link(self,t1,t2,u,v):
+        if t2._occurrences is not t1._occurrences:
+            t1._occurrences.update(t2._occurrences)
+            t2._occurrences = t1._occurrences
         t1.reroot(u)
         t2.reroot(v)
-        return EulerTour(None,t1._tour + t2._tour + [u])
-
-    #Basic cut: t-->t1,t2
+        last = t1.new_occurrence(u)
+        t1.set_root(treap_merge(t1._root,t2._root,last))
+        t2._root = None
+        return t1
+
+    #Basic cut: t-->t,t2
+    # O(log n) treap operations, in place: t keeps the bigger part, an empty tour takes the other
+    # the other tour borrows t's id until it is added to an index
     def cut(self,t,u,v):
         t.reroot(u,v)
         assert u in t and v in t
         v2 = t.last_occurrence(v)
-        inner = t._tour[1:v2+1]
-        outer = t._tour[v2+1:]
-        assert inner[0] == inner[-1] == v
-        assert outer[0] == outer[-1] == u
-        sorted_tours = [EulerTour(None,x) for x in self.sort_tours([inner,outer])]
-        return sorted_tours
+        first,rest = treap_split(t._root,1)
+        t.delete_occurrence(first)
+        inner,outer = treap_split(rest,v2)
+        t.set_root(inner)
+        other = self.empty_tour(t.id,t._occurrences).set_root(outer)
+        assert t[0] == t[-1] == v
+        assert other[0] == other[-1] == u
+        if self.sort_tours([t,other])[0] is other:
+            t.set_root(outer)
+            other.set_root(inner)
+        return t,other
 
     def find_edge(self,node1,node2):
         x1 = self.get_mapped_tour(node1)
@@ -192,77 +814,190 @@ class EulerTourIndex(SetLike):
             return [x1]
         return [x1,x2]
 
+    # Levels
+    def add_level(self):
+        self._forests.append(OccurrenceMap())
+        self._tree_adjacency.append(dict())
+        self._spare_adjacency.append(dict())
+        return self
+
+    def get_level(self,edge):
+        return self._levels[edge]
+
+    def forest_tour(self,level,node):
+        # tour of node in F_level, higher forests get singleton tours on demand
+        if level==0:
+            return self.get_mapped_tour(node)
+        forest = self._forests[level]
+        handles = forest.get(node)
+        if not handles:
+            tour = self.empty_tour(level,forest)
+            return tour.set_root(tour.new_occurrence(node))
+        return treap_root(next(iter(handles))).tour
+
+    def forest_link(self,level,node1,node2):
+        t1,t2 = self.forest_tour(level,node1),self.forest_tour(level,node2)
+        self.link(t1,t2,node1,node2)
+        self.recycle(t2)
+        return self
+
+    def forest_cut(self,level,node1,node2):
+        self.cut(self.forest_tour(level,node1),node1,node2)
+        return self
+
+    def add_adjacency(self,edge,level,is_tree):
+        while len(self._forests) <= level:
+            self.add_level()
+        adjacency = (self._tree_adjacency if is_tree else self._spare_adjacency)[level]
+        kind = 'tree' if is_tree else 'spare'
+        self._levels[edge] = level
+        for node in set([edge[0],edge[3]]):
+            if node not in adjacency:
+                adjacency[node] = set()
+                self.forest_tour(level,node)
+                self._forests[level].set_mark(node,kind,1)
+            adjacency[node].add(edge)
+        return self
+
+    def remove_adjacency(self,edge,is_tree):
+        level = self._levels.pop(edge)
+        adjacency = (self._tree_adjacency if is_tree else self._spare_adjacency)[level]
+        kind = 'tree' if is_tree else 'spare'
+        for node in set([edge[0],edge[3]]):
+            adjacency[node].remove(edge)
+            if len(adjacency[node])==0:
+                del adjacency[node]
+                self._forests[level].set_mark(node,kind,0)
+        return level
+
+    def incident_edges(self,nodes,is_tree):
+        # edges (of any level) with an endpoint in nodes
+        edges = set()
+        for adjacency in (self._tree_adjacency if is_tree else self._spare_adjacency):
+            for node in nodes:
+                if node in adjacency:
+                    edges.update(adjacency[node])
+        return edges
+
+    def find_replacement(self,level,node1,node2):
+        # node1 and node2 have just been separated in F_level
+        # returns a level-`level` spare reconnecting them, or None
+        small = min(self.forest_tour(level,node1),self.forest_tour(level,node2),key=len)
+        # tree edges of the smaller tree move up a level
+        for node in list(small.iter_marked('tree')):
+            for edge in list(self._tree_adjacency[level].get(node,())):
+                self.remove_adjacency(edge,is_tree=True)
+                self.add_adjacency(edge,level+1,is_tree=True)
+                self.forest_link(level+1,edge[0],edge[3])
+        # spares leaving the smaller tree are replacements, the others move up a level
+        for node in list(small.iter_marked('spare')):
+            for edge in list(self._spare_adjacency[level].get(node,())):
+                other = edge[3] if edge[0]==node else edge[0]
+                self.remove_adjacency(edge,is_tree=False)
+                if other not in small:
+                    return edge
+                self.add_adjacency(edge,level+1,is_tree=False)
+        return None
+
     # Augmented link
+    # if edge was linked before, only count it
     # if edge in t, add edge to t._spares
     # if edge not in t, do link and update
     def auglink(self,edge):
         node1,attr1,attr2,node2 = edge
+        count = self._edge_counts.get(edge,0)
+        self._edge_counts[edge] = count + 1
+        if count > 0:
+            return self
+        if self._add_only and (node1 in self._uf_parent or node2 in self._uf_parent):
+            if node1 in self._uf_parent and node2 in self._uf_parent:
+                return self.union(edge)
+            # a pending component meets a tour: the smaller side joins the bigger one,
+            # so a node changes representation only when its component at least doubles
+            pending,built = (node1,node2) if node1 in self._uf_parent else (node2,node1)
+            tour = self.get_mapped_tour(built)
+            if len(self._pending[self.find(pending)][0]) < tour.count_nodes():
+                self.materialize(pending)
+            else:
+                self.dematerialize(tour)
+                return self.union(edge)
         tours = self.find_edge(node1,node2)
         if len(tours)==1:
             tours[0].add_spares([edge])
+            self.invalidate(tours[0])
+            self.add_adjacency(edge,0,is_tree=False)
             return self
         big,small = self.sort_tours(tours)
         if big !=tours[0]:
             node1,node2 = node2,node1
 
-        t = self.link(big,small,node1,node2)
+        self.link(big,small,node1,node2)
 
         # Update step
-        big._tour = t._tour
-        big.add_edges(small._edges | set([edge]))
-        big.add_spares(small._spares)
-        self.remap_nodes(small.get_nodes(),big)
+        # no remapping required, nodes find their tour through the treap root
+        big._edges.update(small._edges)
+        big._edges.add(edge)
+        big._spares.update(small._spares)
+        self.invalidate(big)
+        big._composition.update(small._composition)
         self.remove_tour(small)
+        self.add_adjacency(edge,0,is_tree=True)
         return self
 
     # Augmented cut
+    # if edge was linked more times than cut, only count it
     # if edge in t._spares, simply remove
-    # if edge in t._edges, do cut--> t1,t2
-    #      if exists spanning edge in t._spares, remerge t1,t2
+    # if edge in t._edges, do cut--> t1,t2 in every forest up to the edge's level
+    #      search levels from the top down for a spare reconnecting t1,t2, remerge if found
     #      else return t1,t2
     def augcut(self,edge):
         node1,attr1,attr2,node2 = edge
+        count = self._edge_counts.pop(edge)
+        if count > 1:
+            self._edge_counts[edge] = count - 1
+            return self
         tour = self.find_edge(node1,node2)[0]
+        self.invalidate(tour)
         if edge in tour._spares:
             tour.remove_spares([edge])
+            self.remove_adjacency(edge,is_tree=False)
             return self
+        level = self.remove_adjacency(edge,is_tree=True)
         big,small = self.cut(tour,node1,node2)
-        if len(tour._spares)!=0:
-            # pop a spare, remerge
-            for spare in tour._spares:
-                new_tour = None
-                if spare[0] in big and spare[3] in small:
-                    new_tour = self.link(big,small,spare[0],spare[3])
-                if spare[3] in big and spare[0] in small:
-                    new_tour = self.link(big,small,spare[3],spare[0])
-                if new_tour is not None:
-                    # Update step
-                    tour._tour = new_tour._tour
-                    tour.remove_spares([spare])
-                    tour.remove_edges([edge])
-                    tour.add_edges([spare])
-                    # no remapping required
-                    return self
-                # if you're here, then no available spare to re-merge
+        assert big is tour
+        for i in range(1,level+1):
+            self.forest_cut(i,node1,node2)
+
+        for i in reversed(range(level+1)):
+            spare = self.find_replacement(i,node1,node2)
+            if spare is not None:
+                self.add_adjacency(spare,i,is_tree=True)
+                for j in range(1,i+1):
+                    self.forest_link(j,spare[0],spare[3])
+                x,y = spare[0],spare[3]
+                if x not in big:
+                    x,y = y,x
+                self.link(big,small,x,y)
+                self.recycle(small)
+                # Update step
+                tour.remove_spares([spare])
+                tour.remove_edges([edge])
+                tour.add_edges([spare])
+                # no remapping required
+                return self
 
         # if you're here, cut is final
-        # populate edges and spares
-        b,s = big._tour, small._tour
-
-        edges1 = [x for x in tour._edges if x[0] in b and x[3] in b]
-        edges2 = [x for x in tour._edges if x[0] in s and x[3] in s]
-        assert len(edges1) + len(edges2) + 1 == len(tour._edges)
-
-        spares1 = [x for x in tour._spares if x[0] in b and x[3] in b]
-        spares2 = [x for x in tour._spares if x[0] in s and x[3] in s]
-        assert len(spares1) + len(spares2) == len(tour._spares)
+        # the smaller side takes the edges incident to its nodes, found through adjacency,
+        # so the work is proportional to the smaller side (small-to-large)
+        nodes = small.get_nodes()
+        small._edges = self.incident_edges(nodes,is_tree=True)
+        small._spares = self.incident_edges(nodes,is_tree=False)
+        small._composition = Counter(node_class(x) for x in nodes)
 
         # Finalize cut
-        tour._tour = big._tour
-        tour._edges = set(edges1)
-        tour._spares = set(spares1)
-        small._edges = set(edges2)
-        small._spares = set(spares2)
-        self.remap_nodes(small.get_nodes(),small)
+        tour._edges -= small._edges
+        tour._edges.remove(edge)
+        tour._spares -= small._spares
+        tour._composition -= small._composition
         self.add_tour(small)
         return self
@@ -23,6 +23,11 @@ VariableList:
 '''
 is_in_list_parser = metamodel_from_str(is_in_list_grammar,autokwd=True)
 
+same_complex_grammar = '''
+Expression:
+    is_not?='!' 'same_complex' '(' variables+=ID[','] ')' ;
+'''
+same_complex_parser = metamodel_from_str(same_complex_grammar)
 
 bool_cmp_simple_grammar = '''
 Expression:
@@ -68,6 +73,17 @@ def parse_expression(string_input):
         else:
             return 'is_in',tup
 
+    # Step 3: same_complex and different_complex
+    expr = use_parser(string_input,same_complex_parser)
+    if expr is not None:
+        tup = tuple(expr.variables)
+        if len(tup) < 2:
+            raise ParseExpressionError('same_complex needs two or more variables! ' + string_input)
+        if expr.is_not:
+            return 'different_complex',tup
+        else:
+            return 'same_complex',tup
+
     # Step 4: bool_cmp
     expr = use_parser(string_input,bool_cmp_simple_parser)
     if expr is not None:
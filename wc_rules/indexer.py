@@ -5,8 +5,16 @@
 :License: MIT
 """
 from . import utils
+from sortedcontainers import SortedDict
+from itertools import chain, islice, takewhile
+from collections import deque
+from functools import partial
+import heapq
 import inspect
+import operator
 import pprint
+import re
+import weakref
 
 class DictLike(object):
     def __init__(self,iterable=None):
@@ -63,6 +71,50 @@ class SetLike(object):
         return iter(self._set)
 
 
+class KeyUniverse(object):
+    '''
+    Maps keys to dense integer positions 0,1,2,... in order of first appearance.
+    Positions are never reused, so arrays and bitsets indexed by position stay valid
+    as the universe grows. Indexers and slicers that share a universe can be combined
+    position by position instead of key by key.
+    '''
+    def __init__(self,keys=None):
+        self.positions = dict()
+        self._keys = []
+        if keys is not None:
+            self.add_keys(keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self,key):
+        return key in self.positions
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def index(self,key):
+        # position of key, adding it if new
+        pos = self.positions.get(key)
+        if pos is None:
+            pos = self.positions[key] = len(self._keys)
+            self._keys.append(key)
+        return pos
+
+    def add_keys(self,keys):
+        for key in keys:
+            self.index(key)
+        return self
+
+    def get(self,key,default=None):
+        return self.positions.get(key,default)
+
+    def key(self,pos):
+        return self._keys[pos]
+
+    def keys_at(self,positions):
+        return [self._keys[i] for i in positions]
+
 class Slicer(dict):
     ''' A hashmap between keys (literals or namedtuples) and Boolean values.
     Slicers are dict-like and always return True or False when queried with [key].
@@ -150,6 +202,417 @@ class Slicer(dict):
     def __invert__(self):
         return Slicer(default= not self.default).add_keys(self.keys())
 
+def make_slicer(default,keys):
+    return Slicer(default=default).add_keys(keys)
+
+PROXY_PLACEHOLDER = object()
+
+class ProxySlicer(Slicer):
+    '''
+    Base for slicers that keep their keys outside the dict itself (in bits, masks or lazy expressions).
+
+    Subclasses define keys(), __len__, __iter__ and __contains__.
+    The rest of the dict behavior (items, values, get, ==, !=, repr, copy, bool) is answered from keys(),
+    so these slicers print and compare like a Slicer with the same keys.
+    They pickle as a Slicer with the same keys, unless the subclass says otherwise.
+    The dict itself only holds a placeholder entry: code that reads the dict directly and skips empty ones
+    (e.g., json) then falls back to items().
+    '''
+    def __init__(self,default=False):
+        super().__init__(default)
+        dict.__setitem__(self,PROXY_PLACEHOLDER,True)
+
+    def __reduce__(self):
+        return (make_slicer,(self.default,list(self.keys())))
+
+    def as_dict(self):
+        value = not self.default
+        return {key:value for key in self.keys()}
+
+    def items(self):
+        return self.as_dict().items()
+
+    def values(self):
+        return self.as_dict().values()
+
+    def get(self,key,default=None):
+        return not self.default if key in self else default
+
+    def copy(self):
+        return Slicer(default=self.default).add_keys(self.keys())
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+    def __eq__(self,other):
+        if isinstance(other,ProxySlicer):
+            return self.as_dict()==other.as_dict()
+        if isinstance(other,dict):
+            return self.as_dict()==other
+        return NotImplemented
+
+    def __ne__(self,other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+# bit positions set in each byte value
+BYTE_POSITIONS = [tuple(j for j in range(8) if i >> j & 1) for i in range(256)]
+
+def positions_to_int(positions,n):
+    data = bytearray((n+7)//8)
+    for pos in positions:
+        data[pos >> 3] |= 1 << (pos & 7)
+    return int.from_bytes(data,'little')
+
+def int_to_positions(bits):
+    data = bits.to_bytes((bits.bit_length()+7)//8,'little')
+    return [8*i+j for i,byte in enumerate(data) if byte for j in BYTE_POSITIONS[byte]]
+
+def has_foreign_keys(universe,slicer):
+    # whether slicer has keys that are not in universe
+    if getattr(slicer,'universe',None) is universe:
+        return False
+    return any(key not in universe for key in slicer.keys())
+
+class BitSlicer(ProxySlicer):
+    '''
+    A Slicer whose keys are stored as bits of a Python int, one bit per position of a KeyUniverse.
+
+    Behaves like a Slicer (positive or negative, `[key]`, `in`, `len`, iteration, `&`, `|`, `~`),
+    and prints and compares like a Slicer with the same keys (see ProxySlicer).
+    With another BitSlicer over the same universe, `&`, `|` and `~` are single bitwise operations
+    on ints, at about one bit per key in the universe. Any other slicer is first converted to bits
+    over this slicer's universe. Only add_keys adds keys to the universe: if the other slicer has keys
+    outside the universe that would be in the result, the result is a dict-based Slicer instead.
+    Membership tests decode the bits into a set of positions once, and reuse it until the slicer changes.
+    '''
+    def __init__(self,universe,bits=0,default=False):
+        super().__init__(default)
+        self.universe = universe
+        self.bits = bits
+        self._positions = None
+
+    def truth(self,n):
+        # bits of the first n positions mapped to True
+        if self.default:
+            return self.bits ^ ((1 << n) - 1)
+        return self.bits
+
+    def positions(self):
+        if self._positions is None:
+            self._positions = frozenset(int_to_positions(self.bits))
+        return self._positions
+
+    def __len__(self):
+        return bin(self.bits).count('1')
+
+    def __iter__(self):
+        return iter(self.universe.keys_at(int_to_positions(self.bits)))
+
+    def keys(self):
+        return list(self)
+
+    def __contains__(self,key):
+        return self.universe.get(key) in self.positions()
+
+    def __getitem__(self,key):
+        return (key in self) != self.default
+
+    def copy(self):
+        return BitSlicer(self.universe,self.bits,self.default)
+
+    def __reduce__(self):
+        return (BitSlicer,(self.universe,self.bits,self.default))
+
+    def add_keys(self,keys):
+        # keys new to the universe are added to it
+        positions = [self.universe.index(key) for key in keys]
+        self.bits |= positions_to_int(positions,len(self.universe))
+        self._positions = None
+        return self
+
+    def delete_keys(self,keys):
+        positions = [self.universe.get(key) for key in keys]
+        positions = [pos for pos in positions if pos is not None]
+        self.bits &= ~positions_to_int(positions,len(self.universe))
+        self._positions = None
+        return self
+
+    def coerce(self,other):
+        # other as bits over this universe, leaving out keys that are not in the universe
+        if isinstance(other,BitSlicer) and other.universe is self.universe:
+            return other
+        positions = (self.universe.get(key) for key in other.keys())
+        bits = positions_to_int([pos for pos in positions if pos is not None],len(self.universe))
+        return BitSlicer(self.universe,bits,other.default)
+
+    def combine(self,other,op,default):
+        if op(self.default,not other.default) != default and has_foreign_keys(self.universe,other):
+            # keys of other outside the universe are in the result
+            return op(Slicer(default=self.default).add_keys(self.keys()),other)
+        other = self.coerce(other)
+        n = len(self.universe)
+        bits = op(self.truth(n),other.truth(n))
+        if default:
+            bits ^= (1 << n) - 1
+        return BitSlicer(self.universe,bits,default)
+
+    def union(self,other):
+        if self.default != other.default:
+            raise utils.SlicerError('Cannot merge positive and negative slicers.')
+        if has_foreign_keys(self.universe,other):
+            return Slicer(default=self.default).add_keys(self.keys()).union(other)
+        return BitSlicer(self.universe,self.bits | self.coerce(other).bits,self.default)
+
+    def intersection(self,other):
+        if self.default != other.default:
+            raise utils.SlicerError('Cannot intersect positive and negative slicers.')
+        return BitSlicer(self.universe,self.bits & self.coerce(other).bits,self.default)
+
+    def __and__(self,other):
+        return self.combine(other,operator.and_,self.default and other.default)
+
+    def __or__(self,other):
+        return self.combine(other,operator.or_,self.default or other.default)
+
+    # Slicer & BitSlicer also dispatches here, since BitSlicer is a subclass
+    __rand__ = __and__
+    __ror__ = __or__
+
+    def __invert__(self):
+        return BitSlicer(self.universe,self.bits,not self.default)
+
+def empty_like(slicer):
+    # an empty positive slicer of the same kind, over the same universe if any
+    if hasattr(slicer,'universe'):
+        return type(slicer)(slicer.universe)
+    return Slicer(default=False)
+
+class SlicerExpression(ProxySlicer):
+    '''
+    A lazy Slicer, built by comparisons on indexers and by `&`, `|` and `~` on lazy slicers.
+
+    Nothing is computed until the slicer is used like a Slicer ([key], in, len, iteration, subsetting,
+    ==, repr), at which point evaluate() computes a concrete slicer and caches it.
+    `default` is known without evaluation.
+    A comparison that has not been used when its indexer changes is computed just before the change,
+    so it always reflects the indexer as it was when the comparison was made, as a concrete slicer would.
+
+    Conjunctions, e.g. (I1 == 3) & (I2 > 5) & ~(I3 == 'x'), are evaluated by
+        computing only the operand with the fewest estimated keys,
+        then filtering its keys through the remaining operands in order of estimated size,
+        either by testing each surviving key or, for operands smaller than the survivors, by computing them,
+        stopping as soon as no keys survive.
+    Disjunctions with a negative operand are evaluated as the complement of a conjunction.
+    '''
+    def __init__(self,default):
+        super().__init__(default)
+        self._result = None
+
+    # To be defined by subclasses
+    def compute(self):
+        # concrete slicer
+        pass
+
+    def estimate(self):
+        # estimated number of keys in the concrete slicer
+        pass
+
+    def test(self,key):
+        # value of [key], without computing the concrete slicer
+        pass
+
+    def evaluate(self):
+        if self._result is None:
+            self._result = self.compute()
+        return self._result
+
+    # Slicer behavior, from the concrete slicer
+    def __getitem__(self,key):
+        return self.evaluate()[key]
+
+    def __contains__(self,key):
+        return key in self.evaluate()
+
+    def __iter__(self):
+        return iter(self.evaluate())
+
+    def __len__(self):
+        return len(self.evaluate())
+
+    def keys(self):
+        return self.evaluate().keys()
+
+    def copy(self):
+        return self.evaluate().copy()
+
+    def add_keys(self,keys):
+        self.evaluate().add_keys(keys)
+        return self
+
+    def delete_keys(self,keys):
+        self.evaluate().delete_keys(keys)
+        return self
+
+    def update(self,dict_obj):
+        self.evaluate().update(dict_obj)
+        return self
+
+    def union(self,other):
+        return self.evaluate().union(other)
+
+    def intersection(self,other):
+        return self.evaluate().intersection(other)
+
+    # Building expressions
+    @staticmethod
+    def wrap(slicer):
+        if isinstance(slicer,SlicerExpression):
+            return slicer
+        return SlicerLiteral(slicer)
+
+    def __and__(self,other):
+        return SlicerAnd([self,self.wrap(other)])
+
+    def __or__(self,other):
+        return SlicerOr([self,self.wrap(other)])
+
+    __rand__ = __and__
+    __ror__ = __or__
+
+    def __invert__(self):
+        return SlicerNot(self)
+
+class SlicerLiteral(SlicerExpression):
+    # a concrete slicer in an expression
+    def __init__(self,slicer):
+        super().__init__(slicer.default)
+        self._result = slicer
+
+    def compute(self):
+        return self._result
+
+    def estimate(self):
+        return len(self._result)
+
+    def test(self,key):
+        return self._result[key]
+
+class SlicerQuery(SlicerExpression):
+    '''
+    A comparison on an indexer, given as
+    compute()       returns the concrete (positive) slicer
+    predicate(key)  returns whether key satisfies the comparison
+    estimate        estimated number of keys satisfying the comparison
+    sources         indexers compared, which evaluate the query before they change
+    '''
+    def __init__(self,compute,predicate,estimate,sources=()):
+        super().__init__(False)
+        self._compute = compute
+        self._predicate = predicate
+        self._estimate = estimate
+        for source in sources:
+            source.track_query(self)
+
+    def compute(self):
+        return self._compute()
+
+    def estimate(self):
+        if self._result is not None:
+            return len(self._result)
+        return self._estimate
+
+    def test(self,key):
+        if self._result is not None:
+            return self._result[key]
+        return self._predicate(key)
+
+class SlicerNot(SlicerExpression):
+    def __init__(self,operand):
+        super().__init__(not operand.default)
+        self.operand = operand
+
+    def compute(self):
+        return ~self.operand.evaluate()
+
+    def estimate(self):
+        return self.operand.estimate()
+
+    def test(self,key):
+        return not self.operand.test(key)
+
+    def __invert__(self):
+        return self.operand
+
+class SlicerAnd(SlicerExpression):
+    def __init__(self,operands):
+        flat = []
+        for x in operands:
+            flat.extend(x.operands if isinstance(x,SlicerAnd) else [x])
+        super().__init__(all(x.default for x in flat))
+        self.operands = flat
+
+    def compute(self):
+        if self.default:
+            # all negative: nsl(union of keys)
+            slicers = [x.evaluate() for x in self.operands]
+            result = slicers[0]
+            for x in slicers[1:]:
+                result = result & x
+            return result
+        positives = sorted((x for x in self.operands if not x.default),key=lambda x: x.estimate())
+        first = positives[0].evaluate()
+        rest = sorted((x for x in self.operands if x is not positives[0]),key=lambda x: x.estimate())
+        keys = list(first.keys())
+        for x in rest:
+            if len(keys)==0:
+                break
+            if not x.default and x.estimate() < len(keys):
+                other = x.evaluate()
+                keys = [key for key in keys if other[key]]
+            else:
+                keys = [key for key in keys if x.test(key)]
+        return empty_like(first).add_keys(keys)
+
+    def estimate(self):
+        if self.default:
+            return sum(x.estimate() for x in self.operands)
+        return min(x.estimate() for x in self.operands if not x.default)
+
+    def test(self,key):
+        return all(x.test(key) for x in sorted(self.operands,key=lambda x: x.estimate()))
+
+class SlicerOr(SlicerExpression):
+    def __init__(self,operands):
+        flat = []
+        for x in operands:
+            flat.extend(x.operands if isinstance(x,SlicerOr) else [x])
+        super().__init__(any(x.default for x in flat))
+        self.operands = flat
+
+    def compute(self):
+        if self.default:
+            # de Morgan: a | b = ~(~a & ~b)
+            return ~SlicerAnd([~x for x in self.operands]).evaluate()
+        slicers = [x.evaluate() for x in self.operands]
+        result = slicers[0]
+        for x in slicers[1:]:
+            result = result | x
+        return result
+
+    def estimate(self):
+        if self.default:
+            return min(x.estimate() for x in self.operands if x.default)
+        return sum(x.estimate() for x in self.operands)
+
+    def test(self,key):
+        return any(x.test(key) for x in self.operands)
+
 class HashableDict(dict):
     def __hash__(self):
         return hash(tuple(sorted(self.items())))
@@ -219,6 +682,157 @@ class DictSet(object):
         #return pprint.pformat(sorted(self._set,key=self._keyfunc))
 
 
+MISSING = object()
+
+def get_field(key,field):
+    # field of a dict, namedtuple or object key (or position in a tuple key)
+    if isinstance(key,dict):
+        return key.get(field,MISSING)
+    if isinstance(field,int) and isinstance(key,tuple):
+        return key[field] if -len(key) <= field < len(key) else MISSING
+    return getattr(key,field,MISSING)
+
+def matches_fields(key,fields):
+    return all(get_field(key,field)==value for field,value in fields.items())
+
+# predicates of lazy comparisons, see SlicerQuery
+def compares_keys(op,indexer,other,key):
+    return key in indexer and key in other and op(indexer.get(key),other[key])
+
+def compares_value(op,indexer,value,key):
+    return key in indexer and op(indexer.get(key),value)
+
+def has_value_in(indexer,values,key):
+    return key in indexer and indexer.get(key) in values
+
+def has_fields(indexer,fields,key):
+    return key in indexer and matches_fields(key,fields)
+
+class ChangeFeed(object):
+    '''
+    A numbered log of (generation,key,old,new) changes to an indexer, read through cursors.
+
+    cursor = I.changes.subscribe()
+    ... I.update(...), I.remove(...) ...
+    cursor.read()                 list of (generation,key,old,new) since the last read
+    cursor.read(coalesce=True)    one (generation,key,old,new) per key, dropping keys that ended where they started
+    cursor.close()
+
+    old is MISSING for added keys, new is MISSING for removed keys.
+    Each subscriber has its own cursor, and entries are dropped once every cursor has read them.
+    Nothing is logged while there are no subscribers, but generations are still counted.
+    '''
+    def __init__(self):
+        self.log = deque()
+        # generation of the next change, and of the first change in the log
+        self.generation = 0
+        self.start = 0
+        self.cursors = weakref.WeakSet()
+
+    def __len__(self):
+        return len(self.log)
+
+    def __getstate__(self):
+        # cursors are not pickled, so neither is the log they have yet to read
+        state = dict(self.__dict__)
+        del state['cursors']
+        state['log'] = deque()
+        state['start'] = self.generation
+        return state
+
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+        self.cursors = weakref.WeakSet()
+
+    def append(self,key,old,new):
+        if len(self.cursors) > 0:
+            self.log.append((self.generation,key,old,new))
+        else:
+            self.log.clear()
+            self.start = self.generation + 1
+        self.generation += 1
+        return self
+
+    def skip(self,n):
+        # counts n changes that nobody is subscribed to
+        assert len(self.cursors)==0
+        self.log.clear()
+        self.generation += n
+        self.start = self.generation
+        return self
+
+    def subscribe(self):
+        cursor = ChangeCursor(self)
+        self.cursors.add(cursor)
+        return cursor
+
+    def unsubscribe(self,cursor):
+        self.cursors.discard(cursor)
+        return self.trim()
+
+    def trim(self):
+        oldest = min((c.generation for c in self.cursors),default=self.generation)
+        while self.start < oldest and len(self.log) > 0:
+            self.log.popleft()
+            self.start += 1
+        self.start = max(self.start,oldest)
+        return self
+
+    def read(self,cursor,coalesce=False):
+        changes = list(islice(self.log,cursor.generation-self.start,None))
+        cursor.generation = self.generation
+        self.trim()
+        if coalesce:
+            return coalesce_changes(changes)
+        return changes
+
+def coalesce_changes(changes):
+    # first old and last new value per key, in order of last change
+    merged = dict()
+    for generation,key,old,new in changes:
+        if key in merged:
+            old = merged.pop(key)[2]
+        merged[key] = (generation,key,old,new)
+    return [x for x in merged.values() if x[2] is not x[3] and x[2] != x[3]]
+
+class ChangeCursor(object):
+    def __init__(self,feed):
+        self.feed = feed
+        self.generation = feed.generation
+
+    def pending(self):
+        return self.feed.generation - self.generation
+
+    def read(self,coalesce=False):
+        return self.feed.read(self,coalesce)
+
+    def close(self):
+        self.feed.unsubscribe(self)
+
+REGEX_SPECIAL = set('.^$*+?{}[]\\|()')
+
+def literal_prefix(pattern):
+    # literal text that every match of a compiled regex must start with
+    if pattern.flags & re.IGNORECASE or '|' in pattern.pattern:
+        return ''
+    text = pattern.pattern[1:] if pattern.pattern.startswith('^') else pattern.pattern
+    prefix = []
+    for i,char in enumerate(text):
+        if char in REGEX_SPECIAL:
+            # a quantifier makes the previous character optional
+            if char in '*?{' and len(prefix) > 0:
+                prefix.pop()
+            break
+        prefix.append(char)
+    return ''.join(prefix)
+
+def is_indexer(obj):
+    # indexers of any backend (e.g., ColumnarIndexer), which map keys to values
+    # through keys(), `in` and [key], as opposed to plain dicts (field queries)
+    if isinstance(obj,Indexer):
+        return True
+    return not isinstance(obj,dict) and hasattr(obj,'keys') and hasattr(obj,'__getitem__')
+
 class Indexer(dict):
     '''
     A hashmap between keys (literals or named tuples) and arbitary values of the same type
@@ -227,6 +841,7 @@ class Indexer(dict):
     If I is an indexer object,
     I[key] - returns the value mapped to key
     I[slice] - returns an indexer which is a subset of the previous indexer, with keys from slice.
+               The subset is a view (IndexerView) that shares storage with I until either of them changes.
 
     In addition to dict-like behavior, Indexer maintains a value cache, which supports
     reverse lookup of keys from values using the `==` and `!=` operators
@@ -236,6 +851,12 @@ class Indexer(dict):
     I1 == I2            returns a slice of keys with equal values in I1 and I2
     I != x              returns ~(I==x) where x is a value, list of values or indexer.
 
+    Comparisons return lazy slicers (SlicerExpression), which are computed when first used,
+    so that compound queries like I1[(I1 == 3) & (I2 == 'x')] only compute what is needed.
+    Comparisons not yet used are computed just before I changes, so q = I == 3 keeps the keys
+    mapped to 3 when q was made, even if I is changed before q is used.
+    I.equal(x) returns the concrete slicer for I == x.
+
     Alternatively, one can use the slice method
     I.slice(value)          same as I==value
     I.slice(list_of_values) same as I==list_of_values
@@ -244,12 +865,46 @@ class Indexer(dict):
     Slicing and subsetting can be done simultaneously, e.g., I[I==value].
 
     Also, Indexer maintains a last_updated list of keys, which is propagated by default when a subset is created.
+
+    If created with a KeyUniverse, Indexer(universe=U), queries return BitSlicers over U,
+    which are combined with `&`, `|` and `~` much faster than dict-based slicers.
+
+    For keys that are namedtuples, dicts (HashableDict) or tuples, fields can be indexed,
+    Indexer(fields=['compartment']) or I.add_field_index('compartment'),
+    in which case a field cache {field:{field_value:slicer}} is kept like the value cache.
+    I == dict(compartment='c') returns a slice of keys whose fields match the dict,
+    and only visits keys with matching values of an indexed field, if any.
+
+    I.changes is a ChangeFeed of every change to I, which several readers can consume
+    incrementally, each with its own cursor (I.changes.subscribe()).
+
+    I.update_from_arrays(keys,values) and I.remove_many(keys) apply many changes in one pass,
+    and I.value_counts() returns {value:number of keys} from the value cache.
     '''
     primitive_type = None
 
-    def __init__(self):
+    def __init__(self,universe=None,fields=None):
+        self.universe = universe
         self.value_cache = {}
+        self.field_cache = {}
         self.last_updated = Slicer(default=False)
+        self.changes = ChangeFeed()
+        self._views = None
+        self._queries = None
+        for field in fields if fields is not None else []:
+            self.add_field_index(field)
+
+    def __getstate__(self):
+        # views and pending queries stay attached to this indexer, not to its pickled copy
+        state = dict(self.__dict__)
+        state['_views'] = None
+        state['_queries'] = None
+        return state
+
+    def new_slicer(self):
+        if self.universe is not None:
+            return BitSlicer(self.universe)
+        return Slicer(default=False)
 
     def __getitem__(self,key):
         if isinstance(key,Slicer):
@@ -276,6 +931,22 @@ class Indexer(dict):
         self.value_cache[value].add_keys([key])
         return self
 
+    def add_key_to_field_cache(self,key):
+        for field,cache in self.field_cache.items():
+            value = get_field(key,field)
+            if value is not MISSING:
+                cache.setdefault(value,Slicer(default=False)).add_keys([key])
+        return self
+
+    def delete_key_from_field_cache(self,key):
+        for field,cache in self.field_cache.items():
+            value = get_field(key,field)
+            if value is not MISSING:
+                cache[value].pop(key)
+                if len(cache[value])==0:
+                    cache.pop(value)
+        return self
+
     def update_last_updated(self,keylist):
         if isinstance(keylist,list):
             self.last_updated.add_keys(keylist)
@@ -283,120 +954,651 @@ class Indexer(dict):
             self.last_updated.add_keys(list(keylist))
         return self
 
+    def merge_values(self,value_list):
+        # each key is cached under one value, so the slicers are disjoint
+        # and can be merged into one slicer without pairwise unions
+        caches = (self.value_cache[value] for value in value_list if value in self.value_cache)
+        return self.new_slicer().add_keys(chain.from_iterable(caches))
+
+    def field_slicers(self,fields):
+        # slicers of the indexed fields in a dict of fields, smallest first
+        empty = Slicer(default=False)
+        slicers = [self.field_cache[f].get(v,empty) for f,v in fields.items() if f in self.field_cache]
+        return sorted(slicers,key=len)
+
+    def match_fields(self,fields):
+        slicers = self.field_slicers(fields)
+        if len(slicers)==0:
+            keys = (key for key in self if matches_fields(key,fields))
+        else:
+            keys = (key for key in slicers[0] if matches_fields(key,fields))
+        return self.new_slicer().add_keys(keys)
+
     # Methods available externally
+    def add_field_index(self,field):
+        if field not in self.field_cache:
+            cache = self.field_cache[field] = dict()
+            for key in self:
+                value = get_field(key,field)
+                if value is not MISSING:
+                    cache.setdefault(value,Slicer(default=False)).add_keys([key])
+        return self
+
     def slice(self,value_list=None):
-        S = Slicer(default=False)
         if value_list is None:
-            S.add_keys(k for k in self)
-            return S
+            return self.new_slicer().add_keys(k for k in self)
         if inspect.isfunction(value_list):
             f = value_list
-            value_list = (value for value in self.value_cache if f(value))
-        for value in value_list:
-            S = S | self.value_cache[value]
-        return S
+            value_list = [value for value in self.value_cache if f(value)]
+        return self.merge_values(value_list)
 
     def subset(self,keylist,propagate=True):
-        cls = type(self)
-        I = cls()
-        if isinstance(keylist,list):
-            keys = (key for key in self if key in keylist)
-        if isinstance(keylist,Slicer):
-            keys = (key for key in self if keylist[key])
-        for key in keys:
-            I.update_key_value(key,self[key])
-        if propagate==True:
-            I.update_last_updated(self.last_updated.keys())
-        return I
+        # returns a view, see IndexerView
+        if not isinstance(keylist,Slicer):
+            keylist = Slicer(default=False).add_keys(keylist)
+        return view_class(type(self))(self,keylist,propagate)
+
+    def detach_views(self):
+        # views copy their keys and values before this indexer changes
+        if self._views:
+            for view in list(self._views.values()):
+                view.materialize()
+        return self
+
+    def track_query(self,query):
+        if self._queries is None:
+            self._queries = weakref.WeakValueDictionary()
+        self._queries[id(query)] = query
+        return self
+
+    def settle_queries(self):
+        # lazy comparisons on this indexer are computed before it changes
+        if self._queries:
+            queries = list(self._queries.values())
+            self._queries.clear()
+            for query in queries:
+                query.evaluate()
+        return self
+
+    def before_change(self):
+        return self.detach_views().settle_queries()
 
     def update_key_value(self,key,value):
         if self.value_is_compatible(value):
-            if key in self: self.delete_key_from_value_cache(key)
+            self.before_change()
+            old = dict.get(self,key,MISSING)
+            if key in self:
+                self.delete_key_from_value_cache(key)
+            else:
+                self.add_key_to_field_cache(key)
             dict.__setitem__(self,key,value)
             self.add_key_to_value_cache(key,value)
+            self.changes.append(key,old,value)
         return self
 
     def remove_key(self,key):
+        self.before_change()
         self.delete_key_from_value_cache(key)
-        self.pop(key)
+        self.delete_key_from_field_cache(key)
+        self.changes.append(key,self.pop(key),MISSING)
         return self
 
     def update(self,dict_obj):
-        keys = (key for key in dict_obj if (key in self and self[key]!=dict_obj[key]) or key not in self)
-        for key in keys:
-            self.update_key_value(key, dict_obj[key])
-            self.update_last_updated(key)
-        return self
+        return self.update_from_arrays(list(dict_obj.keys()),list(dict_obj.values()))
 
     def remove(self,keylist):
-        keys = (key for key in keylist if key in self)
+        return self.remove_many(keylist)
+
+    def update_from_arrays(self,keys,values):
+        # keys and values are sequences of the same length (lists or numpy arrays)
+        if len(keys) != len(values):
+            raise utils.IndexerError('Keys and values must have the same length.')
+        # numpy scalars are converted to Python values, as stored by update
+        if hasattr(keys,'tolist'):
+            keys = keys.tolist()
+        if hasattr(values,'tolist'):
+            values = values.tolist()
+        # a key given more than once takes its last value
+        changed = []
+        for key,value in dict(zip(keys,values)).items():
+            old = dict.get(self,key,MISSING)
+            if old is MISSING or old != value:
+                self.value_is_compatible(value)
+                changed.append((key,old,value))
+        if len(changed)==0:
+            return self
+        self.before_change()
+        added = dict()
+        for key,old,value in changed:
+            if old is MISSING:
+                self.add_key_to_field_cache(key)
+            else:
+                self.delete_key_from_value_cache(key)
+            dict.__setitem__(self,key,value)
+            added.setdefault(value,[]).append(key)
+            self.changes.append(key,old,value)
+        for value,keylist in added.items():
+            if value not in self.value_cache:
+                self.value_cache[value] = Slicer(default=False)
+            self.value_cache[value].add_keys(keylist)
+        return self.update_last_updated([key for key,old,value in changed])
+
+    def remove_many(self,keylist):
+        if hasattr(keylist,'tolist'):
+            keylist = keylist.tolist()
+        keys = [key for key in keylist if dict.__contains__(self,key)]
+        if len(keys)==0:
+            return self
+        self.before_change()
         for key in keys:
-            self.remove_key(key)
-            self.update_last_updated(key)
-        return self
+            self.delete_key_from_value_cache(key)
+            self.delete_key_from_field_cache(key)
+            self.changes.append(key,self.pop(key),MISSING)
+        return self.update_last_updated(keys)
+
+    # Aggregations
+    def value_counts(self):
+        return {value:len(keys) for value,keys in self.value_cache.items()}
 
     def flush(self):
         self.last_updated = Slicer(default=False)
         return self
 
-    def __eq__(self,other):
+    def equal(self,other):
         if isinstance(other,Indexer):
-            S = Slicer(default=False)
+            S = self.new_slicer()
             for val in self.value_cache:
                 if val in other.value_cache:
                     x = self.slice([val]) & other.slice([val])
                     S = S | x
             return S
+        if is_indexer(other):
+            keys = (key for key in self if key in other and self.get(key)==other[key])
+            return self.new_slicer().add_keys(list(keys))
         if isinstance(other,dict):
-            keys = (key for key in self if other in key)
-            return Slicer(default=False).add_keys(keys)
+            return self.match_fields(other)
         if isinstance(other,self.primitive_type):
             return self.slice([other])
         if isinstance(other,list):
             return self.slice(other)
         raise utils.IndexerError('To use __eq__ or __ne__, either compare two Indexers, or an indexer and a compatible value, or an indexer and a list of compatible values.')
 
+    def __eq__(self,other):
+        # lazy version of equal()
+        if isinstance(other,Indexer):
+            predicate = partial(compares_keys,operator.eq,self,other)
+            estimate = min(len(self),len(other))
+        elif isinstance(other,dict):
+            predicate = partial(has_fields,self,other)
+            estimate = min([len(x) for x in self.field_slicers(other)] + [len(self)])
+        elif isinstance(other,self.primitive_type):
+            predicate = partial(compares_value,operator.eq,self,other)
+            estimate = len(self.value_cache.get(other,()))
+        elif isinstance(other,list):
+            values = set(other)
+            predicate = partial(has_value_in,self,values)
+            estimate = sum(len(self.value_cache.get(x,())) for x in values)
+        else:
+            # other backends, e.g., ColumnarIndexer, are compared right away
+            return self.equal(other)
+        sources = (self,other) if isinstance(other,Indexer) else (self,)
+        return SlicerQuery(partial(self.equal,other),predicate,estimate,sources)
+
     def __ne__(self,other):
         return ~self.__eq__(other)
 
-class BooleanIndexer(Indexer):
+AGGREGATES = dict(
+    sum = sum,
+    count = len,
+    mean = lambda values: sum(values)/len(values),
+    min = min,
+    max = max,
+    )
+
+class AggregatingIndexer(Indexer):
+    '''
+    Indexer of numbers (or bools), with aggregations computed from the value cache,
+    i.e., once per distinct value rather than once per key.
+
+    I.sum(), I.mean()
+    I.groupby(field,aggregate='sum')  {field value: aggregate of the values of keys with that field value}
+                                      (aggregate is one of sum, count, mean, min, max)
+    '''
+    def sum(self):
+        return sum(value*len(keys) for value,keys in self.value_cache.items())
+
+    def mean(self):
+        if len(self)==0:
+            raise utils.IndexerError('Cannot take the mean of an empty indexer.')
+        return self.sum()/len(self)
+
+    def groupby(self,field,aggregate='sum'):
+        if aggregate not in AGGREGATES:
+            raise utils.IndexerError('Aggregate must be one of ' + ', '.join(AGGREGATES))
+        if field in self.field_cache:
+            groups = {x:list(keys) for x,keys in self.field_cache[field].items()}
+        else:
+            groups = dict()
+            for key in self:
+                x = get_field(key,field)
+                if x is not MISSING:
+                    groups.setdefault(x,[]).append(key)
+        f = AGGREGATES[aggregate]
+        return {x:f([self[key] for key in keys]) for x,keys in groups.items()}
+
+class BooleanIndexer(AggregatingIndexer):
     primitive_type = bool
 
-class NumericIndexer(Indexer):
+class SortedIndexer(Indexer):
     '''
-    In additon to operators `==` and `!=`, NumericIndexer also supports `>`,`>=`, `<` and `<=`
+    Indexer whose value cache is a SortedDict, for values that can be ordered.
 
+    Range queries on values cost O(log n + k) for k matching keys, and return a single slicer.
+    I.sorted_items(reverse=False)  iterates over (key,value) in order of values
+    I.nlargest(k), I.nsmallest(k)  list of (key,value) for the k largest (smallest) values
+    I.between(a,b)     returns a slice for all keys in I mapped to values in [a,b]
+    I.between(a,b,inclusive=(True,False)) excludes b (likewise for a)
     I1 > I2            returns a slice for all keys in I1 whose values in I1 are greater than their values in I2
     I > value          returns a slice for all keys in I mapped to values greater than `value`
     I > list_of_values is not supported
+    and likewise for `>=`, `<` and `<=`.
     '''
-    primitive_type = (int,float,)
-
-    def __lt__(self,other):
-        if isinstance(other,Indexer):
-            keys =(key for key in self if key in other and self[key] < other[key])
-            return Slicer(default=False).add_keys(list(keys))
+    def __init__(self,universe=None,fields=None):
+        super().__init__(universe,fields)
+        self.value_cache = SortedDict()
+
+    def sorted_items(self,reverse=False):
+        # (key,value) in order of values, ties in arbitrary order
+        values = reversed(self.value_cache) if reverse else iter(self.value_cache)
+        for value in values:
+            for key in self.value_cache[value]:
+                yield key,value
+
+    def nlargest(self,k):
+        return list(islice(self.sorted_items(reverse=True),k))
+
+    def nsmallest(self,k):
+        return list(islice(self.sorted_items(),k))
+
+    def between(self,minimum=None,maximum=None,inclusive=(True,True)):
+        # None leaves that end of the range open
+        values = self.value_cache.irange(minimum,maximum,inclusive=inclusive)
+        return self.merge_values(values)
+
+    def compare(self,other,op,minimum=None,maximum=None,inclusive=(True,True)):
+        # op compares values key by key for indexers, the range is used for scalars
+        if is_indexer(other):
+            keys = (key for key in self if key in other and op(self.get(key),other[key]))
+            return self.new_slicer().add_keys(list(keys))
         if isinstance(other,self.primitive_type):
-            return self.slice(lambda x: x < other)
+            return self.between(minimum,maximum,inclusive)
         raise utils.IndexerError('To use __le__, __lt__, __ge__,__gt__, either compare two Indexers, or an indexer and a compatible value.')
 
-    def __gt__(self,other):
+    def estimate_range(self,minimum=None,maximum=None,inclusive=(True,True)):
+        # distinct values in range, times the mean number of keys per value
+        cache = self.value_cache
+        if len(cache)==0:
+            return 0
+        lo = 0 if minimum is None else (cache.bisect_left(minimum) if inclusive[0] else cache.bisect_right(minimum))
+        hi = len(cache) if maximum is None else (cache.bisect_right(maximum) if inclusive[1] else cache.bisect_left(maximum))
+        return max(hi-lo,0)*len(self)//len(cache)
+
+    def compare_query(self,other,op,minimum=None,maximum=None,inclusive=(True,True)):
+        # lazy version of compare()
         if isinstance(other,Indexer):
-            keys =(key for key in self if key in other and self[key] > other[key])
-            return Slicer(default=False).add_keys(list(keys))
-        if isinstance(other,self.primitive_type):
-            return self.slice(lambda x: x > other)
-        raise utils.IndexerError('To use __le__, __lt__, __ge__,__gt__, either compare two Indexers, or an indexer and a compatible value.')
+            predicate = partial(compares_keys,op,self,other)
+            estimate = min(len(self),len(other))
+        elif isinstance(other,self.primitive_type):
+            predicate = partial(compares_value,op,self,other)
+            estimate = self.estimate_range(minimum,maximum,inclusive)
+        else:
+            # other backends, e.g., ColumnarIndexer, are compared right away
+            return self.compare(other,op)
+        sources = (self,other) if isinstance(other,Indexer) else (self,)
+        return SlicerQuery(partial(self.compare,other,op,minimum,maximum,inclusive),predicate,estimate,sources)
+
+    def __lt__(self,other):
+        return self.compare_query(other,operator.lt,maximum=other,inclusive=(True,False))
+
+    def __gt__(self,other):
+        return self.compare_query(other,operator.gt,minimum=other,inclusive=(False,True))
 
     def __le__(self,other):
-        x1 = self < other
-        x2 = self == other
-        return x1|x2
+        return self.compare_query(other,operator.le,maximum=other)
 
     def __ge__(self,other):
-        x1 = self > other
-        x2 = self == other
-        return x1|x2
+        return self.compare_query(other,operator.ge,minimum=other)
+
+class NumericIndexer(AggregatingIndexer,SortedIndexer):
+    '''
+    In additon to operators `==` and `!=`, NumericIndexer also supports `>`,`>=`, `<` and `<=`,
+    and range queries (see SortedIndexer).
+
+    I.top(k)           returns a slice for the k keys mapped to the largest values (ties broken arbitrarily)
+    I.bottom(k)        returns a slice for the k keys mapped to the smallest values
+    I.track_top(k)     returns a TopKTracker of the k largest values, kept up to date from I.changes
+    '''
+    primitive_type = (int,float,)
 
-class StringIndexer(Indexer):
+    def top(self,k):
+        return self.new_slicer().add_keys(key for key,value in self.nlargest(k))
+
+    def bottom(self,k):
+        return self.new_slicer().add_keys(key for key,value in self.nsmallest(k))
+
+    def track_top(self,k,largest=True):
+        return TopKTracker(self,k,largest)
+
+class StringIndexer(SortedIndexer):
+    '''
+    In addition to `==`, `!=` and range queries (see SortedIndexer), StringIndexer supports
+    I.startswith(prefix)   returns a slice for all keys mapped to values starting with prefix
+    I.match(pattern)       returns a slice for all keys mapped to values matching a regular expression
+                           (re.match, so from the start of the value)
+    Both only visit the distinct values that share the literal prefix, which are adjacent in the value cache.
+    '''
     primitive_type = str
+
+    def prefixed_values(self,prefix):
+        values = self.value_cache.irange(minimum=prefix)
+        return takewhile(lambda value: value.startswith(prefix),values)
+
+    def startswith(self,prefix):
+        return self.merge_values(self.prefixed_values(prefix))
+
+    def match(self,pattern):
+        pattern = re.compile(pattern)
+        values = self.prefixed_values(literal_prefix(pattern))
+        return self.merge_values([value for value in values if pattern.match(value)])
+
+class TopKTracker(object):
+    '''
+    The k keys of a NumericIndexer with the largest (or smallest) values, updated incrementally.
+
+    tracker = I.track_top(10)
+    ... I.update(...) ...
+    tracker.items()      [(key,value),...] best first
+
+    The tracker reads I.changes through its own cursor. Changes to keys outside the top k
+    that do not beat the worst tracked value cost O(1), and better ones O(log k) on a heap.
+    If a tracked key is removed or gets worse, the top k is rebuilt from the sorted value cache,
+    in O(log n + k).
+    '''
+    def __init__(self,indexer,k,largest=True):
+        self.indexer = indexer
+        self.k = k
+        self.largest = largest
+        self.cursor = indexer.changes.subscribe()
+        self.rebuild()
+
+    def order(self,value):
+        # heap order, worst value first
+        return value if self.largest else -value
+
+    def rebuild(self):
+        items = self.indexer.nlargest(self.k) if self.largest else self.indexer.nsmallest(self.k)
+        self.members = dict(items)
+        self.heap = [(self.order(value),i,key) for i,(key,value) in enumerate(items)]
+        heapq.heapify(self.heap)
+        self.counter = len(self.heap)
+        return self
+
+    def push(self,key,value):
+        self.members[key] = value
+        heapq.heappush(self.heap,(self.order(value),self.counter,key))
+        self.counter += 1
+        return self
+
+    def worst(self):
+        # drops heap entries of keys that left or changed value
+        while self.heap:
+            order,i,key = self.heap[0]
+            if key in self.members and self.order(self.members[key])==order:
+                return order
+            heapq.heappop(self.heap)
+        return None
+
+    def refresh(self):
+        for generation,key,old,new in self.cursor.read(coalesce=True):
+            if key in self.members:
+                if new is MISSING or self.order(new) < self.order(self.members[key]):
+                    return self.rebuild()
+                self.push(key,new)
+            elif new is not MISSING:
+                if len(self.members) < self.k:
+                    self.push(key,new)
+                elif self.k > 0 and self.order(new) > self.worst():
+                    self.members.pop(heapq.heappop(self.heap)[2])
+                    self.push(key,new)
+        return self
+
+    def items(self):
+        self.refresh()
+        return sorted(self.members.items(),key=lambda x: self.order(x[1]),reverse=True)
+
+    def keys(self):
+        return [key for key,value in self.items()]
+
+    def __len__(self):
+        return len(self.refresh().members)
+
+    def __contains__(self,key):
+        return key in self.refresh().members
+
+    def close(self):
+        self.cursor.close()
+
+class IndexerView(Indexer):
+    '''
+    Subset of an indexer that shares storage with the indexer it was taken from.
+
+    I[slice] returns an instance of view_class(type(I)), e.g. NumericIndexerView for a NumericIndexer,
+    which is also an instance of type(I) and of IndexerView.
+    A view keeps a reference to its parent and the slicer, and reads keys and values through them.
+    Taking a view of a view combines the slicers, and last_updated is shared with the parent
+    until the view is materialized.
+    Comparisons (==, !=, <, <=, >, >=) are answered from the parent's value cache and restricted
+    to the view's slicer, so V[V > 5] copies nothing.
+
+    The view is materialized (keys and values copied, value cache built) when it is changed
+    (including through dict methods such as pop, setdefault or [key] = value),
+    when its own value or field cache is needed (e.g., for I.slice, I.between or aggregates),
+    when it is pickled or copied with the copy module, or just before its parent changes.
+    Until then, the dict itself only holds a placeholder entry, as for ProxySlicer.
+    '''
+    # views being unpickled are already materialized
+    _parent = None
+
+    def __init__(self,parent,selection,propagate=True):
+        last_updated = parent.last_updated
+        if isinstance(parent,IndexerView) and parent._parent is not None:
+            selection = parent._selection & selection
+            parent = parent._parent
+        self._parent = None
+        super().__init__(universe=parent.universe)
+        self._parent = parent
+        self._selection = selection
+        self._keys = None
+        self._fields = list(parent.field_cache)
+        dict.__setitem__(self,PROXY_PLACEHOLDER,True)
+        if parent._views is None:
+            parent._views = weakref.WeakValueDictionary()
+        parent._views[id(self)] = self
+        if propagate==True:
+            # shared until materialized
+            self.last_updated = last_updated
+
+    @property
+    def value_cache(self):
+        if self._parent is not None:
+            self.materialize()
+        return self._value_cache
+
+    @value_cache.setter
+    def value_cache(self,value):
+        self._value_cache = value
+
+    @property
+    def field_cache(self):
+        if self._parent is not None:
+            self.materialize()
+        return self._field_cache
+
+    @field_cache.setter
+    def field_cache(self,value):
+        self._field_cache = value
+
+    def view_keys(self):
+        if self._keys is None:
+            parent,selection = self._parent,self._selection
+            if not selection.default and len(selection) < len(parent):
+                self._keys = [key for key in selection if dict.__contains__(parent,key)]
+            else:
+                self._keys = [key for key in parent if selection[key]]
+        return self._keys
+
+    def materialize(self):
+        if self._parent is None:
+            return self
+        parent,keys = self._parent,self.view_keys()
+        self._parent,self._selection,self._keys = None,None,None
+        parent._views.pop(id(self),None)
+        dict.__delitem__(self,PROXY_PLACEHOLDER)
+        self.last_updated = Slicer(default=False).add_keys(self.last_updated.keys())
+        self.field_cache = {field:dict() for field in self._fields}
+        for key in keys:
+            value = dict.__getitem__(parent,key)
+            dict.__setitem__(self,key,value)
+            self.add_key_to_value_cache(key,value)
+            self.add_key_to_field_cache(key)
+        return self
+
+    # dict-like behavior, read through the parent
+    def __getitem__(self,key):
+        if self._parent is None or isinstance(key,Slicer):
+            return super().__getitem__(key)
+        if key in self:
+            return dict.__getitem__(self._parent,key)
+        raise KeyError(key)
+
+    def __contains__(self,key):
+        if self._parent is None:
+            return dict.__contains__(self,key)
+        return dict.__contains__(self._parent,key) and self._selection[key]
+
+    def __iter__(self):
+        if self._parent is None:
+            return dict.__iter__(self)
+        return iter(self.view_keys())
+
+    def __len__(self):
+        if self._parent is None:
+            return dict.__len__(self)
+        return len(self.view_keys())
+
+    def keys(self):
+        if self._parent is None:
+            return dict.keys(self)
+        return list(self.view_keys())
+
+    def values(self):
+        if self._parent is None:
+            return dict.values(self)
+        return [dict.__getitem__(self._parent,key) for key in self.view_keys()]
+
+    def items(self):
+        if self._parent is None:
+            return dict.items(self)
+        return [(key,dict.__getitem__(self._parent,key)) for key in self.view_keys()]
+
+    def get(self,key,default=None):
+        return self[key] if key in self else default
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def copy(self):
+        return dict(self.items())
+
+    def __reduce_ex__(self,protocol):
+        self.materialize()
+        return super().__reduce_ex__(protocol)
+
+    # comparisons on the parent, restricted to the view
+    def __eq__(self,other):
+        if self._parent is None:
+            return super().__eq__(other)
+        return (self._parent == other) & self._selection
+
+    def compare_query(self,other,op,minimum=None,maximum=None,inclusive=(True,True)):
+        if self._parent is None:
+            return super().compare_query(other,op,minimum,maximum,inclusive)
+        return self._parent.compare_query(other,op,minimum,maximum,inclusive) & self._selection
+
+    # changes materialize the view first
+    def __setitem__(self,key,value):
+        self.materialize()
+        return super().__setitem__(key,value)
+
+    def __delitem__(self,key):
+        self.materialize()
+        return super().__delitem__(key)
+
+    def pop(self,*args):
+        self.materialize()
+        return super().pop(*args)
+
+    def popitem(self):
+        self.materialize()
+        return super().popitem()
+
+    def setdefault(self,*args):
+        self.materialize()
+        return super().setdefault(*args)
+
+    def clear(self):
+        self.materialize()
+        return super().clear()
+
+    def update_key_value(self,key,value):
+        self.materialize()
+        return super().update_key_value(key,value)
+
+    def update_from_arrays(self,keys,values):
+        self.materialize()
+        return super().update_from_arrays(keys,values)
+
+    def remove_many(self,keylist):
+        self.materialize()
+        return super().remove_many(keylist)
+
+    def remove_key(self,key):
+        self.materialize()
+        return super().remove_key(key)
+
+class AggregatingIndexerView(IndexerView,AggregatingIndexer): pass
+
+class BooleanIndexerView(IndexerView,BooleanIndexer): pass
+
+class SortedIndexerView(IndexerView,SortedIndexer): pass
+
+class NumericIndexerView(IndexerView,NumericIndexer): pass
+
+class StringIndexerView(IndexerView,StringIndexer): pass
+
+VIEW_CLASSES = {
+    Indexer: IndexerView,
+    AggregatingIndexer: AggregatingIndexerView,
+    BooleanIndexer: BooleanIndexerView,
+    SortedIndexer: SortedIndexerView,
+    NumericIndexer: NumericIndexerView,
+    StringIndexer: StringIndexerView,
+    }
+
+def view_class(cls):
+    if issubclass(cls,IndexerView):
+        return cls
+    if cls not in VIEW_CLASSES:
+        # made on first use, so views of other subclasses cannot be pickled
+        VIEW_CLASSES[cls] = type(cls.__name__ + 'View',(IndexerView,cls),{})
+    return VIEW_CLASSES[cls]
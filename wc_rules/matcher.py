@@ -1,10 +1,14 @@
 from .rete_net import ReteNet
-from .rete_build import increment_net_with_pattern
+from .rete_build import increment_net_with_pattern, add_aggregate
+from .rete_nodes import aggregate
+from .rete_token import Token, token_add_node, token_add_edge, get_edges, flip_edge_correctly, is_complex_variable
+from .utils import FindError, BuildError
 
 class Matcher(object):
     def __init__(self):
         self.rete_net = ReteNet()
         self.pattern_nodes = dict()
+        self._recorder = None
         self.bad_keywords = set(['complex','root','node','edge',
         'node1','node2','edge1','edge2',
         'add','remove','edit',
@@ -34,9 +38,53 @@ class Matcher(object):
         return self.rete_net._complex_bookkeeper.get_list_of_complexes()
 
     def count_complexes(self):
-        return len(self.rete_net._complex_bookkeeper._index)
+        return self.rete_net._complex_bookkeeper.count_complexes()
+
+    def set_add_only(self,on=True):
+        # while only bonds form (e.g., during equilibration), complexes are tracked with union-find
+        # a complex is built into an Euler tour when it is first cut or inspected
+        # set_add_only(False) builds all pending complexes
+        self.rete_net._complex_bookkeeper.set_add_only(on)
+        return self
+
+    def complex_stats(self):
+        # per-complex number of nodes, spares (rings) and number of nodes of each class,
+        # maintained incrementally, so this costs O(number of complexes)
+        return self.rete_net._complex_bookkeeper.complex_stats()
+
+    def species_counts(self):
+        # {species:number of complexes}, where species are isomorphism classes of complexes
+        # species are only recomputed for complexes that changed since the last call
+        return self.rete_net._complex_bookkeeper.species_counts()
+
+    def set_instrumentation(self,on=True):
+        self.rete_net.set_instrumentation(on)
+        return self
+
+    def set_tracer(self,tracer=None):
+        # tracer is a rete_trace.TokenTracer, or None to stop tracing
+        if tracer is not None:
+            tracer.attach(self)
+        self.rete_net.set_tracer(tracer)
+        return self
+
+    def stats(self):
+        # returns {node_id:stats} for each node on the rete net
+        # terminal nodes of patterns also list their pattern ids under 'patterns'
+        stats = {node.id:node.get_stats() for node in self.rete_net}
+        for pattern_id,node in self.pattern_nodes.items():
+            if stats[node.id] is not None:
+                stats[node.id].setdefault('patterns',[]).append(pattern_id)
+        return stats
+
+    def set_recorder(self,recorder=None):
+        # recorder is a rete_replay.TokenRecorder, or None to stop recording
+        self._recorder = recorder
+        return self
 
     def send_token(self,token,verbose=False):
+        if self._recorder is not None:
+            self._recorder.record(token)
         root = self.rete_net.get_root()
         root.receive_token(token,self,verbose)
         return self
@@ -50,6 +98,26 @@ class Matcher(object):
                 print()
         return self
 
+    def load(self,nodes,edges=None,verbose=False):
+        # bulk-loads an initial state
+        # complexes are built in one pass, other nodes on the net receive the usual add tokens
+        # edges default to all relations between nodes
+        # edges are put in the same order as edge tokens, so that later remove tokens find them
+        nodes = list(nodes)
+        edges = get_edges(nodes) if edges is None else edges
+        edges = sorted((flip_edge_correctly(*e) for e in edges),key=lambda e: (e[0].id,e[1],e[2],e[3].id))
+        complex_node = self.rete_net._complex_bookkeeper
+        complex_node.load(nodes,edges)
+        root = self.rete_net.get_root()
+        successors = [x for x in root.successors if x is not complex_node]
+        tokens = [token_add_node(x) for x in nodes] + [token_add_edge(*e) for e in edges]
+        for token in tokens:
+            if self._recorder is not None:
+                self._recorder.record(token)
+            for node in successors:
+                node.receive_token(token,root,verbose)
+        return self
+
     def select_random(self,pattern_id,variable_name,n=1):
         p = self.get_pattern(pattern_id)
         toks = p.select_random(n)
@@ -59,6 +127,51 @@ class Matcher(object):
     def count(self,pattern_id):
         return self.get_pattern(pattern_id).count()
 
+    def iter_matches(self,pattern_id,**bindings):
+        # yields matches of pattern as {variable_name:node} dicts
+        # bindings fix some of the variables, e.g., iter_matches('p1',x=x001)
+        # lookups go through the key-value indexes of the token registers,
+        # so cost scales with the number of matches, not the register size
+        # complex ids used internally by same_complex are not part of matches
+        p = self.get_pattern(pattern_id)
+        prefix = pattern_id + ':'
+        query = Token()
+        for var,value in bindings.items():
+            new_var = prefix + var
+            if new_var not in p.variable_names:
+                raise FindError('Variable `'+var+'` not found in pattern `'+pattern_id+'`.')
+            query[new_var] = value
+        n = len(prefix)
+        for tok in p.iter_filter_request(query):
+            yield {key[n:]:value for key,value in tok.items() if not is_complex_variable(key)}
+
+    def get_matches(self,pattern_id,**bindings):
+        return list(self.iter_matches(pattern_id,**bindings))
+
+    def aggregate(self,pattern_id,op='count',groupby=None,variable=None,attribute=None):
+        # op(variable.attribute) over matches of pattern, optionally grouped by a variable
+        # e.g., aggregate('p1','count',groupby='a'), aggregate('p1','sum','a','x','v')
+        # returns {node:value} if groupby is given, else a single value
+        # the first call attaches an aggregate node to the pattern,
+        # which is then maintained incrementally as tokens arrive
+        if op not in aggregate.operators:
+            raise BuildError('Aggregate operation `'+str(op)+'` not supported.')
+        if op!='count' and (variable is None or attribute is None):
+            raise BuildError('Aggregate operation `'+op+'` requires a variable and an attribute.')
+        p = self.get_pattern(pattern_id)
+        new_vars = []
+        for var in [groupby,variable]:
+            new_var = None
+            if var is not None:
+                new_var = pattern_id + ':' + var
+                if new_var not in p.variable_names:
+                    raise FindError('Variable `'+var+'` not found in pattern `'+pattern_id+'`.')
+            new_vars.append(new_var)
+        if op=='count':
+            new_vars[1],attribute = None,None
+        spec = (op,new_vars[0],new_vars[1],attribute)
+        return add_aggregate(self.rete_net,p,spec).results()
+
 def main():
     pass
 
@@ -153,14 +153,26 @@ class Pattern(DictLike):
             is_not_in = [('is_not_in',x) for x in self._expressions['is_not_in']]
         return is_not_in
 
+    def generate_queries_COMPLEX(self):
+        complex_queries = []
+        for kw in ['same_complex','different_complex']:
+            if kw in self._expressions:
+                complex_queries.extend((kw,x) for x in sorted(self._expressions[kw]))
+        return complex_queries
+
     def generate_queries(self):
-        return {
+        qdict = {
             'type': self.generate_queries_TYPE(),
             'attr': self.generate_queries_ATTR(),
             'rel': self.generate_queries_REL(),
             'is_in': self.generate_queries_ISIN(),
             'is_not_in': self.generate_queries_ISNOTIN(),
         }
+        # only patterns with complex expressions have complex queries
+        complex_queries = self.generate_queries_COMPLEX()
+        if complex_queries:
+            qdict['complex'] = complex_queries
+        return qdict
 
 def main():
     pass
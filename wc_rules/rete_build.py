@@ -1,5 +1,6 @@
 from . import rete_nodes as rn
 from .utils import BuildError
+from .rete_token import Token, COMPLEX_SUFFIX
 from collections import defaultdict
 from numpy import argmax
 
@@ -38,12 +39,12 @@ def add_checkATTR_path(net,current_node,attr_vec):
         current_node = check_attribute_and_add_successor(net,current_node,rn.checkATTR,'tuple_of_attr_tuples',tuple(new_tuples))
     return current_node
 
-def add_store(net,current_node,number_of_variables):
+def add_store(net,current_node,number_of_variables,keys=None):
     existing_stores = [x for x in current_node.successors if isinstance(x,rn.store)]
     if len(existing_stores) == 1:
         current_node = existing_stores[0]
     elif len(existing_stores) == 0:
-        new_node = rn.store(number_of_variables=number_of_variables)
+        new_node = rn.store(number_of_variables=number_of_variables,keys=keys)
         net.add_edge(current_node,new_node)
         current_node = new_node
     else:
@@ -61,6 +62,26 @@ def add_alias(net,current_node,keymap,is_not_in=False):
         current_node.set_keymap(key,keymap[key])
     return current_node
 
+def add_aggregate(net,current_node,spec):
+    # aggregates attach to a pattern node as sinks
+    # a new aggregate is initialized with the matches already in the pattern node
+    existing = [x for x in current_node.successors if isinstance(x,rn.aggregate) and x.spec==spec]
+    if len(existing) == 1:
+        return existing[0]
+    if len(existing) > 1:
+        raise BuildError('Duplicates on the Rete net! Bad!')
+    new_node = rn.aggregate(spec)
+    net.add_edge(current_node,new_node)
+    new_node.initialize(current_node.iter_filter_request(Token()))
+    return new_node
+
+def add_complex_membership(net,varname,complex_varname,is_not_in=False):
+    # complex membership tokens {'node','complex'} are stored under the complex bookkeeper
+    current_node = net._complex_bookkeeper
+    current_node = add_store(net,current_node,2,keys=('node','complex'))
+    keymap = {'node':varname,'complex':complex_varname}
+    return add_alias(net,current_node,keymap,is_not_in)
+
 def add_checkEDGE(net,current_node,attr1,attr2):
     attrpair = tuple([attr1,attr2])
     current_node = check_attribute_and_add_successor(net,current_node,rn.checkEDGE,'attribute_pair',attrpair)
@@ -141,6 +162,22 @@ def increment_net_with_pattern(net,pattern,existing_patterns):
         current_node = add_alias(net,current_node,keymap,is_not_in)
         vartuple_nodes[tuple(sorted(target_varlist))].add(current_node)
 
+    # same_complex(x,y,...) joins x,y,... on a shared complex id variable
+    # different_complex(x,y,...) requires each later variable to be outside the complex of each earlier one
+    # the negations are merged last, when all their variables are bound
+    negations = []
+    for kw,variables in qdict.get('complex',[]):
+        for var in variables:
+            if var not in new_varnames:
+                raise BuildError('Variable `'+var+'` not found in pattern `'+pattern.id+'`.')
+        for i,var in enumerate(variables):
+            complex_varname = new_varnames[variables[0] if kw=='same_complex' else var] + COMPLEX_SUFFIX
+            current_node = add_complex_membership(net,new_varnames[var],complex_varname)
+            vartuple_nodes[tuple(sorted([new_varnames[var],complex_varname]))].add(current_node)
+            if kw=='different_complex':
+                for var2 in variables[i+1:]:
+                    negations.append(add_complex_membership(net,new_varnames[var2],complex_varname,is_not_in=True))
+
     vartuple_nodes2 = dict()
     for vartuple, nodeset in vartuple_nodes.items():
         if len(nodeset) > 1:
@@ -152,4 +189,6 @@ def increment_net_with_pattern(net,pattern,existing_patterns):
     sorted_vartuples = sort_tuples(sorted(vartuple_nodes2))
     sorted_nodes = list(vartuple_nodes2[x] for x in sorted_vartuples)
     current_node = add_mergenode_path(net,sorted_nodes)
+    for node in negations:
+        current_node = add_mergenode(net,current_node,node)
     return current_node
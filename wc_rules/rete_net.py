@@ -6,6 +6,8 @@ from collections import deque
 class ReteNet(SetLike):
     def __init__(self):
         super().__init__()
+        self._instrumented = False
+        self._tracer = None
         R = Root()
         self.add(R)
         self._root = R
@@ -13,6 +15,29 @@ class ReteNet(SetLike):
         self._complex_bookkeeper = C
         self.add_edge(R,C)
 
+    def add(self,node):
+        if node not in self and self._instrumented:
+            node.set_instrumentation(True)
+        if node not in self and self._tracer is not None:
+            node.set_tracer(self._tracer)
+        return super().add(node)
+
+    def set_instrumentation(self,on=True):
+        # turns per-node stats on (resetting them) or off for every node,
+        # including nodes added later
+        self._instrumented = on
+        for node in self:
+            node.set_instrumentation(on)
+        return self
+
+    def set_tracer(self,tracer=None):
+        # attaches a rete_trace.TokenTracer to every node, including nodes added later
+        # set_tracer(None) detaches it
+        self._tracer = tracer
+        for node in self.depth_first_search(self.get_root()):
+            node.set_tracer(tracer)
+        return self
+
     def add_edge(self,node1,node2):
         self.add(node1)
         self.add(node2)
@@ -36,12 +61,16 @@ class ReteNet(SetLike):
             visited.add(current_node)
             yield current_node
 
-    def draw_as_gml(self,filename=None):
+    def draw_as_gml(self,filename=None,annotations=None):
+        # annotations is an optional {node_id:text} dict appended to node labels
+        # e.g., from rete_trace_analysis.TraceAnalysis.annotations()
         node_labels, node_categories, idx_dict = dict(),dict(),dict()
         edge_tuples = list()
         start_node = self.get_root()
         for idx,node in enumerate(self.depth_first_search(start_node)):
             node_labels[idx] = '(' + str(idx) + ')' + str(node)
+            if annotations is not None and node.id in annotations:
+                node_labels[idx] += '\n' + annotations[node.id]
             node_categories[idx] = node.__class__.__name__
             idx_dict[node.id] = idx
         for node in self:
@@ -1,8 +1,28 @@
 from .utils import generate_id
-from .rete_token import new_token,TokenRegister
-from sortedcontainers import SortedSet
+from .rete_token import new_token,TokenRegister,AddToken,RemoveToken
+from sortedcontainers import SortedSet, SortedList
 from operator import attrgetter
 from .euler_tour import EulerTour, EulerTourIndex
+from collections import Counter
+from time import perf_counter
+
+class NodeStats(object):
+    def __init__(self):
+        # token counters are keyed by token type, i.e., 'add' or 'remove'
+        # tokens_failed counts incoming tokens that produced no outgoing tokens
+        # time is spent in entry_check and process_token, excluding successors
+        self.tokens_in = Counter()
+        self.tokens_passed = Counter()
+        self.tokens_failed = Counter()
+        self.time = 0.0
+
+    def as_dict(self):
+        return {
+            'tokens_in': dict(self.tokens_in),
+            'tokens_passed': dict(self.tokens_passed),
+            'tokens_failed': dict(self.tokens_failed),
+            'time': self.time,
+        }
 
 class ReteNode(object):
     def __init__(self,id=None):
@@ -11,6 +31,8 @@ class ReteNode(object):
         self.id = id
         self.predecessors = set()
         self.successors = SortedSet(key=attrgetter('priority'))
+        self._stats = None
+        self._tracer = None
 
     # Rules for token-passing.
     # On receiving a token, do NOT modify it.
@@ -20,6 +42,8 @@ class ReteNode(object):
     def receive_token(self,token,sender,verbose=False):
         # logic for receiving tokens
         # subsequent calls to process_token and send_token
+        if self._stats is not None or self._tracer is not None:
+            return self.receive_token_instrumented(token,sender,verbose)
         tokens = []
         if self.entry_check(token):
             tokens = self.process_token(token,sender,verbose)
@@ -27,6 +51,51 @@ class ReteNode(object):
             self.send_token(token,verbose)
         return
 
+    def receive_token_instrumented(self,token,sender,verbose=False):
+        # same as receive_token, but updates self._stats and/or writes to self._tracer
+        stats,tracer = self._stats,self._tracer
+        token_type = token.get_type()
+        timestamp = tracer.timestamp() if tracer is not None else None
+        start = perf_counter()
+        tokens = []
+        entered = self.entry_check(token)
+        if entered:
+            tokens = self.process_token(token,sender,verbose)
+        if stats is not None:
+            stats.time += perf_counter() - start
+            stats.tokens_in[token_type] += 1
+            if len(tokens)==0:
+                stats.tokens_failed[token_type] += 1
+            for tok in tokens:
+                stats.tokens_passed[tok.get_type()] += 1
+        if tracer is not None:
+            tracer.record(self,token,entered,len(tokens),timestamp)
+        for token in tokens:
+            self.send_token(token,verbose)
+        return
+
+    # Instrumentation
+    def set_instrumentation(self,on=True):
+        self._stats = NodeStats() if on else None
+        return self
+
+    def set_tracer(self,tracer=None):
+        self._tracer = tracer
+        if tracer is not None:
+            tracer.register_node(self)
+        return self
+
+    def get_stats(self):
+        if self._stats is None:
+            return None
+        d = self._stats.as_dict()
+        d.update(id=self.id,type=self.__class__.__name__,label=str(self))
+        register = getattr(self,'_register',None)
+        if register is not None:
+            d['register_size'] = len(register)
+            d['register_bytes'] = register.approximate_size()
+        return d
+
     def send_token(self,token,verbose=False):
         # logic for sending token to successors
         for node in self.successors:
@@ -246,10 +315,11 @@ class checkEDGE(check):
         return tokens_to_pass
 
 class store(SingleInputNode):
-    def __init__(self,id=None,number_of_variables=1):
+    def __init__(self,id=None,number_of_variables=1,keys=None):
         super().__init__(id)
         self._register = TokenRegister()
         self._number_of_variables = number_of_variables
+        self._keys = keys
         self.priority = 2
 
     def __str__(self):
@@ -259,6 +329,8 @@ class store(SingleInputNode):
         return len(self._register)
 
     def keys(self):
+        if self._keys is not None:
+            return list(self._keys)
         if self._number_of_variables==1:
             return ['node']
         if self._number_of_variables==2:
@@ -318,6 +390,9 @@ class store(SingleInputNode):
     def filter_request(self,token):
         return self.filter(token)
 
+    def iter_filter_request(self,token):
+        return self._register.iter_filter(token)
+
     def select_random(self,n=1):
         return self._register.select_random(n)
 
@@ -374,6 +449,12 @@ class alias(SingleInputNode):
         new_results = [new_token(x,keymap=self.keymap) for x in results]
         return set(new_results)
 
+    def iter_filter_request(self,token):
+        newtoken = new_token(token,keymap=self.reverse_keymap,subsetkeys=list(self.reverse_keymap.keys()))
+        predecessor = list(self.predecessors)[0]
+        for x in predecessor.iter_filter_request(newtoken):
+            yield new_token(x,keymap=self.keymap)
+
     def select_random(self,n=1):
         predecessor = list(self.predecessors)[0]
         return predecessor.select_random(n)
@@ -424,6 +505,9 @@ class is_not_in(alias):
             return set([token])
         return set()
 
+    def iter_filter_request(self,token):
+        return iter(self.filter_request(token))
+
 class merge(ReteNode):
     def __init__(self,var_tuple,id=None):
         super().__init__(id)
@@ -449,6 +533,10 @@ class merge(ReteNode):
     def filter_request(self,token):
         newtoken = new_token(token,subsetkeys=list(self.variable_names))
         return self.filter(newtoken)
+
+    def iter_filter_request(self,token):
+        newtoken = new_token(token,subsetkeys=list(self.variable_names))
+        return self._register.iter_filter(newtoken)
     ### Merge does not have passthrough functionality.
     # depending on whether token is Add or Remove
     # they update their register
@@ -508,16 +596,134 @@ class merge(ReteNode):
     def count(self):
         return len(self._register)
 
+class aggregate(ReteNode):
+    operators = ('count','sum','min','max')
+
+    def __init__(self,spec,id=None):
+        super().__init__(id)
+        # spec is a tuple (op,groupby,variable,attribute)
+        # op is one of count, sum, min, max
+        # groupby is a variable name or None
+        # variable.attribute is the value being aggregated (None for count)
+        self.spec = spec
+        self.op,self.groupby,self.variable,self.attribute = spec
+        self._contributions = dict()
+        self._counts = dict()
+        self._values = dict()
+        self.priority = 5
+
+    def __str__(self):
+        strs = [self.op]
+        if self.variable is not None:
+            strs.append(self.variable+'.'+self.attribute)
+        if self.groupby is not None:
+            strs.append('by '+self.groupby)
+        return ' '.join(strs)
+
+    def __len__(self):
+        return len(self._counts)
+
+    ### aggregate is a SINK.
+    # It receives add/remove tokens from a pattern node
+    # and updates a per-group accumulator for each token.
+    # count and sum are O(1) per token, min and max are O(log n) per token.
+    # Values are read when the match is added and remembered until it is removed,
+    # so edits to an attribute the pattern does not constrain are not seen.
+
+    def get_group(self,token):
+        if self.groupby is None:
+            return None
+        return token[self.groupby]
+
+    def get_value(self,token):
+        if self.variable is None:
+            return None
+        return getattr(token[self.variable],self.attribute)
+
+    def add_match(self,token):
+        key = frozenset(token.items())
+        if key in self._contributions:
+            return False
+        group,value = self.get_group(token),self.get_value(token)
+        self._contributions[key] = (group,value)
+        self._counts[group] = self._counts.get(group,0) + 1
+        if value is not None:
+            if self.op=='sum':
+                self._values[group] = self._values.get(group,0) + value
+            if self.op in ['min','max']:
+                if group not in self._values:
+                    self._values[group] = SortedList()
+                self._values[group].add(value)
+        return True
+
+    def remove_match(self,token):
+        key = frozenset(token.items())
+        if key not in self._contributions:
+            return False
+        group,value = self._contributions.pop(key)
+        self._counts[group] -= 1
+        if value is not None:
+            if self.op=='sum':
+                self._values[group] -= value
+            if self.op in ['min','max']:
+                self._values[group].remove(value)
+        if self._counts[group]==0:
+            del self._counts[group]
+            self._values.pop(group,None)
+        return True
+
+    def initialize(self,tokens):
+        for token in tokens:
+            self.add_match(token)
+        return self
+
+    def process_token(self,token,sender,verbose):
+        passthrough_fail = ''
+        if token.get_type()=='add':
+            if not self.add_match(token):
+                passthrough_fail = 'Token already aggregated. Cannot add again!'
+        if token.get_type()=='remove':
+            if not self.remove_match(token):
+                passthrough_fail = 'Token not aggregated. Cannot remove!'
+        if verbose:
+            print(self.verbose_mode_message(token,passthrough_fail=passthrough_fail))
+        return []
+
+    def get_result(self,group):
+        if self.op=='count':
+            return self._counts.get(group,0)
+        if self.op=='sum':
+            return self._values.get(group,0)
+        values = self._values.get(group)
+        if values is None or len(values)==0:
+            return None
+        if self.op=='min':
+            return values[0]
+        return values[-1]
+
+    def results(self):
+        if self.groupby is None:
+            return self.get_result(None)
+        return {group:self.get_result(group) for group in self._counts}
+
+    def count(self):
+        return len(self._contributions)
+
 class Complex(ReteNode):
     def __init__(self,id=None):
         super().__init__(id)
         self._index = EulerTourIndex()
         self.priority = 1
 
+    def __str__(self):
+        return 'complex'
+
     def node_exists(self,node):
-        return self._index.get_mapped_tour(node) is not None
+        return self._index.has_node(node)
     def node_is_singleton(self,node):
-        return len(self._index.get_mapped_tour(node).get_nodes())==1
+        return len(self._index.get_mapped_tour(node))==1
+    def get_complex_id(self,node):
+        return self._index.get_mapped_tour(node).id
     def add_node(self,node):
         self._index.create_new_tour_from_node(node)
         return self
@@ -530,29 +736,87 @@ class Complex(ReteNode):
     def remove_edge(self,edge):
         self._index.augcut(edge)
         return self
+    def load(self,nodes,edges):
+        self._index.build_from_graph(nodes,edges)
+        if self.is_emitting():
+            for node in nodes:
+                self.send_token(self.membership_token(node,'add'),False)
+        return self
+    def complex_stats(self):
+        return self._index.get_complex_stats()
+    def species_counts(self):
+        return self._index.get_species_counts()
+    def count_complexes(self):
+        return self._index.count_complexes()
+    def set_add_only(self,on=True):
+        # with successors, every merge needs complex ids, which builds the tours anyway
+        self._index.set_add_only(on)
+        return self
+
+    ### Complex is a SINK for graph tokens.
+    # If it has successors, it also emits membership tokens {'node':node,'complex':complex_id}
+    # (add when a node joins a complex, remove when it leaves one).
+    # On a merge, only nodes of the smaller complex change their id,
+    # and on a split, only nodes of the smaller part, so the work is amortized small-to-large.
+    def is_emitting(self):
+        return len(self.successors) > 0
+    def membership_token(self,node,token_type,complex_id=None):
+        if complex_id is None:
+            complex_id = self.get_complex_id(node)
+        _class = AddToken if token_type=='add' else RemoveToken
+        return _class({'node':node,'complex':complex_id})
+    def membership_changes(self,nodes,old_id):
+        tokens = []
+        for node in nodes:
+            tokens.append(self.membership_token(node,'remove',old_id))
+            tokens.append(self.membership_token(node,'add'))
+        return tokens
 
     def process_token(self,token,sender,verbose):
         token_type = token.get_type()
         tokens_to_pass = []
         passthrough_fail = ''
+        emitting = self.is_emitting()
 
         # Adding and removing singletons of nodes
         if 'node' in token:
             node = token['node']
             if token_type=='add' and not self.node_exists(node):
                 self.add_node(node)
+                if emitting:
+                    tokens_to_pass.append(self.membership_token(node,'add'))
+            elif token_type=='add' and 'modified_attrs' in token and len(token['modified_attrs'])>0:
+                # attribute edits change the species of the complex
+                self._index.invalidate_node(node)
             if token_type=='remove':
                 assert self.node_is_singleton(node)
+                if emitting:
+                    tokens_to_pass.append(self.membership_token(node,'remove'))
                 self.remove_node(node)
 
         # Adding and removing edges
         if 'node1' in token and 'node2' in token:
             edge = tuple([token[x] for x in ['node1','attr1','attr2','node2']])
+            node1,node2 = edge[0],edge[3]
             if token_type=='add':
+                moved,old_id = [],None
+                if emitting:
+                    tours = self._index.find_edge(node1,node2)
+                    if len(tours)==2:
+                        small = self._index.sort_tours(tours)[1]
+                        moved,old_id = small.get_nodes(),small.id
                 self.add_edge(edge)
+                tokens_to_pass.extend(self.membership_changes(moved,old_id))
             if token_type=='remove':
+                old_id = self.get_complex_id(node1)
                 self.remove_edge(edge)
+                if emitting:
+                    tours = self._index.find_edge(node1,node2)
+                    new = [x for x in tours if x.id != old_id]
+                    if len(new) > 0:
+                        tokens_to_pass.extend(self.membership_changes(new[0].get_nodes(),old_id))
 
         if verbose:
             print(self.verbose_mode_message(token,tokens_to_pass,passthrough_fail))
         return tokens_to_pass
+
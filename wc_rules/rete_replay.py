@@ -0,0 +1,166 @@
+from .rete_token import AddToken, RemoveToken
+from .utils import ReplayError
+from time import perf_counter
+import importlib
+import pickle
+import gzip
+import tracemalloc
+
+VERSION = 1
+TOKEN_CLASSES = {'add':AddToken,'remove':RemoveToken}
+
+# Values in a recorded token are either literals (strings, numbers, tuples of attribute names, None)
+# or references to entities, which are stored by position in the entity table
+LITERAL = 0
+ENTITY = 1
+
+class TokenRecorder(object):
+    '''
+    Records the exact sequence of tokens sent to a Matcher, for replaying later.
+
+    recorder = TokenRecorder()
+    matcher.set_recorder(recorder)
+    ... simulate ...
+    matcher.set_recorder(None)
+    recorder.save('run.tokens.gz',matcher)
+
+    Entities are stored once, by class and id. For tokens that modify attributes,
+    the values of the modified attributes at the time of sending are stored too,
+    so that the replay sees the same attribute values as the original run.
+    If a matcher is passed to save(), its final counts are stored for validation.
+
+    The file is a gzipped pickle of plain tuples, so only load files you trust.
+    '''
+    def __init__(self):
+        self.classes = []
+        self.class_index = dict()
+        self.entities = []
+        self.entity_index = dict()
+        self.records = []
+
+    def __len__(self):
+        return len(self.records)
+
+    def encode_class(self,_class):
+        key = (_class.__module__,_class.__qualname__)
+        if key not in self.class_index:
+            self.class_index[key] = len(self.classes)
+            self.classes.append(key)
+        return self.class_index[key]
+
+    def encode_entity(self,entity):
+        if entity.id not in self.entity_index:
+            self.entity_index[entity.id] = len(self.entities)
+            self.entities.append((self.encode_class(entity.__class__),entity.id))
+        return self.entity_index[entity.id]
+
+    def encode_value(self,value):
+        if hasattr(value,'id'):
+            return (ENTITY,self.encode_entity(value))
+        return (LITERAL,value)
+
+    def record(self,token):
+        items = tuple((key,)+self.encode_value(value) for key,value in token.items())
+        snapshot = None
+        if 'node' in token and 'modified_attrs' in token:
+            node = token['node']
+            snapshot = tuple((attr,getattr(node,attr)) for attr in token['modified_attrs'])
+        self.records.append((token.get_type(),items,snapshot))
+        return self
+
+    def to_dict(self,matcher=None):
+        counts = None
+        if matcher is not None:
+            counts = {pattern_id:matcher.count(pattern_id) for pattern_id in matcher.pattern_nodes}
+        return dict(version=VERSION,classes=self.classes,entities=self.entities,records=self.records,counts=counts)
+
+    def save(self,filename,matcher=None):
+        with gzip.open(filename,'wb') as file:
+            pickle.dump(self.to_dict(matcher),file,protocol=pickle.HIGHEST_PROTOCOL)
+        return self
+
+class TokenReplayer(object):
+    '''
+    Rebuilds entities and tokens from a recorded token stream and feeds them to a Matcher at full speed.
+
+    replayer = TokenReplayer.load('run.tokens.gz')
+    matcher = Matcher()
+    ... add the same patterns as the original run ...
+    result = replayer.run(matcher)
+
+    result is a dict with n_tokens, seconds, tokens_per_second, peak_memory (bytes, if trace_memory=True),
+    counts (final count per pattern) and expected_counts (counts stored by the recorder, if any).
+
+    Entity classes are imported by module and qualified name,
+    unless given in `classes` as a {qualified_name:class} dict.
+    '''
+    def __init__(self,stream,classes=None):
+        if stream['version'] != VERSION:
+            raise ReplayError('Unsupported token stream version.')
+        self.stream = stream
+        self.class_overrides = classes if classes is not None else dict()
+
+    @classmethod
+    def load(cls,filename,classes=None):
+        with gzip.open(filename,'rb') as file:
+            stream = pickle.load(file)
+        return cls(stream,classes)
+
+    @classmethod
+    def from_recorder(cls,recorder,classes=None):
+        return cls(recorder.to_dict(),classes)
+
+    def __len__(self):
+        return len(self.stream['records'])
+
+    def resolve_class(self,module,qualname):
+        if qualname in self.class_overrides:
+            return self.class_overrides[qualname]
+        try:
+            obj = importlib.import_module(module)
+            for name in qualname.split('.'):
+                obj = getattr(obj,name)
+        except (ImportError,AttributeError):
+            raise ReplayError('Could not find class ' + module + '.' + qualname)
+        return obj
+
+    def build_entities(self):
+        classes = [self.resolve_class(*x) for x in self.stream['classes']]
+        return [classes[i](id=idx) for i,idx in self.stream['entities']]
+
+    def build_tokens(self):
+        # returns a list of (token,node,snapshot), ready to be sent
+        entities = self.build_entities()
+        tokens = []
+        for token_type,items,snapshot in self.stream['records']:
+            contents = dict()
+            for key,kind,value in items:
+                contents[key] = entities[value] if kind==ENTITY else value
+            node = contents.get('node',None)
+            tokens.append((TOKEN_CLASSES[token_type](contents),node,snapshot))
+        return tokens
+
+    def run(self,matcher,trace_memory=False):
+        tokens = self.build_tokens()
+        if trace_memory:
+            tracemalloc.start()
+        start = perf_counter()
+        for token,node,snapshot in tokens:
+            if snapshot is not None:
+                for attr,value in snapshot:
+                    setattr(node,attr,value)
+            matcher.send_token(token)
+        seconds = perf_counter() - start
+        peak_memory = None
+        if trace_memory:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        n = len(tokens)
+        return dict(
+            n_tokens = n,
+            seconds = seconds,
+            tokens_per_second = n/seconds if seconds > 0 else float('inf'),
+            peak_memory = peak_memory,
+            counts = {pattern_id:matcher.count(pattern_id) for pattern_id in matcher.pattern_nodes},
+            expected_counts = self.stream['counts'],
+            )
@@ -1,5 +1,6 @@
 from .utils import generate_id, iter_to_string
 import random
+import sys
 
 class Token(object):
     def __init__(self,contents=None):
@@ -26,12 +27,15 @@ class Token(object):
         # merge if and only if
         # shared keys have the same values
         # non-shared keys all have unique values
+        # (except complex ids, which nodes of the same complex share)
         common_keys = set(self.keys()) & set(token.keys())
         new_keys = set(token.keys()) - common_keys
         for key in common_keys:
             if self[key] != token[key]:
                 return None
         for key in new_keys:
+            if is_complex_variable(key):
+                continue
             if token[key] in self.values():
                 return None
         newtoken = new_token(self)
@@ -51,6 +55,12 @@ class Token(object):
 
     def get_type(self): return None
 
+# pattern variables holding the complex id of a node are named <variable>.complex
+COMPLEX_SUFFIX = '.complex'
+
+def is_complex_variable(key):
+    return key.endswith(COMPLEX_SUFFIX)
+
 class AddToken(Token):
     def get_type(self): return 'add'
 
@@ -121,8 +131,27 @@ class TokenRegister(object):
             return self._dict[tuple([key,value])]
         return set()
 
+    def candidate_sets(self,token):
+        # sets of tokens matching each key-value pair, smallest first
+        return sorted((self.getkv(key,value) for key,value in token.items()),key=len)
+
     def filter(self,token):
-        return set.intersection(*(self.getkv(key,value) for key, value in token.items()))
+        candidates = self.candidate_sets(token)
+        if len(candidates)==0:
+            return set(self._set)
+        return set.intersection(*candidates)
+
+    def iter_filter(self,token):
+        # walks the smallest candidate set and checks membership in the others
+        # so the cost is proportional to the smallest candidate set, not the register
+        candidates = self.candidate_sets(token)
+        if len(candidates)==0:
+            yield from self._set
+            return
+        smallest, others = candidates[0], candidates[1:]
+        for tok in smallest:
+            if all(tok in x for x in others):
+                yield tok
 
     def get(self,token):
         f = self.filter(token)
@@ -134,6 +163,13 @@ class TokenRegister(object):
     def select_random(self,n=1):
         return random.sample(self._set,n)
 
+    def approximate_size(self):
+        # bytes used by the register's containers and tokens, not the nodes they refer to
+        size = sys.getsizeof(self._dict) + sys.getsizeof(self._set)
+        size += sum(sys.getsizeof(k) + sys.getsizeof(v) for k,v in self._dict.items())
+        size += sum(sys.getsizeof(x) + sys.getsizeof(x._dict) for x in self._set)
+        return size
+
 def token_add_node(node):
     attrlist = node.get_nonempty_scalar_attributes(ignore_id=True)
     return AddToken({'node':node,'modified_attrs':tuple(attrlist)})
@@ -170,3 +206,16 @@ def token_remove_null_edge(node1,attr1):
     node2 = None
     node1,attr1,attr2,node2 = flip_edge_correctly(node1,attr1,attr2,node2)
     return RemoveNullToken({'node1':node1,'attr1':attr1,'attr2':attr2,'node2':node2})
+
+def get_edges(nodes):
+    # canonical (node1,attr1,attr2,node2) tuples for relations between nodes
+    # relations to nodes outside nodes are left out
+    nodes = set(nodes)
+    edges = set()
+    for node1 in nodes:
+        for attr1 in node1.get_nonempty_related_attributes():
+            attr2 = node1.__class__.Meta.local_attributes[attr1].related_name
+            for node2 in node1.listget(attr1):
+                if node2 in nodes:
+                    edges.add(flip_edge_correctly(node1,attr1,attr2,node2))
+    return edges
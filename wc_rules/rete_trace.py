@@ -0,0 +1,171 @@
+from .utils import TraceError
+from time import perf_counter_ns
+import hashlib
+import struct
+import mmap
+import json
+
+# Each record is a fixed-size binary struct:
+# node index (uint32), token type (uint8), outcome (uint8),
+# number of tokens passed on (uint16), key hash (int64), timestamp in ns (uint64)
+RECORD = struct.Struct('<IBBHqQ')
+
+# File header: magic, version, record size, capacity, number of records written
+HEADER = struct.Struct('<4sIIQQ')
+MAGIC = b'WCRT'
+VERSION = 1
+
+TOKEN_TYPES = {None:0,'add':1,'remove':2}
+TOKEN_TYPE_NAMES = {v:k for k,v in TOKEN_TYPES.items()}
+
+# Outcomes
+FAILED_ENTRY = 0    # token failed entry_check
+STOPPED = 1         # token was processed, but nothing was passed on
+PASSED = 2          # token was processed and one or more tokens were passed on
+OUTCOME_NAMES = {FAILED_ENTRY:'failed_entry',STOPPED:'stopped',PASSED:'passed'}
+
+def token_key_hash(token):
+    # hash of a token's bindings, ignoring modified_attrs,
+    # so that add and remove tokens of the same match hash alike.
+    # Nodes are hashed by id, and the digest does not depend on the process
+    # (unlike hash()), so traces from different runs can be compared.
+    items = sorted((key,repr(getattr(value,'id',value))) for key,value in token.items() if key!='modified_attrs')
+    digest = hashlib.blake2b(repr(items).encode(),digest_size=8).digest()
+    return int.from_bytes(digest,'little',signed=True)
+
+class TokenTracer(object):
+    '''
+    Records which tokens went through which nodes of a rete net as compact binary records.
+
+    Records are written to a ring buffer of `capacity` records, either in memory
+    or in a memory-mapped file (if `filename` is given). When the buffer is full,
+    the oldest records are overwritten.
+
+    Usage:
+        tracer = TokenTracer(capacity=10**6,filename='run.trace')
+        matcher.set_tracer(tracer)
+        ... send tokens ...
+        matcher.set_tracer(None)
+        tracer.close()
+
+    close() also writes a description of the net (nodes, edges and pattern nodes)
+    to `filename + '.json'`, which rete_trace_analysis uses to rebuild paths offline.
+    '''
+    def __init__(self,capacity=2**20,filename=None):
+        self.capacity = capacity
+        self.filename = filename
+        self.count = 0
+        self.node_index = dict()
+        self.nodes = list()
+        self._matcher = None
+        self._file = None
+        size = capacity*RECORD.size
+        if filename is None:
+            self._buffer = bytearray(size)
+            self._offset = 0
+        else:
+            self._file = open(filename,'w+b')
+            self._file.truncate(HEADER.size + size)
+            self._buffer = mmap.mmap(self._file.fileno(),HEADER.size + size)
+            self._offset = HEADER.size
+            self.write_header()
+
+    def __len__(self):
+        return min(self.count,self.capacity)
+
+    # Registering the net
+    def attach(self,matcher):
+        self._matcher = matcher
+        return self
+
+    def register_node(self,node):
+        if node.id not in self.node_index:
+            self.node_index[node.id] = len(self.nodes)
+            self.nodes.append(node)
+        return self
+
+    def describe(self):
+        nodes = [dict(index=i,id=node.id,type=node.__class__.__name__,label=str(node)) for i,node in enumerate(self.nodes)]
+        edges = []
+        for node in self.nodes:
+            for node2 in node.successors:
+                if node2.id in self.node_index:
+                    edges.append((self.node_index[node.id],self.node_index[node2.id]))
+        patterns = dict()
+        if self._matcher is not None:
+            for pattern_id,node in self._matcher.pattern_nodes.items():
+                if node.id in self.node_index:
+                    patterns[pattern_id] = self.node_index[node.id]
+        return dict(nodes=nodes,edges=sorted(edges),patterns=patterns)
+
+    # Writing records
+    @staticmethod
+    def timestamp():
+        return perf_counter_ns()
+
+    def record(self,node,token,entered,n_out,timestamp):
+        if not entered:
+            outcome = FAILED_ENTRY
+        elif n_out==0:
+            outcome = STOPPED
+        else:
+            outcome = PASSED
+        position = self._offset + (self.count % self.capacity)*RECORD.size
+        RECORD.pack_into(self._buffer,position,
+            self.node_index[node.id],
+            TOKEN_TYPES[token.get_type()],
+            outcome,
+            min(n_out,0xFFFF),
+            token_key_hash(token),
+            timestamp,
+            )
+        self.count += 1
+        return self
+
+    def write_header(self):
+        if self._file is not None:
+            HEADER.pack_into(self._buffer,0,MAGIC,VERSION,RECORD.size,self.capacity,self.count)
+        return self
+
+    def flush(self):
+        if self._file is not None:
+            self.write_header()
+            self._buffer.flush()
+        return self
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._buffer.close()
+            self._file.close()
+            self._file = None
+            with open(self.filename + '.json','w') as file:
+                json.dump(self.describe(),file)
+        return self
+
+    # Reading records
+    def records(self):
+        # yields (node_index,token_type,outcome,n_out,key_hash,timestamp), oldest first
+        return iter_records(self._buffer,self._offset,self.capacity,self.count)
+
+def iter_records(buffer,offset,capacity,count):
+    start = 0 if count <= capacity else count % capacity
+    for i in range(min(count,capacity)):
+        position = offset + ((start + i) % capacity)*RECORD.size
+        yield RECORD.unpack_from(buffer,position)
+
+def read_trace(filename):
+    # returns (list of records, description of net) for a trace written by TokenTracer
+    with open(filename,'rb') as file:
+        buffer = file.read()
+    if len(buffer) < HEADER.size:
+        raise TraceError('Not a token trace file: ' + filename)
+    magic,version,record_size,capacity,count = HEADER.unpack_from(buffer,0)
+    if magic != MAGIC or record_size != RECORD.size:
+        raise TraceError('Not a token trace file: ' + filename)
+    if len(buffer) < HEADER.size + capacity*RECORD.size:
+        raise TraceError('Token trace file is truncated: ' + filename)
+    records = list(iter_records(buffer,HEADER.size,capacity,count))
+    with open(filename + '.json','r') as file:
+        description = json.load(file)
+    return records,description
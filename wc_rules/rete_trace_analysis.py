@@ -0,0 +1,113 @@
+from .rete_trace import read_trace, TOKEN_TYPES, PASSED, OUTCOME_NAMES
+from collections import defaultdict, Counter
+
+class TraceAnalysis(object):
+    '''
+    Offline analysis of records written by rete_trace.TokenTracer.
+
+    A = TraceAnalysis.from_file('run.trace')
+    A = TraceAnalysis.from_tracer(tracer)
+
+    A.node_summary()         {node_id:summary}, where summary has token counts,
+                             outcome counts, fan-out and cancellation rate
+    A.fan_out()              {node_id: tokens passed on / tokens received}
+    A.cancellation_rates()   {node_id: fraction of passed add tokens later cancelled by a passed remove token}
+    A.hot_paths()            {pattern_id: [node_id,...]}, the busiest path from root to the pattern node
+    A.annotations()          {node_id:text}, to be used with ReteNet.draw_as_gml(annotations=...)
+
+    Nodes are identified by their id on the rete net.
+    '''
+    def __init__(self,records,description):
+        self.nodes = description['nodes']
+        self.edges = [tuple(x) for x in description['edges']]
+        self.patterns = description['patterns']
+        self.ids = [x['id'] for x in self.nodes]
+        self.predecessors = defaultdict(set)
+        for i,j in self.edges:
+            self.predecessors[j].add(i)
+        self.n_records = 0
+        self.time_span = 0
+        self.tokens_in = Counter()
+        self.tokens_out = Counter()
+        self.outcomes = defaultdict(Counter)
+        self.cancelled = Counter()
+        self.passed_adds = Counter()
+        self.analyze(records)
+
+    @classmethod
+    def from_file(cls,filename):
+        records,description = read_trace(filename)
+        return cls(records,description)
+
+    @classmethod
+    def from_tracer(cls,tracer):
+        return cls(tracer.records(),tracer.describe())
+
+    def analyze(self,records):
+        pending_adds = defaultdict(Counter)
+        first,last = None,None
+        add,remove = TOKEN_TYPES['add'],TOKEN_TYPES['remove']
+        for node,token_type,outcome,n_out,key,timestamp in records:
+            self.n_records += 1
+            self.tokens_in[node] += 1
+            self.tokens_out[node] += n_out
+            self.outcomes[node][outcome] += 1
+            if outcome==PASSED:
+                if token_type==add:
+                    self.passed_adds[node] += 1
+                    pending_adds[node][key] += 1
+                elif token_type==remove and pending_adds[node][key] > 0:
+                    pending_adds[node][key] -= 1
+                    self.cancelled[node] += 1
+            if first is None:
+                first = timestamp
+            last = timestamp
+        if first is not None:
+            self.time_span = (last - first)*1e-9
+        return self
+
+    # Per-node results
+    def fan_out(self):
+        return {self.ids[i]:self.tokens_out[i]/n for i,n in self.tokens_in.items()}
+
+    def cancellation_rates(self):
+        return {self.ids[i]:self.cancelled[i]/n for i,n in self.passed_adds.items()}
+
+    def node_summary(self):
+        fan_out = self.fan_out()
+        cancellation_rates = self.cancellation_rates()
+        summary = dict()
+        for i,n in self.tokens_in.items():
+            idx = self.ids[i]
+            summary[idx] = dict(
+                type=self.nodes[i]['type'],
+                label=self.nodes[i]['label'],
+                tokens_in=n,
+                tokens_out=self.tokens_out[i],
+                outcomes={OUTCOME_NAMES[k]:v for k,v in self.outcomes[i].items()},
+                fan_out=fan_out[idx],
+                cancellation_rate=cancellation_rates.get(idx,0.0),
+                )
+        return summary
+
+    # Per-pattern results
+    def hot_path(self,index):
+        # walks back from a node, picking the busiest predecessor at each step
+        path = [index]
+        visited = set(path)
+        while len(self.predecessors[path[-1]] - visited) > 0:
+            candidates = sorted(self.predecessors[path[-1]] - visited)
+            busiest = max(candidates,key=lambda x: self.tokens_in[x])
+            path.append(busiest)
+            visited.add(busiest)
+        return [self.ids[i] for i in reversed(path)]
+
+    def hot_paths(self):
+        return {pattern_id:self.hot_path(index) for pattern_id,index in self.patterns.items()}
+
+    def annotations(self):
+        summary = self.node_summary()
+        texts = dict()
+        for idx,d in summary.items():
+            texts[idx] = 'in={tokens_in} fanout={fan_out:.2f} cancel={cancellation_rate:.2f}'.format(**d)
+        return texts
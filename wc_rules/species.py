@@ -0,0 +1,100 @@
+from networkx import DiGraph, is_isomorphic
+from networkx.algorithms.isomorphism import categorical_node_match, categorical_edge_match
+from collections import Counter
+
+###### Canonical labels of complexes ######
+# A complex is given as a set of nodes and a set of (node1,attr1,attr2,node2) edges.
+# Nodes are labelled by class and semantic attributes (GraphMeta.semantic if given,
+# otherwise all non-empty scalar attributes), and edges by the attributes at each end.
+# The hash comes from color refinement (1-dimensional Weisfeiler-Lehman),
+# so isomorphic complexes always hash alike, but a few non-isomorphic ones may too.
+
+def semantic_attributes(node):
+    meta = getattr(node.__class__,'GraphMeta',None)
+    attrs = getattr(meta,'semantic',())
+    if len(attrs)==0 and hasattr(node,'get_nonempty_scalar_attributes'):
+        attrs = node.get_nonempty_scalar_attributes()
+    return tuple(sorted(attrs))
+
+def node_label(node):
+    return (node.__class__.__name__,) + tuple((attr,getattr(node,attr,None)) for attr in semantic_attributes(node))
+
+def neighborhoods(nodes,edges):
+    # node -> list of (own attr, other attr, other node)
+    neighbors = {node:[] for node in nodes}
+    for node1,attr1,attr2,node2 in edges:
+        neighbors[node1].append((attr1,attr2,node2))
+        neighbors[node2].append((attr2,attr1,node1))
+    return neighbors
+
+def canonical_hash(nodes,edges):
+    nodes = list(nodes)
+    neighbors = neighborhoods(nodes,edges)
+    labels = {node:hash(node_label(node)) for node in nodes}
+    n_colors = len(set(labels.values()))
+    for i in range(len(nodes)):
+        labels = {node:hash((labels[node],tuple(sorted((a1,a2,labels[x]) for a1,a2,x in neighbors[node])))) for node in nodes}
+        n = len(set(labels.values()))
+        if n==n_colors:
+            break
+        n_colors = n
+    return hash(tuple(sorted(labels.values())))
+
+def labelled_graph(nodes,edges):
+    # graph of labels only, so that later edits to the nodes do not change it
+    graph = DiGraph()
+    index = dict()
+    for i,node in enumerate(nodes):
+        index[node] = i
+        graph.add_node(i,label=node_label(node))
+    pairs = dict()
+    for node1,attr1,attr2,node2 in edges:
+        for u,v,a1,a2 in [(node1,node2,attr1,attr2),(node2,node1,attr2,attr1)]:
+            pairs.setdefault((index[u],index[v]),[]).append((a1,a2))
+    for (u,v),label in pairs.items():
+        graph.add_edge(u,v,label=tuple(sorted(label)))
+    return graph
+
+node_match = categorical_node_match('label',None)
+edge_match = categorical_edge_match('label',None)
+
+class SpeciesTable(object):
+    '''
+    Counts complexes by species (isomorphism class).
+
+    Complexes are bucketed by canonical_hash, and each bucket is split by an exact
+    isomorphism check against one representative graph per species,
+    so classifying a complex costs one hash plus, usually, one isomorphism check.
+    Species are identified by (hash, index in bucket).
+    '''
+    def __init__(self):
+        self.buckets = dict()
+        self.counts = Counter()
+
+    def classify(self,nodes,edges):
+        nodes = list(nodes)
+        key = canonical_hash(nodes,edges)
+        bucket = self.buckets.setdefault(key,[])
+        graph = labelled_graph(nodes,edges)
+        for i,representative in enumerate(bucket):
+            if is_isomorphic(representative,graph,node_match=node_match,edge_match=edge_match):
+                return (key,i)
+        bucket.append(graph)
+        return (key,len(bucket)-1)
+
+    def add(self,species):
+        self.counts[species] += 1
+        return self
+
+    def remove(self,species):
+        self.counts[species] -= 1
+        if self.counts[species]==0:
+            del self.counts[species]
+        return self
+
+    def get_representative(self,species):
+        key,i = species
+        return self.buckets[key][i]
+
+    def get_counts(self):
+        return dict(self.counts)
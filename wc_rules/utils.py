@@ -56,6 +56,10 @@ class SeqError(GenericError):
 
 class ParseExpressionError(GenericError):pass
 
+class TraceError(GenericError):pass
+
+class ReplayError(GenericError):pass
+
 class AddObjectError(Exception):
 
     def __init__(self, parentobject, currentobject, allowedobjects, methodname='add()'):